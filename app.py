@@ -1,131 +1,881 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, render_template, request, send_file, jsonify, redirect, Response, g
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlencode, quote
+import csv
+import hashlib
 import io
+import json
+import os
+import re
+import tempfile
+import time
+import zipfile
 import qr_generator
-from PIL import Image
+import qr_logo
+import qr_pdf
+import qr_preview
+import qr_metrics
+import qr_profile
+import qr_verify
+from qr_matrix import ECC_LEVELS, ECC_POLICY, choose_error_correction, export_matrix, matrix_cache
+from qr_raster import sprite_cache
+from qr_cache import OutputCache, make_cache_key
+from qr_logo import Logo, LogoRejected, LogoTooLarge, logo_store
+from qr_executor import RenderExecutor, RenderOverloaded, RenderTimeout
 
 app = Flask(__name__)
 
+# Bump when rendering changes so stale entries in the shared disk tier are not served
+RENDER_VERSION = 6
+
+# GET /qr.<fmt> URLs carry the render version, so their responses never change
+QR_GET_MAX_AGE = int(os.environ.get('QR_GET_MAX_AGE', 365 * 24 * 3600))
+
+# GET /matrix responses depend on the encoder (segmentation, mask choice), not
+# on the render version, so they are revalidated by ETag after this many seconds
+QR_MATRIX_MAX_AGE = int(os.environ.get('QR_MATRIX_MAX_AGE', 24 * 3600))
+
+# Largest accepted output edge in pixels; tiled rendering would otherwise accept
+# any size and a single request could keep a worker busy for minutes
+MAX_SIZE = int(os.environ.get('QR_MAX_SIZE', 12000))
+
+# Styles the renderers know; anything else renders as classic squares, so it is
+# normalized to 'classic' before it reaches cache keys and metric labels
+STYLES = ('rounded', 'circle', 'classic', 'gradient')
+
+OUTPUT_TYPES = {
+    'png': ('image/png', 'qrcode.png'),
+    'webp': ('image/webp', 'qrcode.webp'),
+    'tiff': ('image/tiff', 'qrcode.tiff'),
+    'svg': ('image/svg+xml', 'qrcode.svg'),
+}
+
+# Rendered output cache: in-process LRU plus an optional disk tier
+# shared by all workers on the host (disabled when QR_CACHE_DIR is empty)
+output_cache = OutputCache(
+    memory_items=int(os.environ.get('QR_CACHE_MEMORY_ITEMS', 256)),
+    memory_bytes=int(os.environ.get('QR_CACHE_MEMORY_MB', 64)) * 1024 * 1024,
+    disk_dir=os.environ.get('QR_CACHE_DIR') or None,
+    disk_bytes=int(os.environ.get('QR_CACHE_DISK_MB', 512)) * 1024 * 1024,
+)
+
+# Bounded render executor: cache misses are rendered here instead of on the
+# request thread; a full queue answers 429, a render past the timeout 503
+render_executor = RenderExecutor(
+    kind=os.environ.get('QR_RENDER_EXECUTOR', 'thread'),
+    workers=int(os.environ.get('QR_RENDER_WORKERS', 2)),
+    max_queue=int(os.environ.get('QR_RENDER_QUEUE', 8)),
+    timeout=float(os.environ.get('QR_RENDER_TIMEOUT', 10)),
+)
+RETRY_AFTER = os.environ.get('QR_RETRY_AFTER', '1')
+
+# Live previews get their own small executor: they never queue behind full
+# renders, but a burst of previews is still answered with 429/503
+preview_executor = RenderExecutor(
+    kind='thread',
+    workers=int(os.environ.get('QR_PREVIEW_WORKERS', 2)),
+    max_queue=int(os.environ.get('QR_PREVIEW_QUEUE', 4)),
+    timeout=float(os.environ.get('QR_PREVIEW_TIMEOUT', 2)),
+)
+
+# Batch rendering: worker processes, items per task and maximum items per request
+BATCH_WORKERS = int(os.environ.get('QR_BATCH_WORKERS', 0)) or os.cpu_count() or 1
+BATCH_CHUNK_SIZE = int(os.environ.get('QR_BATCH_CHUNK_SIZE', 16))
+BATCH_MAX_ITEMS = int(os.environ.get('QR_BATCH_MAX_ITEMS', 100000))
+
+# Prometheus metrics (GET /metrics). With QR_METRICS_DIR set, every worker
+# writes periodic snapshots there and /metrics sums them across workers.
+METRICS_ENABLED = os.environ.get('QR_METRICS', '1') != '0'
+metrics = qr_metrics.Registry(
+    directory=os.environ.get('QR_METRICS_DIR') or None,
+    flush_interval=float(os.environ.get('QR_METRICS_FLUSH_INTERVAL', 5)),
+)
+http_requests = metrics.counter('qr_http_requests_total', 'HTTP requests', ('endpoint', 'method', 'status'))
+http_seconds = metrics.histogram('qr_http_request_seconds', 'HTTP request latency', ('endpoint',))
+cache_lookups = metrics.counter('qr_cache_lookups_total', 'Cache lookups by result', ('cache', 'result'))
+cache_entries = metrics.gauge('qr_cache_entries', 'Entries held in each cache', ('cache',))
+renders_in_flight = metrics.gauge('qr_renders_in_flight', 'Renders running or queued in the executor')
+renders_rejected = metrics.counter('qr_renders_rejected_total', 'Renders rejected by the executor', ('reason',))
+if METRICS_ENABLED:
+    # Stage timings are recorded in this process, i.e. with the thread executor
+    qr_metrics.set_collector(qr_metrics.RenderMetrics(metrics))
+
+def _sync_runtime_metrics():
+    """Copy cumulative cache and executor counters into the registry before export."""
+    out = output_cache.stats()
+    cache_lookups.set_total(out['memory_hits'], 'output', 'memory_hit')
+    cache_lookups.set_total(out['disk_hits'], 'output', 'disk_hit')
+    cache_lookups.set_total(out['misses'], 'output', 'miss')
+    cache_entries.set(out['memory_items'], 'output')
+    for name, cache in (('matrix', matrix_cache), ('sprite', sprite_cache), ('logo', logo_store.cache),
+                        ('spec', qr_generator.spec_cache), ('layout', qr_generator.layout_cache)):
+        stats = cache.stats()
+        cache_lookups.set_total(stats['hits'], name, 'hit')
+        cache_lookups.set_total(stats['misses'], name, 'miss')
+        cache_entries.set(stats['size'], name)
+    executor = render_executor.stats()
+    renders_in_flight.set(executor['in_flight'])
+    renders_rejected.set_total(executor['rejected'], 'overloaded')
+    renders_rejected.set_total(executor['timeouts'], 'timeout')
+
+metrics.add_callback(_sync_runtime_metrics)
+
+# On-demand profiling: requests carrying QR_PROFILE_TOKEN in the X-QR-Profile
+# header and 1 in QR_PROFILE_SAMPLE renders are profiled; artifacts are kept in
+# QR_PROFILE_DIR and downloadable from /profiles/<id> with the same header.
+# The token is never read from the query string, which ends up in access logs.
+profile_policy = qr_profile.ProfilePolicy(
+    token=os.environ.get('QR_PROFILE_TOKEN') or None,
+    sample_every=int(os.environ.get('QR_PROFILE_SAMPLE', 0)),
+    mode=os.environ.get('QR_PROFILE_MODE', 'cprofile'),
+)
+PROFILE_INTERVAL = float(os.environ.get('QR_PROFILE_INTERVAL', 0.001))
+PROFILE_TOP = int(os.environ.get('QR_PROFILE_TOP', 15))
+_profile_store = None
+
+def get_profile_store():
+    global _profile_store
+    if _profile_store is None:
+        _profile_store = qr_profile.ProfileStore(
+            os.environ.get('QR_PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'qr-profiles'),
+            keep=int(os.environ.get('QR_PROFILE_KEEP', 500)),
+        )
+    return _profile_store
+
+_batch_pool = None
+
+def get_batch_pool():
+    global _batch_pool
+    if _batch_pool is None:
+        _batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    return _batch_pool
+
+class InvalidSize(ValueError):
+    """Requested output size outside 1..QR_MAX_SIZE."""
+
+def check_size(size):
+    if not 1 <= size <= MAX_SIZE:
+        raise InvalidSize(f"Invalid size {size} (must be between 1 and {MAX_SIZE})")
+    return size
+
+def normalize_params(data, style, color, bg_color, size, download_format,
+                     gradient_start, gradient_end, logo_bytes=None, gradient_type='vertical'):
+    """Canonical render parameters; equal dicts always render to identical bytes."""
+    check_size(size)
+    download_format = download_format if download_format in OUTPUT_TYPES else 'png'
+    if style == 'orange_circle' and download_format != 'svg':
+        style = 'circle'
+        color = "#FF5722"
+    elif style not in STYLES and style != 'orange_circle':
+        style = 'classic'
+
+    params = {
+        'v': RENDER_VERSION,
+        'data': data,
+        'style': style,
+        'color': color.upper(),
+        'bg_color': bg_color if bg_color == 'transparent' else bg_color.upper(),
+        'size': size,
+        'format': download_format,
+        'logo': hashlib.sha256(logo_bytes).hexdigest() if logo_bytes else None,
+    }
+    # Adjusted renders may carry a smaller logo than unchecked ones (see qr_verify)
+    if qr_verify.DEFAULT_MODE == 'adjust' and download_format != 'svg':
+        params['verify'] = 'adjust'
+    # A fixed error correction level yields different matrices than the logo-based default
+    if ECC_POLICY.lower() != 'auto':
+        params['ecc'] = ECC_POLICY.upper()
+    if style == 'gradient' and download_format != 'svg':
+        params['gradient_start'] = gradient_start.upper()
+        params['gradient_end'] = gradient_end.upper()
+        if gradient_type in qr_generator.GRADIENT_TYPES and gradient_type != 'vertical':
+            params['gradient_type'] = gradient_type
+    return params
+
+def load_logo(logo_bytes, digest=None):
+    """Content-addressed logo handle; decoding, resizing and masking are cached in qr_logo."""
+    if not logo_bytes:
+        return None
+    try:
+        return Logo.from_bytes(logo_bytes, digest)
+    except Exception as e:
+        print(f"Error loading logo: {e}")
+        return None
+
+def read_logo_upload(file):
+    """
+    Read an uploaded logo without buffering more than the byte limit.
+
+    Only the image header is parsed here, so oversized files, unknown formats and
+    decompression bombs are rejected (LogoRejected) before any pixel is decoded.
+    """
+    if not file or file.filename == '':
+        return None
+    logo_bytes = file.stream.read(qr_logo.MAX_BYTES + 1)
+    qr_logo.open_limited(logo_bytes)
+    return logo_bytes
+
+def render(params, logo_bytes=None):
+    """
+    Render normalized params to image or SVG bytes.
+
+    PNG/TIFF outputs above QR_TILE_PIXELS are rendered in strips and streamed
+    into the buffer (see qr_tiled), so print-size requests stay within a
+    bounded amount of memory. Raster outputs go through the scannability
+    self-check selected by QR_VERIFY; a render that fails it in reject/adjust
+    mode raises UnscannableRender (422).
+    """
+    logo_obj = load_logo(logo_bytes, params['logo'])
+    img_io = io.BytesIO()
+    size = params['size']
+
+    if params['format'] == 'svg':
+        # Generate SVG
+        qr_generator.generate_svg_qr_code(
+            data=params['data'],
+            output_file=img_io,
+            color=params['color'],
+            bg_color=params['bg_color'],
+            style=params['style'], # classic, rounded, circle
+            box_size=max(10, size // 25), # approximate box size for svg
+            logo_obj=logo_obj,
+            compact=True # single merged <path> instead of one element per module
+        )
+    elif params['style'] == 'gradient':
+        # Generate PNG
+        qr_generator.generate_gradient_qr(
+            data=params['data'],
+            output_file=img_io,
+            start_color=params['gradient_start'],
+            end_color=params['gradient_end'],
+            gradient=params.get('gradient_type', 'vertical'),
+            image_format=params['format'].upper(),
+            bg_color=params['bg_color'],
+            img_size=(size, size),
+            auto_adjust=True,
+            logo_obj=logo_obj
+        )
+    else:
+        qr_generator.generate_styled_qr_code(
+            data=params['data'],
+            output_file=img_io,
+            style=params['style'],
+            color=params['color'],
+            bg_color=params['bg_color'],
+            img_size=(size, size),
+            auto_adjust=True,
+            logo_obj=logo_obj,
+            image_format=params['format'].upper(),
+        )
+
+    return img_io.getvalue()
+
+def render_profiled(params, logo_bytes, mode, reason):
+    """Render under the profiler; the artifact id is exposed on the response via g."""
+    content, artifact, elapsed = render_executor.run(
+        qr_profile.run_profiled, mode, PROFILE_INTERVAL, render, params, logo_bytes)
+    profile_id = get_profile_store().save(mode, artifact)
+    g.profile_id = profile_id
+    print(f"[profile {profile_id}] {reason} style={params['style']} format={params['format']} "
+          f"size={params['size']} data_len={len(params['data'])} {elapsed * 1000:.1f} ms\n"
+          f"{qr_profile.summarize(mode, artifact, PROFILE_TOP)}", flush=True)
+    return content
+
+def render_cached(params, logo_bytes=None, profile_mode=None):
+    """
+    Render through the output cache, keyed by the normalized params.
+
+    profile_mode forces a profiled render that bypasses the cache lookup;
+    otherwise 1 in QR_PROFILE_SAMPLE cache misses is profiled.
+    """
+    key = make_cache_key(params)
+    content = None if profile_mode else output_cache.get(key)
+    if content is None:
+        if profile_mode:
+            content = render_profiled(params, logo_bytes, profile_mode, 'requested')
+        elif profile_policy.sampled():
+            content = render_profiled(params, logo_bytes, profile_policy.mode, 'sampled')
+        else:
+            content = render_executor.run(render, params, logo_bytes)
+        output_cache.put(key, content)
+    return content
+
+def requested_profile_mode():
+    """Profile mode asked for by an authenticated request, or None."""
+    if not profile_policy.requested(request.headers.get('X-QR-Profile')):
+        return None
+    mode = request.headers.get('X-QR-Profile-Mode') or request.args.get('profile_mode')
+    return mode if mode in qr_profile.PROFILE_MODES else profile_policy.mode
+
+def warm_up():
+    """Import-time heavy lifting before workers fork: prime the encoder, rasterizer and sprite cache."""
+    # Not counted in render metrics: every forked worker would inherit these samples
+    collector = qr_metrics.get_collector()
+    qr_metrics.set_collector(None)
+    try:
+        for style in ('rounded', 'circle', 'classic', 'gradient'):
+            render(normalize_params(data='https://example.com', style=style, color='#000000',
+                                    bg_color='#FFFFFF', size=350, download_format='png',
+                                    gradient_start='#1E88E5', gradient_end='#8BC34A'))
+    finally:
+        qr_metrics.set_collector(collector)
+
+def canonical_query(params):
+    """Canonical GET query items for normalized params (sorted keys, render version included)."""
+    query = {
+        'data': params['data'],
+        'style': params['style'],
+        'color': params['color'],
+        'bg': params['bg_color'],
+        'size': params['size'],
+        'v': params['v'],
+    }
+    if 'gradient_start' in params:
+        query['start'] = params['gradient_start']
+        query['end'] = params['gradient_end']
+        if 'gradient_type' in params:
+            query['gradient'] = params['gradient_type']
+    return [(k, str(v)) for k, v in sorted(query.items())]
+
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED:
+        metrics.start()
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        # Streaming responses (batch ZIP) are timed until the first byte
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_seconds.observe(time.perf_counter() - start, endpoint)
+        http_requests.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+@app.after_request
+def attach_profile_id(response):
+    profile_id = g.get('profile_id')
+    if profile_id:
+        response.headers['X-QR-Profile-Id'] = profile_id
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/generate', methods=['POST'])
-def generate():
-    # Content processing
-    content_type = request.form.get('content_type', 'url')
+def form_payload(form):
+    """QR payload text built from the web UI form fields ('' when empty)."""
+    content_type = form.get('content_type', 'url')
     data = ""
     
     if content_type == 'url':
-        data = request.form.get('url', '')
+        data = form.get('url', '')
         # Basic prefixing
         if data and not data.startswith(('http://', 'https://')):
             data = 'https://' + data
             
     elif content_type == 'wifi':
-        ssid = request.form.get('wifi_ssid', '')
-        password = request.form.get('wifi_password', '')
-        encryption = request.form.get('wifi_encryption', 'WPA')
-        hidden = request.form.get('wifi_hidden', 'false')
+        ssid = form.get('wifi_ssid', '')
+        password = form.get('wifi_password', '')
+        encryption = form.get('wifi_encryption', 'WPA')
+        hidden = form.get('wifi_hidden', 'false')
         data = f"WIFI:S:{ssid};T:{encryption};P:{password};H:{hidden};;"
         
     elif content_type == 'vcard':
-        name = request.form.get('vcard_name', '')
-        phone = request.form.get('vcard_phone', '')
-        email = request.form.get('vcard_email', '')
-        org = request.form.get('vcard_org', '')
+        name = form.get('vcard_name', '')
+        phone = form.get('vcard_phone', '')
+        email = form.get('vcard_email', '')
+        org = form.get('vcard_org', '')
         # Simple vCard 3.0 construction
         data = f"BEGIN:VCARD\nVERSION:3.0\nN:{name}\nFN:{name}\nORG:{org}\nTEL:{phone}\nEMAIL:{email}\nEND:VCARD"
         
     elif content_type == 'email':
-        email = request.form.get('email_address', '')
-        subject = request.form.get('email_subject', '')
-        body = request.form.get('email_body', '')
+        email = form.get('email_address', '')
+        subject = form.get('email_subject', '')
+        body = form.get('email_body', '')
         data = f"mailto:{email}?subject={subject}&body={body}"
         
     elif content_type == 'text':
-        data = request.form.get('text_content', '')
-
-    if not data:
-        return "Please enter valid content", 400
+        data = form.get('text_content', '')
+    return data
 
+def form_params(form, data, logo_bytes):
+    """Normalized render params for the web UI form (see normalize_params)."""
     # Styles and Colors
-    style = request.form.get('style', 'rounded')
-    bg_color_input = request.form.get('bg_color', '#FFFFFF')
-    fg_color_input = request.form.get('fg_color', '#000000')
-    is_transparent = request.form.get('transparent') == 'true'
+    style = form.get('style', 'rounded')
+    bg_color_input = form.get('bg_color', '#FFFFFF')
+    fg_color_input = form.get('fg_color', '#000000')
+    is_transparent = form.get('transparent') == 'true'
     
     bg_color = "transparent" if is_transparent else bg_color_input
     color = fg_color_input
 
     # Size
     try:
-        size = int(request.form.get('size', 350))
+        size = int(form.get('size', 350))
     except ValueError:
         size = 350
-        
+
+    return normalize_params(
+        data=data,
+        style=style,
+        color=color,
+        bg_color=bg_color,
+        size=size,
+        download_format=form.get('format', 'png'),
+        gradient_start=form.get('gradient_start', '#1E88E5'),
+        gradient_end=form.get('gradient_end', '#8BC34A'),
+        gradient_type=form.get('gradient_type', 'vertical'),
+        logo_bytes=logo_bytes,
+    )
+
+@app.route('/generate', methods=['POST'])
+def generate():
+    data = form_payload(request.form)
+    if not data:
+        return "Please enter valid content", 400
+
     # Logo Handling
-    logo_obj = None
-    if 'logo' in request.files:
-        file = request.files['logo']
-        if file and file.filename != '':
-            try:
-                logo_obj = Image.open(file.stream)
-            except Exception as e:
-                print(f"Error loading logo: {e}")
-
-    # Format
-    download_format = request.form.get('format', 'png')
-    
+    logo_bytes = read_logo_upload(request.files.get('logo'))
+    params = form_params(request.form, data, logo_bytes)
+
+    content = render_cached(params, logo_bytes, profile_mode=requested_profile_mode())
+
+    mimetype, download_name = OUTPUT_TYPES[params['format']]
+    return send_file(io.BytesIO(content), mimetype=mimetype, as_attachment=False, download_name=download_name)
+
+def render_preview(params, logo_bytes, module_px):
+    """Render normalized params as a low-resolution preview PNG (see qr_preview)."""
     img_io = io.BytesIO()
-    
-    if download_format == 'svg':
-        # Generate SVG
-        svg_content = qr_generator.generate_svg_qr_code(
-            data=data,
-            output_file=img_io,
-            color=color,
-            bg_color=bg_color,
-            style=style, # classic, rounded, circle
-            box_size=max(10, size // 25), # approximate box size for svg
-            logo_obj=logo_obj
-        )
-        img_io.seek(0)
-        return send_file(img_io, mimetype='image/svg+xml', as_attachment=False, download_name='qrcode.svg')
+    qr_preview.render_preview(
+        params['data'],
+        img_io,
+        style=params['style'],
+        color=params['color'],
+        bg_color=params['bg_color'],
+        start_color=params.get('gradient_start', '#1E88E5'),
+        end_color=params.get('gradient_end', '#8BC34A'),
+        gradient=params.get('gradient_type', 'vertical'),
+        logo_obj=load_logo(logo_bytes, params['logo']),
+        module_px=module_px,
+        ecc=params.get('ecc'),
+    )
+    return img_io.getvalue()
+
+@app.route('/preview', methods=['POST'])
+def preview():
+    """
+    Low-resolution live preview for the web UI (see qr_preview).
+
+    Takes the same form as /generate but renders at module-grid scale without
+    anti-aliasing, logo resampling or blur, in a few milliseconds once the
+    matrix is cached. Previews run on their own bounded executor rather than the
+    render executor, so they never queue behind full renders but still get
+    429/503 under load; downloads and the final image come from /generate.
+    """
+    data = form_payload(request.form)
+    if not data:
+        return "Please enter valid content", 400
+
+    logo_bytes = read_logo_upload(request.files.get('logo'))
+    params = form_params(request.form, data, logo_bytes)
+    content = preview_executor.run(render_preview, params, logo_bytes, request.form.get('module_px', type=int))
+    return Response(content, mimetype='image/png', headers={'Cache-Control': 'no-store'})
+
+@app.route('/qr.<fmt>')
+def qr_image(fmt):
+    """
+    Deterministic, cacheable GET endpoint.
+
+    All render parameters live in the query string (data, style, color, bg,
+    size, start, end). Non-canonical URLs redirect to the canonical one so
+    browsers and proxies see a single URL per code; the ETag is the render
+    cache key, so If-None-Match is answered with 304 without rendering.
+    """
+    if fmt not in OUTPUT_TYPES:
+        return "Unsupported format", 404
+
+    data = request.args.get('data', '')
+    if not data:
+        return "Please enter valid content", 400
+    try:
+        size = int(request.args.get('size', 350))
+    except ValueError:
+        return "Invalid size", 400
+
+    params = normalize_params(
+        data=data,
+        style=request.args.get('style', 'rounded'),
+        color=request.args.get('color', '#000000'),
+        bg_color=request.args.get('bg', '#FFFFFF'),
+        size=size,
+        download_format=fmt,
+        gradient_start=request.args.get('start', '#1E88E5'),
+        gradient_end=request.args.get('end', '#8BC34A'),
+        gradient_type=request.args.get('gradient', 'vertical'),
+    )
 
+    canonical = canonical_query(params)
+    if list(request.args.items(multi=True)) != canonical:
+        return redirect(f"/qr.{fmt}?" + urlencode(canonical, quote_via=quote), code=301)
+
+    key = make_cache_key(params)
+    headers = {
+        'ETag': f'"{key}"',
+        'Cache-Control': f'public, max-age={QR_GET_MAX_AGE}, immutable',
+    }
+    if request.if_none_match.contains(key):
+        return Response(status=304, headers=headers)
+
+    content = render_cached(params)
+    mimetype, _ = OUTPUT_TYPES[fmt]
+    return Response(content, mimetype=mimetype, headers=headers)
+
+@app.route('/matrix')
+def qr_matrix_json():
+    """
+    Encoded module matrix for client-side rendering (see qr_matrix.export_matrix).
+
+    Only the encoding step runs, and its result comes from the matrix cache:
+    modules are bit-packed row-major without the quiet zone and base64-encoded,
+    finder corners and alignment centres are listed so clients can style them.
+    Query: data (required), ecc (L/M/Q/H, default from QR_ECC), logo=1 to get
+    the level a logo render would use, roles=1 to add finder/alignment masks.
+    """
+    data = request.args.get('data', '')
+    if not data:
+        return "Please enter valid content", 400
+    try:
+        error_correction = choose_error_correction(request.args.get('logo') == '1',
+                                                   request.args.get('ecc') or None)
+    except ValueError:
+        return f"Unsupported ecc, expected auto or one of {', '.join(ECC_LEVELS)}", 400
+
+    body = json.dumps(export_matrix(data, error_correction, roles=request.args.get('roles') == '1'),
+                      separators=(',', ':'))
+    etag = hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': f'public, max-age={QR_MATRIX_MAX_AGE}',
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+def parse_batch_items(text):
+    """Parse CSV payloads: a 'data' column (plus optional 'name'), or data[,name] rows without a header."""
+    rows = [row for row in csv.reader(io.StringIO(text)) if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if 'data' in header:
+        data_col = header.index('data')
+        name_col = header.index('name') if 'name' in header else None
+        rows = rows[1:]
     else:
-        # Generate PNG
-        if style == 'gradient':
-            start_color = request.form.get('gradient_start', '#1E88E5')
-            end_color = request.form.get('gradient_end', '#8BC34A')
-            
-            qr_generator.generate_gradient_qr(
-                data=data,
-                output_file=img_io,
-                start_color=start_color,
-                end_color=end_color,
-                bg_color=bg_color,
-                img_size=(size, size),
-                auto_adjust=True,
-                logo_obj=logo_obj
-            )
-        else:
-            if style == 'orange_circle':
-                 style = 'circle'
-                 color = "#FF5722"
-                 
-            qr_generator.generate_styled_qr_code(
-                data=data,
-                output_file=img_io,
-                style=style,
-                color=color,
-                bg_color=bg_color,
-                img_size=(size, size),
-                auto_adjust=True,
-                logo_obj=logo_obj
-            )
-
-        img_io.seek(0)
-        return send_file(img_io, mimetype='image/png', as_attachment=False, download_name='qrcode.png')
+        data_col, name_col = 0, 1
+    items = []
+    for row in rows:
+        name = row[name_col] if name_col is not None and name_col < len(row) else None
+        items.append({'data': row[data_col] if data_col < len(row) else '', 'name': name})
+    return items
+
+def _json_scalar(value):
+    """String form of a JSON string or number; None for anything else."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+# JSON batch style fields that must be strings ('size' is checked separately)
+BATCH_STYLE_FIELDS = ('style', 'fg_color', 'bg_color', 'format', 'gradient_start', 'gradient_end',
+                      'gradient_type', 'template')
+
+def invalid_batch_style_fields(form):
+    """Names of JSON batch style fields with the wrong type (strings, 'transparent' also a bool)."""
+    bad = [field for field in BATCH_STYLE_FIELDS if field in form and not isinstance(form[field], str)]
+    if 'transparent' in form and not isinstance(form['transparent'], (bool, str)):
+        bad.append('transparent')
+    return bad
+
+def parse_batch_json_item(item):
+    """One JSON batch item: a string or number, or a {"data", "name"} object; bad items carry an 'error'."""
+    if isinstance(item, dict):
+        data = _json_scalar(item.get('data', ''))
+        name = item.get('name')
+        if data is not None and (name is None or _json_scalar(name) is not None):
+            return {'data': data, 'name': None if name is None else _json_scalar(name)}
+    else:
+        data = _json_scalar(item)
+        if data is not None:
+            return {'data': data, 'name': None}
+    return {'data': '', 'name': None,
+            'error': 'invalid item: expected a string, number or {"data", "name"} object'}
+
+def batch_entry_name(index, name, fmt, used):
+    """Safe, unique file name for a ZIP entry."""
+    stem = re.sub(r'[^\w.-]+', '_', os.path.basename(name or '')).strip('._')
+    stem = stem or f"{index + 1:06d}"
+    if stem.lower().endswith('.' + fmt):
+        stem = stem[:-len(fmt) - 1]
+    entry = f"{stem}.{fmt}"
+    if entry in used:
+        entry = f"{stem}-{index + 1}.{fmt}"
+    used.add(entry)
+    return entry
+
+def render_batch_chunk(chunk, logo_bytes):
+    """Worker-side: render (index, params) pairs, reporting failures instead of raising."""
+    results = []
+    for index, params in chunk:
+        try:
+            results.append((index, render(params, logo_bytes), None))
+        except Exception as e:
+            results.append((index, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def render_label_chunk(chunk, layout, options, logo_bytes):
+    """Worker-side: PDF label content for (index, data, caption) triples, None for failures."""
+    logo = load_logo(logo_bytes)
+    results = []
+    for index, data, caption in chunk:
+        try:
+            results.append((index, qr_pdf.render_label(data, caption, layout, logo=logo, **options), None))
+        except Exception as e:
+            results.append((index, None, f"{type(e).__name__}: {e}"))
+    return results
+
+class _ZipStream:
+    """Unseekable sink for zipfile and the PDF writer; drained as output is produced so it is never held in memory."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+def stream_batch_zip(items, spec, logo_bytes):
+    """Render items in parallel and yield ZIP bytes as entries finish, ending with report.json."""
+    out = _ZipStream()
+    used_names = set()
+    errors = []
+    succeeded = 0
+
+    pending_chunks = []
+    chunk = []
+    for index, item in enumerate(items):
+        if item.get('error'):
+            errors.append({'index': index, 'name': item['name'], 'error': item['error']})
+            continue
+        if not item['data']:
+            errors.append({'index': index, 'name': item['name'], 'error': 'empty payload'})
+            continue
+        chunk.append((index, normalize_params(data=item['data'], logo_bytes=logo_bytes, **spec)))
+        if len(chunk) == BATCH_CHUNK_SIZE:
+            pending_chunks.append(chunk)
+            chunk = []
+    if chunk:
+        pending_chunks.append(chunk)
+    pending_chunks.reverse()
+
+    pool = get_batch_pool()
+    window = 2 * BATCH_WORKERS
+    running = set()
+    try:
+        with zipfile.ZipFile(out, 'w') as zf:
+            while pending_chunks or running:
+                while pending_chunks and len(running) < window:
+                    running.add(pool.submit(render_batch_chunk, pending_chunks.pop(), logo_bytes))
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for index, content, error in future.result():
+                        name = items[index]['name']
+                        if error:
+                            errors.append({'index': index, 'name': name, 'error': error})
+                            continue
+                        entry = batch_entry_name(index, name, spec['download_format'], used_names)
+                        # PNG/WebP are already compressed
+                        compress = zipfile.ZIP_DEFLATED if spec['download_format'] == 'svg' else zipfile.ZIP_STORED
+                        zf.writestr(entry, content, compress_type=compress)
+                        succeeded += 1
+                        yield out.drain()
+
+            errors.sort(key=lambda e: e['index'])
+            report = {'total': len(items), 'succeeded': succeeded, 'failed': len(errors), 'errors': errors}
+            zf.writestr('report.json', json.dumps(report, ensure_ascii=False, indent=2))
+        yield out.drain()
+    finally:
+        # Client went away or rendering failed: drop work that has not started
+        for future in running:
+            future.cancel()
+
+def stream_batch_pdf(items, spec, logo_bytes, template):
+    """
+    Lay items out on label sheets and yield PDF bytes page by page.
+
+    Labels are rendered in the batch pool and placed in input order; item
+    names become captions. Failed or empty items are skipped and logged.
+    """
+    out = _ZipStream()
+    style = spec['style'] if spec['style'] in ('rounded', 'circle') else 'classic'
+    writer = qr_pdf.LabelSheetWriter(out, template, style=style, color=spec['color'], bg_color=spec['bg_color'])
+    logo = load_logo(logo_bytes)
+    entries = [(index, item['data'], item['name']) for index, item in enumerate(items) if item['data']]
+    chunks = [entries[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(entries), BATCH_CHUNK_SIZE)]
+    chunks.reverse()
+    failed = len(items) - len(entries)
+
+    pool = get_batch_pool()
+    window = 2 * BATCH_WORKERS
+    running = deque()
+    try:
+        while chunks or running:
+            while chunks and len(running) < window:
+                running.append(pool.submit(render_label_chunk, chunks.pop(), writer.layout, writer.options, logo_bytes))
+            # Oldest chunk first so labels keep their input order
+            for index, label, error in running.popleft().result():
+                if error:
+                    failed += 1
+                    print(f"Label {index + 1} failed: {error}")
+                    continue
+                writer.add_rendered(label, logo)
+            yield out.drain()
+        writer.close()
+        yield out.drain()
+        if failed:
+            print(f"Label batch: {writer.count} placed, {failed} skipped")
+    finally:
+        for future in running:
+            future.cancel()
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """
+    Render many payloads with one shared style and stream back a ZIP archive.
+
+    Accepts either JSON ({"items": [...], "style": {...}}, items being strings,
+    numbers or {"data", "name"} objects) or multipart form data with a CSV 'file' (or 'items'
+    text field) plus the same style fields and optional 'logo' as /generate.
+    Per-item failures are listed in report.json inside the archive.
+
+    With format=pdf the items are laid out on printable label sheets instead
+    ('template' selects the sheet, see qr_pdf.SHEET_TEMPLATES) and the PDF is
+    streamed page by page.
+    """
+    logo_bytes = None
+    if request.is_json:
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            return "Batch body must be a JSON object", 400
+        form = body.get('style') or {}
+        raw_items = body.get('items', [])
+        if not isinstance(form, dict) or not isinstance(raw_items, list):
+            return "'style' must be an object and 'items' a list", 400
+        # Style values reach normalize_params only while the response streams
+        bad_fields = invalid_batch_style_fields(form)
+        if bad_fields:
+            return f"Invalid style fields (expected strings): {', '.join(bad_fields)}", 400
+        items = [parse_batch_json_item(i) for i in raw_items]
+    else:
+        form = request.form
+        upload = request.files.get('file')
+        text = upload.read().decode('utf-8-sig') if upload else form.get('items', '')
+        items = parse_batch_items(text)
+        logo_bytes = read_logo_upload(request.files.get('logo'))
+
+    if not items:
+        return "No batch items", 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return f"Too many batch items (max {BATCH_MAX_ITEMS})", 413
+
+    try:
+        size = int(form.get('size', 350))
+    except (TypeError, ValueError):
+        size = 350
+    # Items are normalized while streaming, so reject a bad size before the response starts
+    check_size(size)
+    is_transparent = str(form.get('transparent', '')).lower() == 'true'
+    spec = {
+        'style': form.get('style', 'rounded'),
+        'color': form.get('fg_color', '#000000'),
+        'bg_color': "transparent" if is_transparent else form.get('bg_color', '#FFFFFF'),
+        'size': size,
+        'download_format': form.get('format', 'png'),
+        'gradient_start': form.get('gradient_start', '#1E88E5'),
+        'gradient_end': form.get('gradient_end', '#8BC34A'),
+        'gradient_type': form.get('gradient_type', 'vertical'),
+    }
+    if spec['download_format'] == 'pdf':
+        template = form.get('template', qr_pdf.DEFAULT_TEMPLATE)
+        if template not in qr_pdf.SHEET_TEMPLATES:
+            return f"Unknown label template (choose from {', '.join(qr_pdf.SHEET_TEMPLATES)})", 400
+        return Response(stream_batch_pdf(items, spec, logo_bytes, template), mimetype='application/pdf',
+                        headers={'Content-Disposition': 'attachment; filename=labels.pdf'})
+    if spec['download_format'] not in OUTPUT_TYPES:
+        spec['download_format'] = 'png'
+
+    return Response(stream_batch_zip(items, spec, logo_bytes), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename=qrcodes.zip'})
+
+@app.errorhandler(InvalidSize)
+def invalid_size(e):
+    return Response(str(e), status=400)
+
+@app.errorhandler(LogoTooLarge)
+def logo_too_large(e):
+    return Response(str(e), status=413)
+
+@app.errorhandler(LogoRejected)
+def logo_rejected(e):
+    return Response(str(e), status=400)
+
+@app.errorhandler(qr_verify.UnscannableRender)
+def unscannable_render(e):
+    return Response(str(e), status=422)
+
+@app.errorhandler(RenderOverloaded)
+def render_overloaded(e):
+    return Response("Server busy, please retry", status=429, headers={'Retry-After': RETRY_AFTER})
+
+@app.errorhandler(RenderTimeout)
+def render_timeout(e):
+    return Response("Render timed out, please retry", status=503, headers={'Retry-After': RETRY_AFTER})
+
+@app.route('/cache/stats')
+def cache_stats():
+    stats = output_cache.stats()
+    stats['logo'] = logo_store.stats()
+    stats['executor'] = render_executor.stats()
+    stats['preview_executor'] = preview_executor.stats()
+    return jsonify(stats)
+
+@app.route('/profiles/<profile_id>')
+def download_profile(profile_id):
+    """Profile artifact download (.prof for pstats/snakeviz, .folded for flame graphs)."""
+    if not profile_policy.requested(request.headers.get('X-QR-Profile')):
+        return "Not found", 404
+    path = get_profile_store().path(profile_id)
+    if path is None:
+        return "Not found", 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=profile_id)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if not METRICS_ENABLED:
+        return "Metrics disabled", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8711)
@@ -0,0 +1,386 @@
+"""
+生成函数基准测试
+
+覆盖 generate_styled_qr_code（rounded/circle/classic）、generate_gradient_qr、
+generate_svg_qr_code（精简 svg 与逐元素 svg_verbose）和低分辨率预览 qr_preview.render_preview，
+按内容长度、输出尺寸、是否带 Logo 组合成用例，记录总耗时、各阶段耗时（矩阵编码 / 绘制 / Logo / 图片编码）
+和峰值内存，结果保存为 JSON。两种 SVG 都运行时另外列出同一内容下两者的大小和耗时对比。
+compare 子命令把两次结果逐用例比对，延迟回退超过阈值时以退出码 1 结束，便于在
+修改前后或 CI 中使用。
+
+    python bench_qr.py run -o baseline.json
+    python bench_qr.py run --quick --baseline baseline.json
+    python bench_qr.py compare baseline.json current.json --threshold 0.15
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import PIL
+import qrcode
+from PIL import Image
+
+import qr_encode
+import qr_generator
+import qr_logo
+import qr_matrix
+import qr_metrics
+import qr_preview
+import qr_raster
+
+# 内容：短链接到约 1 KB 的 vCard
+PAYLOADS = {
+    "url_short": "https://example.com/",
+    "url_long": "https://shop.example.com/products/item?id=1234567890&utm_source=newsletter"
+                "&utm_medium=email&utm_campaign=autumn_sale_2024&ref=qr",
+    "wifi": "WIFI:T:WPA;S:Example Guest Network 5G;P:correct-horse-battery-staple-42;H:false;;",
+    "vcard": "\n".join([
+        "BEGIN:VCARD",
+        "VERSION:3.0",
+        "N:Zhang;Wei;;Dr.;",
+        "FN:Dr. Wei Zhang",
+        "ORG:Example Technology Co.\\, Ltd.;Research and Development",
+        "TITLE:Principal Engineer",
+        "TEL;TYPE=WORK,VOICE:+86-10-5555-0100",
+        "TEL;TYPE=CELL,VOICE:+86-138-0000-0000",
+        "TEL;TYPE=WORK,FAX:+86-10-5555-0199",
+        "EMAIL;TYPE=WORK:wei.zhang@example.com",
+        "EMAIL;TYPE=HOME:wei.zhang.personal@example.org",
+        "ADR;TYPE=WORK:;Building 7\\, Floor 12;No. 88 Science Park Road;Haidian District;Beijing;100080;China",
+        "ADR;TYPE=HOME:;;Apartment 1203\\, Unit 2;Chaoyang District;Beijing;100020;China",
+        "URL:https://www.example.com/people/wei-zhang",
+        "URL;TYPE=BLOG:https://blog.example.org/wei",
+        "NOTE:Available Monday to Friday 9:00-18:00 CST. Please contact the assistant for meetings "
+        "outside these hours. Speaks Mandarin\\, English and some Japanese. Interested in image "
+        "processing\\, compilers and distributed systems.",
+        "BDAY:1985-04-12",
+        "REV:2024-01-01T00:00:00Z",
+        "END:VCARD",
+    ]),
+}
+
+SIZES = (350, 1000, 2000, 4000)
+GENERATORS = ("rounded", "circle", "classic", "gradient", "svg", "svg_verbose", "preview")
+STAGES = ("matrix", "render", "logo", "verify", "encode")
+
+# --quick 使用的子集
+QUICK_PAYLOADS = ("url_short", "vcard")
+QUICK_SIZES = (350, 1000)
+
+
+def make_logo():
+    """生成一个确定性的测试 Logo（400x400 带渐变的 PNG）"""
+    ramp = np.linspace(0, 255, 400, dtype=np.uint8)
+    rgb = np.dstack([np.tile(ramp, (400, 1)), np.tile(ramp[:, None], (1, 400)), np.full((400, 400), 160, np.uint8)])
+    buffer = io.BytesIO()
+    Image.fromarray(rgb, "RGB").save(buffer, format="PNG")
+    return qr_logo.Logo.from_bytes(buffer.getvalue())
+
+
+class _StageCollector:
+    """qr_metrics 收集器：累计一次生成中各阶段的耗时"""
+
+    def __init__(self):
+        self.times = dict.fromkeys(STAGES, 0.0)
+        self.matrix_size = None
+
+    def observe_stage(self, generator, stage, seconds):
+        self.times[stage] += seconds
+
+    def record_render(self, generator, style, fmt, modules):
+        self.matrix_size = modules
+
+    def record_verify(self, generator, outcome, usage):
+        pass
+
+
+def clear_caches(cold):
+    """每次运行前清空矩阵缓存（内容各不相同）；cold 时同时清空精灵图、Logo、渲染规格和画布布局缓存"""
+    qr_matrix.matrix_cache.clear()
+    if cold:
+        qr_raster.sprite_cache.clear()
+        qr_logo.logo_store.cache.clear()
+        qr_generator.spec_cache.clear()
+        qr_generator.layout_cache.clear()
+
+
+def run_case(generator, data, size, logo):
+    """运行一次生成，返回输出字节数"""
+    if generator in ("svg", "svg_verbose"):
+        svg = qr_generator.generate_svg_qr_code(data, style="rounded", logo_obj=logo, compact=generator == "svg")
+        return len(svg.encode("utf-8"))
+    output = io.BytesIO()
+    if generator == "preview":
+        qr_preview.render_preview(data, output, style="rounded", logo_obj=logo)
+    elif generator == "gradient":
+        qr_generator.generate_gradient_qr(data, output_file=output, img_size=(size, size), logo_obj=logo)
+    else:
+        qr_generator.generate_styled_qr_code(data, output_file=output, style=generator,
+                                             img_size=(size, size), logo_obj=logo)
+    return output.tell()
+
+
+def _read_status(*fields):
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in fields:
+                values[name] = int(rest.split()[0]) * 1024
+    return values
+
+
+def measure_peak_memory(fn):
+    """
+    测量 fn() 运行期间的峰值内存增量（字节）
+
+    Linux 上通过 /proc/self/clear_refs 重置 VmHWM，统计包括 Pillow 在内的全部分配；
+    其他平台退回 tracemalloc，只统计 Python 和 NumPy 的分配。
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        before = _read_status("VmRSS")["VmRSS"]
+    except OSError:
+        tracemalloc.start()
+        try:
+            fn()
+            return tracemalloc.get_traced_memory()[1], "tracemalloc"
+        finally:
+            tracemalloc.stop()
+    fn()
+    return max(0, _read_status("VmHWM")["VmHWM"] - before), "rss"
+
+
+def _memory_probe(generator, payload, size, with_logo):
+    """在新进程中测量单次生成的峰值内存，打印 JSON"""
+    logo = make_logo() if with_logo else None
+    peak, method = measure_peak_memory(lambda: run_case(generator, PAYLOADS[payload], size, logo))
+    print(json.dumps({"peak": peak, "method": method}))
+
+
+def peak_memory(generator, payload, size, with_logo):
+    """
+    启动一个新的解释器测量峰值内存
+
+    同一进程内重复运行时，前几次释放的内存会被 malloc 和 Pillow 的内存池复用，
+    峰值增量会被低估，因此每个用例单独起一个进程。
+    """
+    argv = [sys.executable, os.path.abspath(__file__), "_memory", generator, payload,
+            str(size or 0), "1" if with_logo else "0"]
+    result = subprocess.run(argv, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return probe["peak"], probe["method"]
+
+
+def build_cases(args):
+    payloads = args.payloads or (QUICK_PAYLOADS if args.quick else tuple(PAYLOADS))
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    logos = {"both": (False, True), "with": (True,), "without": (False,)}[args.logo]
+    for generator, payload, logo in itertools.product(args.generators, payloads, logos):
+        # SVG 的尺寸由 box_size 决定，预览按模块网格渲染，都不随输出尺寸变化
+        for size in (None,) if generator in ("svg", "svg_verbose", "preview") else sizes:
+            yield generator, payload, size, logo
+
+
+def case_id(generator, payload, size, logo):
+    return f"{generator}/{payload}/{size or '-'}/{'logo' if logo else 'nologo'}"
+
+
+def run_benchmarks(args):
+    logo_obj = make_logo()
+    results = []
+    for generator, payload, size, with_logo in build_cases(args):
+        data = PAYLOADS[payload]
+        logo = logo_obj if with_logo else None
+        run_case(generator, data, size, logo)  # 预热
+
+        totals = []
+        stage_samples = {stage: [] for stage in STAGES}
+        timer = None
+        for _ in range(args.repeat):
+            clear_caches(args.cold)
+            timer = _StageCollector()
+            qr_metrics.set_collector(timer)
+            try:
+                start = time.perf_counter()
+                output_bytes = run_case(generator, data, size, logo)
+                total = time.perf_counter() - start
+            finally:
+                qr_metrics.set_collector(None)
+            totals.append(total)
+            for stage in STAGES:
+                stage_samples[stage].append(timer.times[stage])
+
+        entry = {
+            "id": case_id(generator, payload, size, with_logo),
+            "generator": generator,
+            "payload": payload,
+            "payload_chars": len(data),
+            "size": size,
+            "logo": with_logo,
+            "matrix_modules": timer.matrix_size,
+            "output_bytes": output_bytes,
+            "total_ms": {
+                "median": float(np.median(totals)) * 1000,
+                "min": float(np.min(totals)) * 1000,
+                "p90": float(np.percentile(totals, 90)) * 1000,
+            },
+            "stages_ms": {stage: float(np.median(stage_samples[stage])) * 1000 for stage in STAGES},
+        }
+        if not args.no_memory:
+            peak, method = peak_memory(generator, payload, size, with_logo)
+            entry["peak_memory_mb"] = peak / (1024 * 1024)
+            entry["memory_method"] = method
+        results.append(entry)
+        print(_format_entry(entry), flush=True)
+    return results
+
+
+def _format_entry(entry):
+    stages = " ".join(f"{stage} {entry['stages_ms'][stage]:6.1f}" for stage in STAGES)
+    memory = f"  峰值 {entry['peak_memory_mb']:6.1f} MB" if "peak_memory_mb" in entry else ""
+    return (f"{entry['id']:<36} {entry['total_ms']['median']:8.1f} ms  [{stages}]"
+            f"  {entry['matrix_modules']} 模块  {entry['output_bytes'] / 1024:7.1f} KB{memory}")
+
+
+def print_svg_comparison(results):
+    """同一内容下逐元素 SVG 与精简 SVG 的输出大小和中位耗时"""
+    verbose = {(e["payload"], e["logo"]): e for e in results if e["generator"] == "svg_verbose"}
+    rows = [(verbose[(e["payload"], e["logo"])], e) for e in results
+            if e["generator"] == "svg" and (e["payload"], e["logo"]) in verbose]
+    if not rows:
+        return
+    print("\nSVG 逐元素 → 精简（rounded）:")
+    for old, new in rows:
+        label = f"{new['payload']}/{'logo' if new['logo'] else 'nologo'}"
+        print(f"  {label:<20} {old['output_bytes'] / 1024:8.1f} KB {old['total_ms']['median']:7.1f} ms"
+              f"  →  {new['output_bytes'] / 1024:8.1f} KB {new['total_ms']['median']:7.1f} ms"
+              f"  （大小 {new['output_bytes'] / old['output_bytes']:.0%}，"
+              f"耗时 {new['total_ms']['median'] / old['total_ms']['median']:.0%}）")
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "qrcode": getattr(qrcode, "__version__", None),
+        "render_engine": qr_generator.RENDER_ENGINE,
+        "encode_preset": qr_encode.DEFAULT_PRESET,
+        "ecc_policy": qr_matrix.ECC_POLICY,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare_results(baseline, current, threshold, min_delta_ms, memory_threshold=None):
+    """
+    逐用例比较两次结果的中位延迟
+
+    只有同时超过相对阈值和绝对阈值（避免亚毫秒用例的噪声）才算回退。
+    矩阵边长（模块数）变化时一并列出。返回回退的用例 id 列表。
+    """
+    base = {entry["id"]: entry for entry in baseline["results"]}
+    regressions = []
+    for entry in current["results"]:
+        old = base.get(entry["id"])
+        if old is None:
+            continue
+        before = old["total_ms"]["median"]
+        after = entry["total_ms"]["median"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold and after - before > min_delta_ms:
+            flag = "  <-- 延迟回退"
+            regressions.append(entry["id"])
+        if memory_threshold is not None and "peak_memory_mb" in entry and "peak_memory_mb" in old:
+            mem_before, mem_after = old["peak_memory_mb"], entry["peak_memory_mb"]
+            if mem_before and (mem_after - mem_before) / mem_before > memory_threshold and mem_after - mem_before > 1:
+                flag += "  <-- 内存回退"
+                if entry["id"] not in regressions:
+                    regressions.append(entry["id"])
+        modules = ""
+        if old.get("matrix_modules") != entry.get("matrix_modules"):
+            modules = f"  {old.get('matrix_modules')} -> {entry.get('matrix_modules')} 模块"
+        print(f"{entry['id']:<36} {before:8.1f} -> {after:8.1f} ms ({change:+6.1%}){modules}{flag}")
+
+    missing = sorted(set(base) - {entry["id"] for entry in current["results"]})
+    if missing:
+        print(f"基准中有 {len(missing)} 个用例未在本次运行: {', '.join(missing[:5])}"
+              f"{' ...' if len(missing) > 5 else ''}")
+    if regressions:
+        print(f"{len(regressions)} 个用例回退（延迟阈值 {threshold:.0%} 且超过 {min_delta_ms} ms）")
+    else:
+        print("没有发现回退")
+    return regressions
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["_memory"]:
+        generator, payload, size, with_logo = argv[1:5]
+        _memory_probe(generator, payload, int(size) or None, with_logo == "1")
+        return 0
+
+    parser = argparse.ArgumentParser(description="二维码生成函数基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="运行基准测试")
+    run.add_argument("-o", "--output", help="结果 JSON 路径")
+    run.add_argument("--generators", nargs="+", default=GENERATORS, choices=GENERATORS)
+    run.add_argument("--payloads", nargs="+", choices=tuple(PAYLOADS))
+    run.add_argument("--sizes", nargs="+", type=int)
+    run.add_argument("--logo", default="both", choices=("both", "with", "without"))
+    run.add_argument("--quick", action="store_true", help="只运行较小的用例子集")
+    run.add_argument("--repeat", type=int, default=5, help="每个用例的重复次数（取中位数）")
+    run.add_argument("--cold", action="store_true", help="每次运行前同时清空精灵图、Logo、渲染规格和画布布局缓存")
+    run.add_argument("--no-memory", action="store_true", help="跳过峰值内存测量")
+    run.add_argument("--baseline", help="运行后与该基准结果比较")
+
+    compare = sub.add_parser("compare", help="比较两次结果")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+
+    for p in (run, compare):
+        p.add_argument("--threshold", type=float, default=0.15, help="允许的相对延迟增长（默认 15%%）")
+        p.add_argument("--min-delta-ms", type=float, default=1.0, help="忽略小于该值的绝对增长")
+        p.add_argument("--memory-threshold", type=float, help="允许的相对峰值内存增长，不设置时不检查")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        regressions = compare_results(_load(args.baseline), _load(args.current),
+                                      args.threshold, args.min_delta_ms, args.memory_threshold)
+        return 1 if regressions else 0
+
+    report = {"environment": environment(), "repeat": args.repeat, "cold": args.cold,
+              "results": run_benchmarks(args)}
+    print_svg_comparison(report["results"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+    if args.baseline:
+        regressions = compare_results(_load(args.baseline), report,
+                                      args.threshold, args.min_delta_ms, args.memory_threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
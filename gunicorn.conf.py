@@ -0,0 +1,40 @@
+"""
+Production server settings: gunicorn -c gunicorn.conf.py app:app
+
+Everything is driven by environment variables so the same image works under
+docker-compose and on bare hosts.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8711')}"
+
+# Web worker processes, each with a few threads for I/O; rendering inside a
+# worker goes through the bounded executor in app.py (QR_RENDER_* variables)
+workers = int(os.environ.get('QR_WEB_WORKERS', 0)) or multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = int(os.environ.get('QR_WEB_THREADS', 4))
+
+# Import the app (numpy, Pillow, qrcode) once in the master and share it copy-on-write
+preload_app = True
+
+timeout = int(os.environ.get('QR_WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound long-term memory growth
+max_requests = int(os.environ.get('QR_WEB_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('QR_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Runs in the master after the preloaded import: render once so every
+    # forked worker starts with warm code paths and sprite cache
+    import app
+    import qr_metrics
+    qr_metrics.clear_directory(app.metrics.directory)
+    app.warm_up()
@@ -0,0 +1,548 @@
+"""
+网页服务压力测试
+
+bench_qr.py 只测量生成函数本身；这里在本机启动服务（gunicorn 或 Flask 开发服务器），
+用多个并发连接向 POST /generate 发送表单，覆盖表单解析、Logo 上传、渲染执行器、
+输出缓存和 send_file 的完整路径。请求按可配置的比例混合内容类型、样式、尺寸、格式
+和 Logo，全部由随机种子确定：同一种子、同一配置产生完全相同的请求序列，不需要网络。
+
+输出吞吐量、p50/p95/p99 延迟、按状态码分类的错误率，以及按时间间隔采样的服务端
+内存（进程树的 RSS 与 PSS 之和），结果可保存为 JSON，用于估算部署规模。
+
+    python load_test.py --start gunicorn -c 16 -d 60 -o load.json
+    python load_test.py --start gunicorn --env QR_WEB_WORKERS=4 --mix mix.json --seed 7
+    python load_test.py --url http://127.0.0.1:8711 --server-pid 1234 -n 2000 --rate 50
+
+--mix 指定的 JSON 与 DEFAULT_MIX 按键合并，例如 {"format": {"png": 1}, "repeat": 0.5}。
+"""
+import argparse
+import bisect
+import http.client
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import signal
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# 各维度的权重；repeat 是重复发送之前某个请求（命中输出缓存）的概率
+DEFAULT_MIX = {
+    "content_type": {"url": 50, "text": 15, "wifi": 15, "vcard": 10, "email": 10},
+    "style": {"rounded": 40, "circle": 20, "classic": 20, "gradient": 15, "orange_circle": 5},
+    "gradient_type": {"vertical": 70, "radial": 15, "horizontal": 10, "diagonal": 5},
+    "size": {"350": 70, "600": 20, "1000": 8, "2000": 2},
+    "format": {"png": 70, "webp": 10, "svg": 20},
+    "logo": {"none": 80, "small": 12, "photo": 5, "unique": 3},
+    "transparent": {"false": 95, "true": 5},
+    "repeat": 0.2,
+}
+
+# 生成内容用的词表与配色
+WORDS = ("qr", "code", "shop", "event", "menu", "ticket", "coupon", "order", "guest", "table",
+         "二维码", "活动", "菜单", "优惠券", "订单", "会员")
+FG_COLORS = ("#000000", "#1A237E", "#004D40", "#3E2723", "#B71C1C", "#4A148C", "#263238")
+BG_COLORS = ("#FFFFFF", "#FFFFFF", "#FFFFFF", "#FFF8E1", "#E3F2FD", "#F1F8E9")
+
+# 输出格式的文件头，用于校验响应内容
+MAGIC = {
+    "png": (b"\x89PNG",),
+    "webp": (b"RIFF",),
+    "svg": (b"<?xml", b"<svg"),
+}
+
+# 同时重复利用的历史请求数上限
+REPEAT_POOL = 1000
+
+MULTIPART_BOUNDARY = "----qr-load-test-7f3a9c1e"
+
+
+def load_mix(path=None):
+    mix = json.loads(json.dumps(DEFAULT_MIX))
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for key, value in json.load(f).items():
+                if key not in DEFAULT_MIX:
+                    raise ValueError(f"未知的混合维度: {key}")
+                mix[key] = value
+    return mix
+
+
+class _Choice:
+    """按权重抽样"""
+
+    def __init__(self, weights):
+        self.values = list(weights)
+        self.cumulative = list(itertools.accumulate(float(w) for w in weights.values()))
+        if not self.cumulative or self.cumulative[-1] <= 0:
+            raise ValueError(f"权重之和必须为正: {weights}")
+
+    def __call__(self, rng):
+        return self.values[bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+def _word(rng):
+    return rng.choice(WORDS)
+
+
+def _token(rng, length):
+    return "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+
+def _content_fields(content_type, rng):
+    """各内容类型的表单字段，长度分布大致覆盖短链接到较长的文本"""
+    if content_type == "url":
+        path = "/".join(_token(rng, rng.randint(3, 10)) for _ in range(rng.randint(1, 4)))
+        url = f"{_word(rng)}.example.com/{path}?id={rng.randint(1, 10 ** 9)}"
+        if rng.random() < 0.2:
+            url += "&utm_source=" + _token(rng, rng.randint(10, 60))
+        # 部分不带协议，由服务端补全
+        return {"url": url if rng.random() < 0.3 else "https://" + url}
+    if content_type == "wifi":
+        return {
+            "wifi_ssid": f"{_word(rng)}-{_token(rng, rng.randint(2, 12))}",
+            "wifi_password": _token(rng, rng.randint(8, 40)),
+            "wifi_encryption": rng.choice(("WPA", "WPA", "WEP", "nopass")),
+            "wifi_hidden": rng.choice(("false", "false", "true")),
+        }
+    if content_type == "vcard":
+        return {
+            "vcard_name": f"{_token(rng, rng.randint(3, 10))} {_token(rng, rng.randint(3, 12))}",
+            "vcard_phone": "+86-" + "".join(rng.choice(string.digits) for _ in range(11)),
+            "vcard_email": f"{_token(rng, 8).lower()}@example.com",
+            "vcard_org": " ".join(_word(rng) for _ in range(rng.randint(1, 6))),
+        }
+    if content_type == "email":
+        return {
+            "email_address": f"{_token(rng, 8).lower()}@example.org",
+            "email_subject": " ".join(_word(rng) for _ in range(rng.randint(1, 8))),
+            "email_body": " ".join(_word(rng) for _ in range(rng.randint(0, 40))),
+        }
+    return {"text_content": " ".join(_word(rng) for _ in range(rng.randint(1, 80)))}
+
+
+def make_logos(seed):
+    """
+    离线生成 Logo：small 为 256px 带透明度的 PNG，photo 为 2400x1600 的 JPEG
+    （走缩小解码路径），unique 在每个请求中按序号另外生成
+    """
+    rng = np.random.default_rng(seed)
+    small = Image.new("RGBA", (256, 256), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(small)
+    for _ in range(12):
+        x0, y0 = rng.integers(0, 200, 2)
+        size = int(rng.integers(20, 120))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3)) + (255,)
+        draw.ellipse((int(x0), int(y0), int(x0) + size, int(y0) + size), fill=color)
+    # 平滑的渐变加少量噪声，体积接近真实照片
+    yy, xx = np.mgrid[0:1600, 0:2400]
+    photo = np.stack([xx * 255 // 2400, yy * 255 // 1600, (xx + yy) * 255 // 4000], axis=-1)
+    photo = (photo + rng.integers(0, 24, photo.shape)).clip(0, 255).astype(np.uint8)
+    return {"small": _encode_image(small, "PNG"), "photo": _encode_image(Image.fromarray(photo), "JPEG")}
+
+
+def _encode_image(image, fmt):
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, **({"quality": 85} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+def _unique_logo(index):
+    rng = random.Random(index)
+    image = Image.new("RGB", (160, 160), tuple(rng.randrange(256) for _ in range(3)))
+    ImageDraw.Draw(image).rectangle((40, 40, 120, 120), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return _encode_image(image, "PNG")
+
+
+class RequestPlan:
+    """
+    确定性的请求序列：第 i 个请求只取决于种子、配置和 i 之前的请求
+
+    next() 在锁内按序号顺序生成，并发线程的调度不影响序列本身。
+    """
+
+    def __init__(self, mix, seed, logos):
+        self.rng = random.Random(seed)
+        self.choices = {key: _Choice(value) for key, value in mix.items() if key != "repeat"}
+        self.repeat = float(mix.get("repeat", 0))
+        self.logos = logos
+        self.history = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def _new(self, index):
+        rng = self.rng
+        pick = {key: choice(rng) for key, choice in self.choices.items()}
+        fields = {"content_type": pick["content_type"]}
+        fields.update(_content_fields(pick["content_type"], rng))
+        fields.update({
+            "style": pick["style"],
+            "size": pick["size"],
+            "format": pick["format"],
+            "fg_color": rng.choice(FG_COLORS),
+            "bg_color": rng.choice(BG_COLORS),
+        })
+        if pick["transparent"] == "true":
+            fields["transparent"] = "true"
+        if pick["style"] == "gradient":
+            fields["gradient_start"] = rng.choice(FG_COLORS)
+            fields["gradient_end"] = rng.choice(FG_COLORS)
+            fields["gradient_type"] = pick["gradient_type"]
+        return {"fields": fields, "logo": pick["logo"], "logo_seed": index}
+
+    def next(self):
+        with self.lock:
+            index = next(self.counter)
+            if self.history and self.rng.random() < self.repeat:
+                spec = self.rng.choice(self.history)
+            else:
+                spec = self._new(index)
+                if len(self.history) < REPEAT_POOL:
+                    self.history.append(spec)
+                else:
+                    self.history[self.rng.randrange(REPEAT_POOL)] = spec
+            return index, spec
+
+    def logo_bytes(self, spec):
+        if spec["logo"] == "none":
+            return None
+        if spec["logo"] == "unique":
+            return _unique_logo(spec["logo_seed"])
+        return self.logos[spec["logo"]]
+
+
+def encode_multipart(fields, logo):
+    """multipart/form-data 请求体"""
+    boundary = MULTIPART_BOUNDARY
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                     .encode("utf-8"))
+    if logo is not None:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="logo"; filename="logo"\r\n'
+                     f"Content-Type: application/octet-stream\r\n\r\n".encode("utf-8") + logo + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def category(spec):
+    fields = spec["fields"]
+    logo = "logo" if spec["logo"] != "none" else "nologo"
+    return f"{fields['style']}/{fields['format']}/{fields['size']}/{logo}"
+
+
+# 服务端进程与内存
+
+def start_server(kind, port, env_overrides, log_file):
+    env = dict(os.environ, PORT=str(port), **env_overrides)
+    here = os.path.dirname(os.path.abspath(__file__))
+    if kind == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    else:
+        cmd = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"]
+    return subprocess.Popen(cmd, cwd=here, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+
+def wait_ready(host, port, process=None, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"服务进程已退出，退出码 {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/cache/stats")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("等待服务启动超时")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree(root):
+    """root 及其全部子孙进程的 pid（读取 /proc）"""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                # 第 4 个字段是父进程，进程名可能含空格，从最后一个 ')' 之后解析
+                ppid = int(f.read().rsplit(b")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    pids, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, ()))
+    return pids
+
+
+def _read_kb(path, key):
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def server_memory(root):
+    """进程树的 (进程数, RSS MB, PSS MB)；预加载的 gunicorn 工作进程共享内存，PSS 更接近实际占用"""
+    pids = process_tree(root)
+    rss = sum(_read_kb(f"/proc/{pid}/status", "VmRSS:") for pid in pids)
+    pss = sum(_read_kb(f"/proc/{pid}/smaps_rollup", "Pss:") for pid in pids)
+    return len(pids), rss / 1024, pss / 1024
+
+
+# 负载
+
+class Recorder:
+    """记录每个请求的完成时间、延迟、状态和类别"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+
+    def add(self, finished, latency, status, cat, size):
+        with self.lock:
+            self.records.append((finished, latency, status, cat, size))
+
+    def since(self, start):
+        with self.lock:
+            return self.records[start:], len(self.records)
+
+
+def _worker(host, port, plan, recorder, stop, limit, schedule, warmup, timeout):
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    while not stop.is_set():
+        index, spec = plan.next()
+        if limit is not None and index >= limit:
+            break
+        body, content_type = encode_multipart(spec["fields"], plan.logo_bytes(spec))
+        # 限定速率时按计划时间计算延迟，避免服务端变慢时少发请求而低估延迟
+        start = time.perf_counter()
+        if schedule is not None:
+            intended = schedule(index)
+            if intended > start:
+                time.sleep(intended - start)
+            start = intended
+        try:
+            conn.request("POST", "/generate", body, {"Content-Type": content_type})
+            response = conn.getresponse()
+            content = response.read()
+            status = response.status
+            if status == 200 and not content.startswith(MAGIC[spec["fields"]["format"]]):
+                status = "invalid"
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            content = b""
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        finished = time.perf_counter()
+        if index >= warmup:
+            recorder.add(finished, finished - start, status, category(spec), len(content))
+    conn.close()
+
+
+def _percentiles(latencies):
+    if not len(latencies):
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(np.max(latencies)) * 1000}
+
+
+def summarize(records, elapsed):
+    latencies = np.array([r[1] for r in records])
+    statuses = {}
+    for r in records:
+        statuses[str(r[2])] = statuses.get(str(r[2]), 0) + 1
+    ok = statuses.get("200", 0)
+    by_category = {}
+    for r in records:
+        by_category.setdefault(r[3], []).append(r[1])
+    return {
+        "requests": len(records),
+        "ok": ok,
+        "error_rate": (len(records) - ok) / len(records) if records else 0.0,
+        "statuses": statuses,
+        "throughput_rps": len(records) / elapsed if elapsed else 0.0,
+        "bytes_per_second": sum(r[4] for r in records) / elapsed if elapsed else 0.0,
+        "latency_ms": _percentiles(latencies),
+        "categories": {
+            cat: dict(count=len(values), **_percentiles(np.array(values)))
+            for cat, values in sorted(by_category.items(), key=lambda item: -len(item[1]))
+        },
+    }
+
+
+def _ms(value):
+    return "   -   " if value is None else f"{value:7.1f}"
+
+
+def run(args):
+    mix = load_mix(args.mix)
+    logos = make_logos(args.seed)
+    plan = RequestPlan(mix, args.seed, logos)
+
+    process = log_file = None
+    if args.start:
+        host, port = "127.0.0.1", args.port or _free_port()
+        log_file = open(args.server_log, "wb") if args.server_log else tempfile.TemporaryFile()
+        env = dict(item.split("=", 1) for item in args.env)
+        process = start_server(args.start, port, env, log_file)
+        server_pid = process.pid
+    else:
+        parsed = urllib.parse.urlsplit(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+        server_pid = args.server_pid
+
+    try:
+        wait_ready(host, port, process)
+        limit = None if args.requests is None else args.requests + args.warmup
+        recorder = Recorder()
+        stop = threading.Event()
+        begin = time.perf_counter()
+        schedule = None
+        if args.rate:
+            schedule = lambda index: begin + index / args.rate
+        threads = [
+            threading.Thread(target=_worker, daemon=True,
+                             args=(host, port, plan, recorder, stop, limit, schedule, args.warmup, args.timeout))
+            for _ in range(args.concurrency)
+        ]
+        cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        for thread in threads:
+            thread.start()
+
+        series = []
+        seen = 0
+        deadline = None if args.requests is not None else begin + args.duration
+        print(f"{'时间':>6} {'请求/秒':>8} {'p50':>7} {'p99':>7} {'错误':>5} {'进程':>4} {'RSS MB':>8} {'PSS MB':>8}",
+              flush=True)
+        tick = last = begin
+        while any(thread.is_alive() for thread in threads):
+            tick += args.interval
+            while time.perf_counter() < tick and any(thread.is_alive() for thread in threads):
+                time.sleep(0.02)
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                stop.set()
+            new, seen = recorder.since(seen)
+            point = {"t": now - begin, "requests": len(new), "rps": len(new) / (now - last),
+                     "errors": sum(1 for r in new if r[2] != 200)}
+            point.update((k, v) for k, v in _percentiles(np.array([r[1] for r in new])).items() if k != "max")
+            last = now
+            if server_pid:
+                point["processes"], point["rss_mb"], point["pss_mb"] = server_memory(server_pid)
+            series.append(point)
+            print(f"{point['t']:6.1f} {point['rps']:8.1f} {_ms(point['p50'])} {_ms(point['p99'])} "
+                  f"{point['errors']:5d} {point.get('processes', 0):4d} {point.get('rss_mb', 0):8.1f} "
+                  f"{point.get('pss_mb', 0):8.1f}", flush=True)
+        records, _ = recorder.since(0)
+        # 以最后一个请求完成的时间为准，不计采样循环的等待
+        elapsed = (max(r[0] for r in records) if records else time.perf_counter()) - begin
+        cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    finally:
+        if process is not None:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+        if log_file is not None:
+            log_file.close()
+
+    summary = summarize(records, elapsed)
+    client_cpu = (cpu_end.ru_utime + cpu_end.ru_stime) - (cpu_start.ru_utime + cpu_start.ru_stime)
+    summary["client_cpu_share"] = client_cpu / elapsed if elapsed else 0.0
+    memory = [p for p in series if "rss_mb" in p]
+    if memory:
+        summary["server_rss_mb_peak"] = max(p["rss_mb"] for p in memory)
+        summary["server_pss_mb_peak"] = max(p["pss_mb"] for p in memory)
+    print_summary(summary, args.top)
+
+    if args.output:
+        report = {
+            "config": vars(args),
+            "mix": mix,
+            "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpu_count": os.cpu_count(),
+                            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+            "summary": summary,
+            "series": series,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到 {args.output}")
+    return 1 if summary["requests"] == 0 else 0
+
+
+def print_summary(summary, top=15):
+    latency = summary["latency_ms"]
+    errors = ", ".join(f"{status}×{count}" for status, count in sorted(summary["statuses"].items()) if status != "200")
+    print(f"\n请求 {summary['requests']}，成功 {summary['ok']}，错误率 {summary['error_rate']:.2%}"
+          f"{'（' + errors + '）' if errors else ''}")
+    print(f"吞吐 {summary['throughput_rps']:.1f} 请求/秒，{summary['bytes_per_second'] / 1024 / 1024:.2f} MB/秒")
+    print(f"延迟 p50 {_ms(latency['p50'])} ms  p95 {_ms(latency['p95'])} ms  "
+          f"p99 {_ms(latency['p99'])} ms  最大 {_ms(latency['max'])} ms")
+    if "server_rss_mb_peak" in summary:
+        print(f"服务端内存峰值 RSS {summary['server_rss_mb_peak']:.1f} MB / PSS {summary['server_pss_mb_peak']:.1f} MB")
+    print(f"客户端 CPU 占用 {summary['client_cpu_share']:.0%}（接近 100% 时客户端本身成为瓶颈）")
+    print(f"\n{'类别 (样式/格式/尺寸/Logo)':<36} {'数量':>6} {'p50':>7} {'p95':>7} {'p99':>7}")
+    for cat, entry in list(summary["categories"].items())[:top]:
+        print(f"{cat:<36} {entry['count']:6d} {_ms(entry['p50'])} {_ms(entry['p95'])} {_ms(entry['p99'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="网页服务 /generate 压力测试")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--start", choices=("gunicorn", "flask"), help="在本机启动服务后测试，结束时关闭")
+    target.add_argument("--url", help="测试已在运行的服务，如 http://127.0.0.1:8711")
+    parser.add_argument("--port", type=int, help="--start 时的端口（默认随机空闲端口）")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="--start 时传给服务的环境变量，可重复")
+    parser.add_argument("--server-log", help="--start 时服务日志的保存路径（默认丢弃）")
+    parser.add_argument("--server-pid", type=int, help="--url 时用于采样内存的服务主进程 pid")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="并发连接数")
+    amount = parser.add_mutually_exclusive_group()
+    amount.add_argument("-n", "--requests", type=int, help="请求总数（不含预热）")
+    amount.add_argument("-d", "--duration", type=float, default=30.0, help="持续时间（秒）")
+    parser.add_argument("--rate", type=float, help="按固定速率发送（请求/秒），默认每个连接收到响应后立即发送下一个")
+    parser.add_argument("--warmup", type=int, default=0, help="不计入统计的前若干个请求")
+    parser.add_argument("--mix", help="请求混合比例 JSON，与 DEFAULT_MIX 按键合并")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--interval", type=float, default=1.0, help="时间序列采样间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求的超时（秒）")
+    parser.add_argument("--top", type=int, default=15, help="输出请求数最多的前 N 个类别")
+    parser.add_argument("-o", "--output", help="结果 JSON 路径")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+矩阵构建一致性检查
+
+用固定随机种子生成一组内容，分别交给 qrcode 库和 qr_builder 构建矩阵并逐模块比较：
+
+- 基准测试中的各类内容（短链接、长链接、WiFi、vCard）在四个纠错等级下的最优分段
+- 每个版本（1-40）× 每个纠错等级：随机字节填到容量的随机比例，覆盖剩余位和各种块结构
+- 数字、字母数字、中文等混合内容（经 qr_segments 分段）
+- 部分用例额外指定每一种掩码，并把 8 种掩码的罚分与 qrcode.util.lost_point 逐一比较
+
+任何一个用例不一致时以退出码 1 结束，同时输出两种实现的总耗时。
+
+    python matrix_corpus.py
+    python matrix_corpus.py --seed 7 --per-version 3
+"""
+import argparse
+import random
+import string
+import sys
+import time
+
+import numpy as np
+import qrcode
+import qrcode.util
+from qrcode.exceptions import DataOverflowError
+
+import qr_builder
+import qr_segments
+from bench_qr import PAYLOADS
+
+ECC_LEVELS = (
+    qrcode.constants.ERROR_CORRECT_L,
+    qrcode.constants.ERROR_CORRECT_M,
+    qrcode.constants.ERROR_CORRECT_Q,
+    qrcode.constants.ERROR_CORRECT_H,
+)
+
+_MIXED_ALPHABETS = (
+    string.digits,
+    qrcode.util.ALPHA_NUM.decode("ascii"),
+    string.ascii_letters + string.punctuation + " ",
+    "二维码生成器纠错等级",
+)
+
+
+def _mixed_text(rng, length):
+    """由数字、字母数字、ASCII 和中文片段拼成的内容"""
+    parts = []
+    while sum(map(len, parts)) < length:
+        alphabet = rng.choice(_MIXED_ALPHABETS)
+        parts.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40))))
+    return "".join(parts)[:length]
+
+
+def build_corpus(seed, per_version, mixed):
+    """返回 [(名称, 版本, 纠错等级, QRData 列表), ...]"""
+    rng = random.Random(seed)
+    corpus = []
+    for name, data in PAYLOADS.items():
+        for ecc in ECC_LEVELS:
+            version, segments = qr_segments.fit(data, ecc)
+            corpus.append((name, version, ecc, segments))
+    for version in range(1, 41):
+        for ecc in ECC_LEVELS:
+            header = 4 + qrcode.util.mode_sizes_for_version(version)[qrcode.util.MODE_8BIT_BYTE]
+            capacity = (qrcode.util.BIT_LIMIT_TABLE[ecc][version] - header) // 8
+            for _ in range(per_version):
+                count = rng.randint(0, capacity)
+                data = bytes(rng.getrandbits(8) for _ in range(count))
+                corpus.append((f"bytes/{count}", version, ecc, [(qrcode.util.MODE_8BIT_BYTE, data)]))
+    for _ in range(mixed):
+        ecc = rng.choice(ECC_LEVELS)
+        text = _mixed_text(rng, rng.choice((10, 60, 250, 900)))
+        try:
+            version, segments = qr_segments.fit(text, ecc)
+        except DataOverflowError:
+            continue
+        corpus.append((f"mixed/{len(text)}", version, ecc, segments))
+    return [(name, version, ecc, [qrcode.util.QRData(text, mode=mode) for mode, text in segments])
+            for name, version, ecc, segments in corpus]
+
+
+def _library(version, ecc, data_list, mask_pattern=None):
+    qr = qrcode.QRCode(version=version, error_correction=ecc, border=0, mask_pattern=mask_pattern)
+    for item in data_list:
+        qr.add_data(item)
+    qr.make(fit=False)
+    return qr
+
+
+def check_penalties(qr):
+    """8 种掩码的罚分是否与 qrcode 库一致"""
+    candidates = []
+    expected = []
+    for pattern in range(8):
+        qr.makeImpl(True, pattern)
+        expected.append(qrcode.util.lost_point(qr.modules))
+        candidates.append(np.asarray(qr.modules, dtype=bool))
+    return qr_builder.penalties(np.stack(candidates)).tolist() == expected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较 qr_builder 与 qrcode 库构建的矩阵")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--per-version", type=int, default=2, help="每个版本和纠错等级的随机字节用例数")
+    parser.add_argument("--mixed", type=int, default=200, help="混合内容用例数")
+    parser.add_argument("--mask-every", type=int, default=10,
+                        help="每隔多少个用例额外检查全部掩码和罚分（0 为不检查）")
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.seed, args.per_version, args.mixed)
+    for version in range(1, 41):
+        qr_builder.layout(version)
+
+    failures = []
+    library_time = builder_time = 0.0
+    masks_checked = 0
+    for index, (name, version, ecc, data_list) in enumerate(corpus):
+        start = time.perf_counter()
+        qr = _library(version, ecc, data_list)
+        expected = np.asarray(qr.get_matrix(), dtype=bool)
+        library_time += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = qr_builder.build(version, ecc, data_list)
+        builder_time += time.perf_counter() - start
+        if not np.array_equal(expected, actual):
+            failures.append(f"{name} 版本 {version} 纠错等级 {ecc}: {int((expected != actual).sum())} 个模块不同")
+
+        if args.mask_every and index % args.mask_every == 0:
+            masks_checked += 1
+            if not check_penalties(qr):
+                failures.append(f"{name} 版本 {version} 纠错等级 {ecc}: 掩码罚分不同")
+            for pattern in range(8):
+                expected = np.asarray(_library(version, ecc, data_list, pattern).get_matrix(), dtype=bool)
+                if not np.array_equal(expected, qr_builder.build(version, ecc, data_list, pattern)):
+                    failures.append(f"{name} 版本 {version} 纠错等级 {ecc}: 掩码 {pattern} 的矩阵不同")
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    print(f"共 {len(corpus)} 个用例（其中 {masks_checked} 个检查了全部掩码），不一致 {len(failures)} 个")
+    print(f"qrcode 库 {library_time:.2f} 秒，qr_builder {builder_time:.2f} 秒，"
+          f"加速 {library_time / builder_time:.1f} 倍")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+缓存工具
+
+提供一个线程安全、容量有限的 LRU 缓存，带命中/未命中计数，
+供光栅化精灵图等热点数据复用；以及内存 + 磁盘两级的输出缓存，
+磁盘层可由同一台机器上的多个服务进程共享。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    容量有限的 LRU 缓存
+
+    参数:
+        maxsize: 最多保存的条目数，超出时淘汰最久未使用的条目
+        maxbytes: 可选的总字节数上限，需同时提供 sizeof
+        sizeof: 计算单个条目字节数的函数
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """读取缓存条目，命中时将其移到最近使用的位置"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入缓存条目，必要时淘汰最久未使用的条目"""
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            self._bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize or (
+                    self.maxbytes is not None and self._bytes > self.maxbytes and len(self._data) > 1):
+                evicted, _ = self._data.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """读取缓存条目，未命中时调用 factory() 生成并写入"""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """清空缓存并重置计数"""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def make_cache_key(params):
+    """把规范化后的请求参数（可 JSON 序列化的字典）哈希为缓存键"""
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class OutputCache:
+    """
+    两级输出缓存：进程内 LRU + 共享磁盘目录
+
+    参数:
+        memory_items: 内存层最多保存的条目数
+        memory_bytes: 内存层最多占用的字节数
+        disk_dir: 磁盘层目录，为空时不启用磁盘层
+        disk_bytes: 磁盘层最多占用的字节数，超出时按访问时间淘汰最旧的文件
+    """
+
+    def __init__(self, memory_items=256, memory_bytes=64 * 1024 * 1024,
+                 disk_dir=None, disk_bytes=512 * 1024 * 1024):
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._size = 0
+        self._disk_written = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _remember(self, key, value):
+        """写入内存层（调用方需持有锁）"""
+        if len(value) > self.memory_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._data[key] = value
+        self._size += len(value)
+        while len(self._data) > self.memory_items or self._size > self.memory_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        """读取缓存内容，未命中时返回 None"""
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.memory_hits += 1
+                return value
+
+        if self.disk_dir:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    value = f.read()
+                os.utime(path)
+            except OSError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """写入缓存内容（bytes）"""
+        with self._lock:
+            self._remember(key, value)
+
+        if self.disk_dir:
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # 先写临时文件再原子替换，避免其他进程读到半个文件
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(value)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"写入磁盘缓存失败: {e}")
+                return
+            with self._lock:
+                self._disk_written += len(value)
+                need_trim = self._disk_written > self.disk_bytes // 10
+                if need_trim:
+                    self._disk_written = 0
+            if need_trim:
+                self.trim_disk()
+
+    def trim_disk(self):
+        """磁盘层超出容量时，按访问时间删除最旧的文件"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.disk_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+            if total <= self.disk_bytes:
+                break
+
+    def clear(self):
+        """清空内存层并重置计数（磁盘层保留）"""
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+            self.memory_hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_items": len(self._data),
+                "memory_bytes": self._size,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / total if total else 0.0,
+            }
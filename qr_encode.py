@@ -0,0 +1,114 @@
+"""
+图片编码
+
+二维码图片通常只有两三种颜色，按完整 RGBA 保存既浪费 zlib 时间也浪费体积。
+这里在保存前检查颜色数，能无损表示时改用灰度 (L) 或调色板 (P) 模式，
+并提供速度/体积取舍的压缩预设，以及可选的 WebP（无损）输出。
+"""
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+# 编码预设
+#   palette_colors: 颜色数不超过该值时使用调色板模式（调色板图像不做行过滤，
+#                   颜色较多的渐变图反而更大，所以默认只对少量颜色启用）
+#   try_both: 同时编码 RGBA 和调色板版本，保留较小的一个
+ENCODE_PRESETS = {
+    "fast": {"compress_level": 1, "optimize": False, "palette_colors": 256, "try_both": False, "webp_method": 0},
+    "balanced": {"compress_level": 6, "optimize": False, "palette_colors": 16, "try_both": False, "webp_method": 4},
+    "small": {"compress_level": 9, "optimize": True, "palette_colors": 256, "try_both": True, "webp_method": 6},
+}
+DEFAULT_PRESET = os.environ.get("QR_ENCODE_PRESET", "balanced")
+
+# 需要经过编码阶段的格式，其余格式直接交给 PIL
+ENCODED_FORMATS = ("PNG", "WEBP")
+
+
+def reduce_mode(img, max_colors=256):
+    """
+    无损地把 RGBA 图片转换为更紧凑的模式
+
+    全部不透明且为灰色时转为 L；颜色数不超过 max_colors 时转为带 RGBA 调色板的 P；
+    否则原样返回。像素值保持完全一致。
+    """
+    if img.mode != "RGBA":
+        return img
+    colors = img.getcolors(max_colors)
+    if colors is None:
+        return img
+    rgba = [c for _, c in colors]
+    if all(a == 255 and r == g == b for r, g, b, a in rgba):
+        return img.convert("L")
+
+    # 把每个像素当作一个 uint32，在排序后的调色板中查找下标
+    keys = np.unique(np.array(rgba, dtype=np.uint8).view(np.uint32)[:, 0])
+    pixels = np.asarray(img).view(np.uint32)[..., 0]
+    indexed = Image.fromarray(np.searchsorted(keys, pixels).astype(np.uint8), "P")
+    indexed.putpalette(keys.view(np.uint8).tobytes(), "RGBA")
+    return indexed
+
+
+def _encode_png(img, settings):
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", compress_level=settings["compress_level"], optimize=settings["optimize"])
+    return buffer.getvalue()
+
+
+def encode_image(img, image_format="PNG", preset=None):
+    """
+    按格式和预设编码图片，返回字节
+
+    参数:
+        img: PIL 图片
+        image_format: "PNG" 或 "WEBP"（WebP 使用无损模式）
+        preset: "fast"、"balanced" 或 "small"，默认取 QR_ENCODE_PRESET 环境变量
+    """
+    settings = ENCODE_PRESETS[preset or DEFAULT_PRESET]
+    if image_format.upper() == "WEBP":
+        buffer = io.BytesIO()
+        img.save(buffer, format="WEBP", lossless=True, method=settings["webp_method"])
+        return buffer.getvalue()
+
+    reduced = reduce_mode(img, settings["palette_colors"])
+    data = _encode_png(reduced, settings)
+    if settings["try_both"] and reduced is not img:
+        full = _encode_png(img, settings)
+        if len(full) < len(data):
+            data = full
+    return data
+
+
+def resolve_format(output_file, image_format=None):
+    """
+    确定输出格式（大写）
+
+    output_file 为路径时，未指定 image_format 则按扩展名判断格式；
+    为文件对象时默认为 PNG。
+    """
+    if image_format is None:
+        if isinstance(output_file, str):
+            ext = os.path.splitext(output_file)[1].lower()
+            image_format = Image.registered_extensions().get(ext, "PNG")
+        else:
+            image_format = "PNG"
+    return image_format.upper()
+
+
+def save_image(img, output_file, image_format=None, preset=None):
+    """保存生成的图片，格式由 resolve_format 确定"""
+    image_format = resolve_format(output_file, image_format)
+
+    if image_format not in ENCODED_FORMATS:
+        # TIFF 默认不压缩；与分块渲染的 TIFF 输出（qr_tiled）一样使用 Deflate
+        options = {"compression": "tiff_deflate"} if image_format == "TIFF" else {}
+        img.save(output_file, format=image_format, **options)
+        return
+
+    data = encode_image(img, image_format, preset)
+    if isinstance(output_file, str):
+        with open(output_file, "wb") as f:
+            f.write(data)
+    else:
+        output_file.write(data)
@@ -0,0 +1,97 @@
+"""
+有界渲染执行器
+
+渲染是 CPU 密集型任务，直接在请求线程中执行时，一批大尺寸请求就会拖慢
+所有请求。这里把渲染交给固定大小的执行器，并限制排队深度：队列已满时
+立即拒绝（HTTP 429），等待超过渲染超时时放弃（HTTP 503），让过载时的
+请求快速失败而不是无限堆积。
+
+超时只结束请求的等待，并不会中止渲染：仍在排队的任务被移出队列，已经开始的
+渲染会继续执行完，期间一直占用执行器名额和 CPU。单次渲染的耗时上限要靠
+请求参数的限制来保证（网页服务的 QR_MAX_SIZE）。
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class RenderOverloaded(Exception):
+    """执行器与队列均已占满"""
+
+
+class RenderTimeout(Exception):
+    """渲染未在超时时间内完成"""
+
+
+class RenderExecutor:
+    """
+    有界渲染执行器
+
+    参数:
+        kind: "thread"（每个服务进程内的线程池，多进程由 gunicorn 提供）
+              或 "process"（进程池，适合单进程部署）
+        workers: 同时执行的渲染数
+        max_queue: 允许排队等待的渲染数，超出时抛出 RenderOverloaded
+        timeout: 单次渲染（含排队）的最长等待秒数，超出时抛出 RenderTimeout；
+                 已开始的渲染不会因此停止
+    """
+
+    def __init__(self, kind="thread", workers=2, max_queue=8, timeout=10.0):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _get_pool(self):
+        # 线程和子进程都不能跨 fork 继承，在每个服务进程中按需创建
+        if self._pool is None or self._pid != os.getpid():
+            cls = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self._pool = cls(max_workers=self.workers)
+            self._pid = os.getpid()
+        return self._pool
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def run(self, fn, *args):
+        """在执行器中运行 fn(*args) 并等待结果"""
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise RenderOverloaded()
+            self.in_flight += 1
+            pool = self._get_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # 只有仍在排队的任务能移出队列；已开始的渲染不会停止，执行完之前一直计入 in_flight
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise RenderTimeout()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
@@ -1,27 +1,138 @@
-import qrcode
-from PIL import Image, ImageDraw, ImageFilter
+from PIL import Image, ImageDraw, ImageColor
 import numpy as np
 import os
-import io
-import base64
+import sys
+import csv
+import gzip
+import time
+import hashlib
+import argparse
+import multiprocessing
+import qr_encode
+import qr_logo
+import qr_metrics
+import qr_raster
+import qr_tiled
+import qr_verify
+from qr_cache import LRUCache
+from qr_matrix import choose_error_correction, get_matrix
+
+def _svg_num(value):
+    """Compact SVG number: at most 3 decimals, no trailing or leading zeros"""
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    if text in ("", "-0"):
+        return "0"
+    if text.startswith("0."):
+        return text[1:]
+    if text.startswith("-0."):
+        return "-" + text[2:]
+    return text
+
+
+def _svg_subpaths(xs, ys, shapes):
+    """
+    Path data for subpaths starting at (xs, ys), each followed by its shape
+
+    The first subpath uses an absolute move, the rest move relative to the
+    previous start point. Deltas repeat a lot (mostly one module to the
+    right), so their formatted text is memoized.
+    """
+    if len(xs) == 0:
+        return ""
+    n = _svg_num
+    dxs = np.diff(xs, prepend=xs[0]).tolist()
+    dys = np.diff(ys, prepend=ys[0]).tolist()
+    moves = {}
+    parts = [f"M{n(xs[0])} {n(ys[0])}{shapes[0]}"]
+    for dx, dy, shape in zip(dxs[1:], dys[1:], shapes[1:]):
+        move = moves.get((dx, dy))
+        if move is None:
+            move = moves[(dx, dy)] = f"m{n(dx)} {n(dy)}"
+        parts.append(move)
+        parts.append(shape)
+    return "".join(parts)
+
+
+def compact_module_geometry(matrix, style, offset, module_size):
+    """
+    Module geometry shared by the compact SVG and the PDF label sheets
+
+    Returns (xs, ys, widths, height, pen): every dark module (classic: every
+    horizontal run of modules) is a rectangle at (xs, ys) of size
+    widths x height, filled and then stroked at width pen with round joins
+    and caps. Rounded modules are inner squares whose stroke rounds the
+    corners (stroke width = 2 * rx gives exactly the verbose rounded rect);
+    circles are zero-size rectangles whose round caps draw the dot.
+    """
+    if style in ("circle", "rounded"):
+        ys, xs = np.nonzero(matrix)
+        xs = offset + xs * module_size
+        ys = offset + ys * module_size
+
+    if style == "circle":
+        r = module_size / 2 * 0.9
+        return xs + module_size / 2, ys + module_size / 2, np.zeros(len(xs)), 0, 2 * r
+    if style == "rounded":
+        padding = module_size * 0.05
+        size = module_size * 0.9
+        rx = size * 0.3
+        side = size - 2 * rx
+        return xs + (padding + rx), ys + (padding + rx), np.full(len(xs), side), side, 2 * rx
+
+    # Run-length merge each row: a run starts where a dark module follows a light one
+    padded = np.pad(matrix, ((0, 0), (1, 1)), constant_values=False).astype(np.int8)
+    edges = np.diff(padded, axis=1)
+    starts_y, starts_x = np.nonzero(edges == 1)
+    _, ends_x = np.nonzero(edges == -1)
+    widths = (ends_x - starts_x) * module_size
+    return offset + starts_x * module_size, offset + starts_y * module_size, widths, module_size, 0
+
+
+def _svg_compact_modules(matrix, style, offset, module_size, color):
+    """
+    All dark modules as a single <path> element (see compact_module_geometry)
+
+    Classic runs are filled, rounded squares are filled and stroked, circles
+    are zero-length segments with round caps.
+    """
+    n = _svg_num
+    xs, ys, widths, height, pen = compact_module_geometry(matrix, style, offset, module_size)
+    if style == "circle":
+        d = _svg_subpaths(xs, ys, ["h0"] * len(xs))
+        attrs = f'fill="none" stroke="{color}" stroke-width="{n(pen)}" stroke-linecap="round"'
+    elif style == "rounded":
+        side = n(height)
+        d = _svg_subpaths(xs, ys, [f"h{side}v{side}h-{side}z"] * len(xs))
+        attrs = f'fill="{color}" stroke="{color}" stroke-width="{n(pen)}" stroke-linejoin="round"'
+    else:
+        height = n(height)
+        widths = widths.tolist()
+        runs = {w: f"h{n(w)}v{height}h-{n(w)}z" for w in set(widths)}
+        d = _svg_subpaths(xs, ys, [runs[w] for w in widths])
+        attrs = f'fill="{color}"'
+    return f'<path d="{d}" {attrs}/>'
+
 
 def generate_svg_qr_code(data, output_file=None, color="#000000", bg_color="#FFFFFF", 
-                         style="classic", border=4, box_size=12, logo_obj=None, logo_path=None):
+                         style="classic", border=4, box_size=12, logo_obj=None, logo_path=None,
+                         compact=False, svgz=False, ecc=None):
     """
     Generate SVG QR code with basic styling and logo support
+
+    compact: merge all modules into a single <path> instead of one element per module
+    svgz: gzip the bytes written to output_file (the returned string stays plain SVG)
+    ecc: error correction policy ("auto", "L", "M", "Q", "H"), defaults to QR_ECC;
+         "auto" uses H only when a logo covers the center
     """
+    # The logo decides the error correction level, so resolve it before encoding
+    logo = qr_logo.resolve(logo_obj, logo_path)
+
     # Create QR matrix
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=box_size,
-        border=border,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    matrix = qr.get_matrix()
+    timer = qr_metrics.stage_timer("svg")
+    matrix = get_matrix(data, border=border, version=1,
+                        error_correction=choose_error_correction(bool(logo), ecc))
     matrix_size = len(matrix)
+    timer.lap("matrix")
     
     # Calculate dimensions
     module_size = box_size
@@ -36,44 +147,42 @@ def generate_svg_qr_code(data, output_file=None, color="#000000", bg_color="#FFF
         svg.append(f'<rect x="0" y="0" width="{total_size}" height="{total_size}" fill="{bg_color}"/>')
         
     # Draw modules
-    for y in range(matrix_size):
-        for x in range(matrix_size):
-            if matrix[y][x]:
-                pos_x = offset + x * module_size
-                pos_y = offset + y * module_size
+    if compact:
+        svg.append(_svg_compact_modules(matrix, style, offset, module_size, color))
+    else:
+        matrix = matrix.tolist()
+        for y in range(matrix_size):
+            for x in range(matrix_size):
+                if matrix[y][x]:
+                    pos_x = offset + x * module_size
+                    pos_y = offset + y * module_size
                 
-                if style == "circle":
-                    # Circle style
-                    cx = pos_x + module_size / 2
-                    cy = pos_y + module_size / 2
-                    r = module_size / 2 * 0.9  # Slight padding
-                    svg.append(f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="{color}"/>')
-                elif style == "rounded":
-                    # Rounded rect style
-                    padding = module_size * 0.05
-                    size = module_size * 0.9
-                    rx = size * 0.3
-                    svg.append(f'<rect x="{pos_x + padding}" y="{pos_y + padding}" width="{size}" height="{size}" rx="{rx}" fill="{color}"/>')
-                else:
-                    # Classic square
-                    # Optimize by drawing only if needed? No, just draw all.
-                    # Add small padding to avoid gaps? Or exact.
-                    # Usually exact is better for crispness, but slight overlap helps anti-aliasing.
-                    # Let's do exact.
-                    svg.append(f'<rect x="{pos_x}" y="{pos_y}" width="{module_size}" height="{module_size}" fill="{color}"/>')
+                    if style == "circle":
+                        # Circle style
+                        cx = pos_x + module_size / 2
+                        cy = pos_y + module_size / 2
+                        r = module_size / 2 * 0.9  # Slight padding
+                        svg.append(f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="{color}"/>')
+                    elif style == "rounded":
+                        # Rounded rect style
+                        padding = module_size * 0.05
+                        size = module_size * 0.9
+                        rx = size * 0.3
+                        svg.append(f'<rect x="{pos_x + padding}" y="{pos_y + padding}" width="{size}" height="{size}" rx="{rx}" fill="{color}"/>')
+                    else:
+                        # Classic square
+                        # Optimize by drawing only if needed? No, just draw all.
+                        # Add small padding to avoid gaps? Or exact.
+                        # Usually exact is better for crispness, but slight overlap helps anti-aliasing.
+                        # Let's do exact.
+                        svg.append(f'<rect x="{pos_x}" y="{pos_y}" width="{module_size}" height="{module_size}" fill="{color}"/>')
+
+    timer.lap("render")
 
     # Add Logo
-    logo = None
-    if logo_obj:
-        logo = logo_obj
-    elif logo_path and os.path.exists(logo_path):
-        logo = Image.open(logo_path)
-        
     if logo:
-        # Convert logo to base64
-        buffered = io.BytesIO()
-        logo.save(buffered, format="PNG")
-        logo_b64 = base64.b64encode(buffered.getvalue()).decode()
+        # Convert logo to base64 (cached per logo content)
+        logo_b64 = qr_logo.logo_store.png_base64(logo)
         
         # Calculate position and size (20% of QR size)
         logo_display_size = total_size * 0.2
@@ -81,362 +190,238 @@ def generate_svg_qr_code(data, output_file=None, color="#000000", bg_color="#FFF
         logo_y = (total_size - logo_display_size) / 2
         
         svg.append(f'<image href="data:image/png;base64,{logo_b64}" x="{logo_x}" y="{logo_y}" width="{logo_display_size}" height="{logo_display_size}" />')
+        timer.lap("logo")
 
     svg.append('</svg>')
     svg_content = '\n'.join(svg)
     
     if output_file:
+        svg_bytes = svg_content.encode('utf-8')
+        if svgz:
+            svg_bytes = gzip.compress(svg_bytes, mtime=0)
         if hasattr(output_file, 'write'):
-            output_file.write(svg_content.encode('utf-8'))
+            output_file.write(svg_bytes)
         else:
-            with open(output_file, 'w') as f:
-                f.write(svg_content)
+            with open(output_file, 'wb') as f:
+                f.write(svg_bytes)
+    timer.lap("encode")
+    timer.done(style, "svgz" if svgz else "svg", matrix_size)
     
     return svg_content
 
-def generate_styled_qr_code(data, output_file="styled_qrcode.png", logo_path=None, logo_obj=None,
-                           color="#000000", bg_color="#FFFFFF", box_size=12, 
-                           border=4, style="rounded", img_size=(350, 350), auto_adjust=True):
-    """
-    生成美化的二维码
+# 光栅化引擎: "numpy" 为批量光栅化，"legacy" 为逐模块绘制，
+# "compare" 同时运行两者并逐像素比对（输出以 legacy 结果为准）
+RENDER_ENGINE = os.environ.get("QR_RENDER_ENGINE", "numpy")
+
+
+def count_pixel_diff(img_a, img_b):
+    """逐像素比较两张图片，返回不同像素的数量"""
+    if img_a.size != img_b.size or img_a.mode != img_b.mode:
+        return img_a.size[0] * img_a.size[1]
+    a = np.asarray(img_a)
+    b = np.asarray(img_b)
+    diff = a != b
+    if diff.ndim == 3:
+        diff = diff.any(axis=2)
+    return int(diff.sum())
+
+
+def _run_engine(engine, fast, legacy, args):
+    """按引擎设置选择渲染路径"""
+    engine = engine or RENDER_ENGINE
+    if engine == "legacy":
+        return legacy(*args)
+    if engine == "compare":
+        expected = legacy(*args)
+        actual = fast(*args)
+        diff = count_pixel_diff(expected, actual)
+        if diff:
+            print(f"光栅化引擎结果不一致: {fast.__name__} 有 {diff} 个像素不同")
+        return expected
+    return fast(*args)
+
+
+def _to_rgba(color):
+    """把颜色（RGBA 元组或 PIL 支持的字符串）转换为 RGBA 元组"""
+    if isinstance(color, str):
+        return ImageColor.getcolor(color, "RGBA")
+    if len(color) == 3:
+        return tuple(color) + (255,)
+    return tuple(color)
+
+
+def _size_factors(matrix_size):
+    """调整大小因子，确保点的大小足够明显"""
+    # 修正：增加最小尺寸因子，确保二维码点始终足够大
+    rect_size_factor = max(0.9, min(1.0, 18.0 / matrix_size))  # 增加系数和最小值
+    circle_radius_factor = max(0.85, min(1.0, 16.0 / matrix_size))  # 增加系数和最小值
+    return rect_size_factor, circle_radius_factor
+
+
+def _render_styled_legacy(qr_matrix, style, final_img_size, start_x, start_y, module_size, rgba_color, bg_rgba):
+    """逐模块绘制圆角/圆形样式（原始实现）"""
+    matrix_size = len(qr_matrix)
+    styled_img = Image.new("RGBA", final_img_size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(styled_img)
     
-    参数:
-        data: 要编码的数据
-        output_file: 输出文件名
-        logo_path: 可选的居中logo图片路径
-        color: 二维码颜色
-        bg_color: 背景颜色
-        box_size: 二维码方块大小
-        border: 边界大小
-        style: 样式 ("rounded", "circle", "classic")
-        img_size: 最终输出图片的大小 (宽, 高)
-        auto_adjust: 是否根据数据长度自动调整参数
-    """
-    # 根据数据长度自动调整参数
-    if auto_adjust:
-        # 长链接需要更多空间
-        data_length = len(data)
-        
-        # 根据链接长度调整二维码版本和边框大小
-        qr_version = 1
-        if data_length > 50:
-            qr_version = 2
-        if data_length > 100:
-            qr_version = 3
-        if data_length > 150:
-            qr_version = 4
-        
-        # 确保边框足够大但不太大
-        min_border = max(4, 4 + (data_length // 300))  # 进一步减小边框增长率
-        border = max(border, min_border)
-        
-        # 修正：保持盒子大小不太小，确保二维码点足够明显
-        # 即使对于长链接也保持较大的box_size
-        box_size = max(10, box_size - (data_length // 300))  # 提高最小值和减小减小率
-    else:
-        qr_version = 1
-    
-    # 生成QR码
-    qr = qrcode.QRCode(
-        version=qr_version,  # 根据数据长度自动选择版本
-        error_correction=qrcode.constants.ERROR_CORRECT_H,  # 高纠错率以支持Logo
-        box_size=box_size,
-        border=border,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
+    # 定义定位点位置（左上角、右上角、左下角）
+    finder_patterns = qr_raster.finder_pattern_coords(matrix_size)
     
-    # 获取二维码矩阵和大小信息
-    qr_matrix = qr.get_matrix()
-    matrix_size = len(qr_matrix)
+    rect_size_factor, circle_radius_factor = _size_factors(matrix_size)
     
-    # 计算实际需要的图像大小
-    module_size = box_size
-    qr_actual_size = matrix_size * module_size
-    border_size = border * module_size
-    total_qr_size = qr_actual_size + 2 * border_size
-    
-    # 自动调整输出图像大小，确保足够大以容纳二维码
-    if auto_adjust:
-        min_img_size = total_qr_size + 40  # 添加额外的40像素作为边距
-        if img_size[0] < min_img_size or img_size[1] < min_img_size:
-            img_size = (min_img_size, min_img_size)
-    
-    # 创建原始图像
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert('RGBA')
-    qr_width, qr_height = qr_img.size
-    
-    # 应用样式
-    if style == "rounded" or style == "circle":
-        # 创建一个空白画布，设置为指定大小
-        final_img_size = img_size
-        styled_img = Image.new("RGBA", final_img_size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(styled_img)
-        
-        # 计算居中位置的起始坐标
-        start_x = (final_img_size[0] - total_qr_size) // 2 + border_size
-        start_y = (final_img_size[1] - total_qr_size) // 2 + border_size
-        
-        # 转换颜色格式
-        if color.startswith('#'):
-            rgb_color = tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
-            rgba_color = rgb_color + (255,)
-        else:
-            rgba_color = color
-        
-        # 定义定位点位置（左上角、右上角、左下角）
-        finder_patterns = [
-            (0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (0, 6),
-            (1, 0), (1, 6),
-            (2, 0), (2, 2), (2, 3), (2, 4), (2, 6),
-            (3, 0), (3, 2), (3, 3), (3, 4), (3, 6),
-            (4, 0), (4, 2), (4, 3), (4, 4), (4, 6),
-            (5, 0), (5, 6),
-            (6, 0), (6, 1), (6, 2), (6, 3), (6, 4), (6, 5), (6, 6),
-            
-            (0, matrix_size-7), (0, matrix_size-6), (0, matrix_size-5), (0, matrix_size-4), (0, matrix_size-3), (0, matrix_size-2), (0, matrix_size-1),
-            (1, matrix_size-7), (1, matrix_size-1),
-            (2, matrix_size-7), (2, matrix_size-5), (2, matrix_size-4), (2, matrix_size-3), (2, matrix_size-1),
-            (3, matrix_size-7), (3, matrix_size-5), (3, matrix_size-4), (3, matrix_size-3), (3, matrix_size-1),
-            (4, matrix_size-7), (4, matrix_size-5), (4, matrix_size-4), (4, matrix_size-3), (4, matrix_size-1),
-            (5, matrix_size-7), (5, matrix_size-1),
-            (6, matrix_size-7), (6, matrix_size-6), (6, matrix_size-5), (6, matrix_size-4), (6, matrix_size-3), (6, matrix_size-2), (6, matrix_size-1),
-            
-            (matrix_size-7, 0), (matrix_size-7, 1), (matrix_size-7, 2), (matrix_size-7, 3), (matrix_size-7, 4), (matrix_size-7, 5), (matrix_size-7, 6),
-            (matrix_size-6, 0), (matrix_size-6, 6),
-            (matrix_size-5, 0), (matrix_size-5, 2), (matrix_size-5, 3), (matrix_size-5, 4), (matrix_size-5, 6),
-            (matrix_size-4, 0), (matrix_size-4, 2), (matrix_size-4, 3), (matrix_size-4, 4), (matrix_size-4, 6),
-            (matrix_size-3, 0), (matrix_size-3, 2), (matrix_size-3, 3), (matrix_size-3, 4), (matrix_size-3, 6),
-            (matrix_size-2, 0), (matrix_size-2, 6),
-            (matrix_size-1, 0), (matrix_size-1, 1), (matrix_size-1, 2), (matrix_size-1, 3), (matrix_size-1, 4), (matrix_size-1, 5), (matrix_size-1, 6),
-        ]
-        
-        # 调整大小因子，确保点的大小足够明显
-        # 修正：增加最小尺寸因子，确保二维码点始终足够大
-        rect_size_factor = max(0.9, min(1.0, 18.0 / matrix_size))  # 增加系数和最小值
-        circle_radius_factor = max(0.85, min(1.0, 16.0 / matrix_size))  # 增加系数和最小值
-        
-        # 添加一个小的间距调整，减少模块间的空白
-        spacing_factor = 0.95  # 减小间距，值越小模块间距越小
-        
-        # 遍历二维码矩阵，绘制每个模块
-        for y in range(matrix_size):
-            for x in range(matrix_size):
-                if qr_matrix[y][x]:  # 如果是填充点
-                    # 计算模块的中心坐标，调整间距
-                    center_x = start_x + x * (module_size * spacing_factor) + module_size // 2
-                    center_y = start_y + y * (module_size * spacing_factor) + module_size // 2
-                    
-                    # 确定是否是定位点的一部分
-                    is_finder = (x, y) in finder_patterns
-                    
-                    if style == "rounded":
-                        # 对于定位点，使用较小的圆角半径，但保证大小
-                        radius = 1 if is_finder else max(2, int(3 * rect_size_factor))
-                        # 修正：增加最小矩形大小，确保即使在大型二维码中也清晰可见
-                        rect_size = max(module_size // 1.2, int((module_size - 1) * rect_size_factor))
-                        
-                        # 绘制圆角矩形
-                        draw.rounded_rectangle(
-                            [center_x - rect_size//2, center_y - rect_size//2,
-                             center_x + rect_size//2, center_y + rect_size//2],
-                            radius=radius, fill=rgba_color
-                        )
-                    else:  # circle
-                        # 修正：增加圆的最小半径，确保在大型二维码中也足够明显
-                        if is_finder:
-                            radius = module_size//2
-                        else:
-                            # 确保圆的大小不会太小
-                            radius = max(module_size//2.5, int((module_size//2) * circle_radius_factor))
-                        
-                        # 绘制圆形
-                        draw.ellipse(
-                            [center_x - radius, center_y - radius,
-                             center_x + radius, center_y + radius],
-                            fill=rgba_color
-                        )
-        
-            # 创建最终图像
-        if bg_color == "transparent":
-            final_qr = Image.new("RGBA", final_img_size, (0, 0, 0, 0))
-        elif bg_color.upper() == "#FFFFFF":
-            final_qr = Image.new("RGBA", final_img_size, (255, 255, 255, 255))
-        else:
-            bg_rgb = tuple(int(bg_color[i:i+2], 16) for i in (1, 3, 5))
-            final_qr = Image.new("RGBA", final_img_size, bg_rgb + (255,))
-            
-        final_qr.paste(styled_img, (0, 0), styled_img)
-        qr_img = final_qr
-    else:
-        # 经典样式 - 直接使用指定颜色
-        final_img_size = img_size
-        
-        if bg_color == "transparent":
-            classic_img = Image.new("RGBA", final_img_size, (0, 0, 0, 0))
-        else:
-            classic_img = Image.new("RGBA", final_img_size, bg_color)
-            
-        draw = ImageDraw.Draw(classic_img)
-        
-        # 计算居中位置的起始坐标
-        start_x = (final_img_size[0] - total_qr_size) // 2 + border_size
-        start_y = (final_img_size[1] - total_qr_size) // 2 + border_size
-        
-        # 转换颜色格式
-        if color.startswith('#'):
-            rgb_color = tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
-            rgba_color = rgb_color + (255,)
-        else:
-            rgba_color = color
-            
-        # 添加一个小的间距调整，减少模块间的空白
-        spacing_factor = 0.95  # 减小间距，值越小模块间距越小
-        
-        # 遍历二维码矩阵，绘制每个模块
-        for y in range(matrix_size):
-            for x in range(matrix_size):
-                if qr_matrix[y][x]:  # 如果是填充点
-                    # 计算模块的中心坐标，调整间距
-                    center_x = start_x + x * (module_size * spacing_factor) + module_size // 2
-                    center_y = start_y + y * (module_size * spacing_factor) + module_size // 2
+    # 添加一个小的间距调整，减少模块间的空白
+    spacing_factor = 0.95  # 减小间距，值越小模块间距越小
+    
+    # 遍历二维码矩阵，绘制每个模块
+    for y in range(matrix_size):
+        for x in range(matrix_size):
+            if qr_matrix[y][x]:  # 如果是填充点
+                # 计算模块的中心坐标，调整间距
+                center_x = start_x + x * (module_size * spacing_factor) + module_size // 2
+                center_y = start_y + y * (module_size * spacing_factor) + module_size // 2
+                
+                # 确定是否是定位点的一部分
+                is_finder = (x, y) in finder_patterns
+                
+                if style == "rounded":
+                    # 对于定位点，使用较小的圆角半径，但保证大小
+                    radius = 1 if is_finder else max(2, int(3 * rect_size_factor))
+                    # 修正：增加最小矩形大小，确保即使在大型二维码中也清晰可见
+                    rect_size = max(module_size // 1.2, int((module_size - 1) * rect_size_factor))
                     
-                    # 修正：绘制矩形而不是点，确保在任何尺寸下都可见
-                    rect_size = max(module_size // 1.2, module_size - 1)
-                    draw.rectangle(
+                    # 绘制圆角矩形
+                    draw.rounded_rectangle(
                         [center_x - rect_size//2, center_y - rect_size//2,
                          center_x + rect_size//2, center_y + rect_size//2],
-                        fill=rgba_color
+                        radius=radius, fill=rgba_color
                     )
+                else:  # circle
+                    # 修正：增加圆的最小半径，确保在大型二维码中也足够明显
+                    if is_finder:
+                        radius = module_size//2
+                    else:
+                        # 确保圆的大小不会太小
+                        radius = max(module_size//2.5, int((module_size//2) * circle_radius_factor))
                     
-        qr_img = classic_img
+                    # 绘制圆形
+                    draw.ellipse(
+                        [center_x - radius, center_y - radius,
+                         center_x + radius, center_y + radius],
+                        fill=rgba_color
+                    )
     
-    # 添加Logo（如果提供）
-    logo = None
-    if logo_obj:
-        logo = logo_obj.convert("RGBA")
-    elif logo_path and os.path.exists(logo_path):
-        logo = Image.open(logo_path).convert("RGBA")
+    # 创建最终图像
+    final_qr = Image.new("RGBA", final_img_size, bg_rgba)
+    final_qr.paste(styled_img, (0, 0), styled_img)
+    return final_qr
 
-    if logo:
-        try:
-            # 调整Logo大小，不超过二维码的20%（较大数据时需要更小Logo）
-            logo_scale = 5 if data_length < 100 else 6
-            logo_max_size = qr_img.size[0] // logo_scale
-            logo_size = min(logo.size[0], logo.size[1], logo_max_size)
-            logo = logo.resize((logo_size, logo_size), Image.LANCZOS)
-            
-            # 计算位置使Logo居中
-            pos = ((qr_img.size[0] - logo.size[0]) // 2, (qr_img.size[1] - logo.size[1]) // 2)
-            
-            # 创建圆形蒙版
-            mask = Image.new("L", logo.size, 0)
-            draw = ImageDraw.Draw(mask)
-            draw.ellipse((0, 0, logo.size[0], logo.size[1]), fill=255)
-            mask = mask.filter(ImageFilter.GaussianBlur(1))
-            
-            # 将Logo粘贴到二维码上
-            qr_img.paste(logo, pos, mask)
-        except Exception as e:
-            print(f"添加Logo时出错: {e}")
-    
-    if isinstance(output_file, str):
-        qr_img.save(output_file)
-    else:
-        qr_img.save(output_file, format='PNG')
-    return output_file
 
-def generate_gradient_qr(data, output_file="gradient_qrcode.png", start_color="#1E88E5", 
-                         end_color="#8BC34A", bg_color="#FFFFFF", box_size=12, 
-                         border=4, img_size=(350, 350), auto_adjust=True, logo_obj=None, logo_path=None):
-    """
-    生成渐变色二维码
-    
-    参数:
-        data: 要编码的数据
-        output_file: 输出文件名
-        start_color: 渐变起始颜色
-        end_color: 渐变结束颜色
-        bg_color: 背景颜色
-        box_size: 二维码方块大小
-        border: 边界大小
-        img_size: 最终输出图片的大小 (宽, 高)
-        auto_adjust: 是否根据数据长度自动调整参数
-    """
-    # 根据数据长度自动调整参数
-    if auto_adjust:
-        # 长链接需要更多空间
-        data_length = len(data)
-        
-        # 根据链接长度调整二维码版本和边框大小
-        qr_version = 1
-        if data_length > 50:
-            qr_version = 2
-        if data_length > 100:
-            qr_version = 3
-        if data_length > 150:
-            qr_version = 4
-        
-        # 确保边框足够大
-        min_border = max(4, 4 + (data_length // 300))  # 减小边框增长率
-        border = max(border, min_border)
-        
-        # 修正：保持盒子大小不太小
-        box_size = max(10, box_size - (data_length // 300))
-    else:
-        qr_version = 1
-    
-    # 生成QR码
-    qr = qrcode.QRCode(
-        version=qr_version,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=box_size,
-        border=border,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    # 将十六进制颜色转为RGB
-    def hex_to_rgb(hex_color):
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+def _styled_plan(qr_matrix, style, final_img_size, start_x, start_y, module_size, rgba_color, bg_rgba):
+    """圆角/圆形样式的光栅化计划"""
+    matrix = qr_raster.matrix_to_array(qr_matrix)
+    matrix_size = len(matrix)
+    rect_size_factor, circle_radius_factor = _size_factors(matrix_size)
+    centers_x, centers_y = qr_raster.module_centers(matrix_size, start_x, start_y, module_size)
     
-    start_rgb = hex_to_rgb(start_color)
-    end_rgb = hex_to_rgb(end_color)
+    ys, xs = np.nonzero(matrix)
+    is_finder = qr_raster.finder_mask(matrix_size)[ys, xs]
+    cx = centers_x[xs]
+    cy = centers_y[ys]
     
-    if bg_color == "transparent":
-        bg_rgb = (0, 0, 0, 0)
+    if style == "rounded":
+        rect_size = max(module_size // 1.2, int((module_size - 1) * rect_size_factor))
+        half = np.full(len(xs), rect_size // 2)
+        radii = np.where(is_finder, 1, max(2, int(3 * rect_size_factor)))
+        shape = qr_raster.SHAPE_ROUNDED
     else:
-        bg_rgb = hex_to_rgb(bg_color)
+        finder_radius = module_size // 2
+        module_radius = max(module_size // 2.5, int((module_size // 2) * circle_radius_factor))
+        half = np.where(is_finder, finder_radius, module_radius)
+        radii = np.zeros(len(xs))
+        shape = qr_raster.SHAPE_ELLIPSE
     
-    # 获取二维码矩阵和大小信息
-    qr_matrix = qr.get_matrix()
+    return qr_raster.RasterPlan(final_img_size, cx - half, cy - half, cx + half, cy + half,
+                                np.full(len(xs), shape), radii, _to_rgba(bg_rgba), color=_to_rgba(rgba_color))
+
+
+def _render_styled_fast(*args):
+    """批量光栅化圆角/圆形样式"""
+    return _styled_plan(*args).render()
+
+
+def _render_classic_legacy(qr_matrix, final_img_size, start_x, start_y, module_size, rgba_color, bg):
+    """逐模块绘制经典样式（原始实现）"""
     matrix_size = len(qr_matrix)
+    classic_img = Image.new("RGBA", final_img_size, bg)
+    draw = ImageDraw.Draw(classic_img)
     
-    # 计算实际需要的图像大小
-    module_size = box_size
-    qr_actual_size = matrix_size * module_size
-    border_size = border * module_size
-    total_qr_size = qr_actual_size + 2 * border_size
-    
-    # 自动调整输出图像大小，确保足够大以容纳二维码
-    if auto_adjust:
-        min_img_size = total_qr_size + 40  # 添加额外的40像素作为边距
-        if img_size[0] < min_img_size or img_size[1] < min_img_size:
-            img_size = (min_img_size, min_img_size)
-    
-    # 创建渐变映射
-    final_img_size = img_size
-    if len(bg_rgb) == 4:
-        gradient_img = Image.new("RGBA", final_img_size, bg_rgb)
-    else:
-        gradient_img = Image.new("RGBA", final_img_size, bg_rgb + (255,))
+    # 添加一个小的间距调整，减少模块间的空白
+    spacing_factor = 0.95  # 减小间距，值越小模块间距越小
     
-    # 计算居中位置的起始坐标
-    start_x = (final_img_size[0] - total_qr_size) // 2 + border_size
-    start_y = (final_img_size[1] - total_qr_size) // 2 + border_size
+    # 遍历二维码矩阵，绘制每个模块
+    for y in range(matrix_size):
+        for x in range(matrix_size):
+            if qr_matrix[y][x]:  # 如果是填充点
+                # 计算模块的中心坐标，调整间距
+                center_x = start_x + x * (module_size * spacing_factor) + module_size // 2
+                center_y = start_y + y * (module_size * spacing_factor) + module_size // 2
+                
+                # 修正：绘制矩形而不是点，确保在任何尺寸下都可见
+                rect_size = max(module_size // 1.2, module_size - 1)
+                draw.rectangle(
+                    [center_x - rect_size//2, center_y - rect_size//2,
+                     center_x + rect_size//2, center_y + rect_size//2],
+                    fill=rgba_color
+                )
+    return classic_img
+
+
+def _classic_plan(qr_matrix, final_img_size, start_x, start_y, module_size, rgba_color, bg):
+    """经典样式的光栅化计划"""
+    matrix = qr_raster.matrix_to_array(qr_matrix)
+    matrix_size = len(matrix)
+    centers_x, centers_y = qr_raster.module_centers(matrix_size, start_x, start_y, module_size)
     
-    # 创建渐变效果
+    ys, xs = np.nonzero(matrix)
+    cx = centers_x[xs]
+    cy = centers_y[ys]
+    half = max(module_size // 1.2, module_size - 1) // 2
+    
+    return qr_raster.RasterPlan(final_img_size, cx - half, cy - half, cx + half, cy + half,
+                                np.full(len(xs), qr_raster.SHAPE_RECTANGLE), np.zeros(len(xs)),
+                                _to_rgba(bg), color=_to_rgba(rgba_color))
+
+
+def _render_classic_fast(*args):
+    """批量光栅化经典样式"""
+    return _classic_plan(*args).render()
+
+
+# 渐变类型："vertical" 按模块行逐行变色（原有效果），其余为整幅颜色场
+GRADIENT_TYPES = ("vertical", "horizontal", "diagonal", "radial")
+
+
+def _parse_gradient_stops(gradient_stops):
+    """
+    解析多色标渐变
+
+    每项可以是颜色（按顺序均匀分布），也可以是 (位置, 颜色) 对，位置范围 0~1。
+    """
+    count = len(gradient_stops)
+    stops = []
+    for i, stop in enumerate(gradient_stops):
+        if isinstance(stop, (tuple, list)) and len(stop) == 2:
+            position, color = stop
+        else:
+            position, color = (i / (count - 1) if count > 1 else 0.0), stop
+        stops.append((float(position), _to_rgba(color)[:3]))
+    return sorted(stops, key=lambda s: s[0])
+
+
+def _render_gradient_legacy(qr_matrix, final_img_size, start_x, start_y, module_size, start_rgb, end_rgb, bg_rgba):
+    """逐模块绘制渐变样式（原始实现）"""
+    matrix_size = len(qr_matrix)
+    gradient_img = Image.new("RGBA", final_img_size, bg_rgba)
     draw = ImageDraw.Draw(gradient_img)
     
     # 修正：调整矩形大小，确保在大型二维码中不会过小
@@ -466,45 +451,610 @@ def generate_gradient_qr(data, output_file="gradient_qrcode.png", start_color="#
                      center_x + rect_size//2, center_y + rect_size//2],
                     fill=(r, g, b)
                 )
+    return gradient_img
+
+
+def _gradient_plan(qr_matrix, final_img_size, start_x, start_y, module_size, start_rgb, end_rgb, bg_rgba,
+                   gradient="vertical", stops=None):
+    """
+    渐变样式的光栅化计划
+
+    颜色由整块数组计算：vertical 按模块行查表（与原实现逐像素一致），
+    其余类型在二维码区域上生成颜色场，再通过模块掩码一次性合成。
+    """
+    matrix = qr_raster.matrix_to_array(qr_matrix)
+    matrix_size = len(matrix)
+    rect_size_factor = max(0.9, min(1.0, 18.0 / matrix_size))
+    centers_x, centers_y = qr_raster.module_centers(matrix_size, start_x, start_y, module_size)
+    
+    ys, xs = np.nonzero(matrix)
+    cx = centers_x[xs]
+    cy = centers_y[ys]
+    half = max(module_size // 1.2, int((module_size - 1) * rect_size_factor)) // 2
+    
+    # 以行号作为标签：重叠处后绘制的行覆盖先绘制的行
+    geometry = (final_img_size, cx - half, cy - half, cx + half, cy + half,
+                np.full(len(xs), qr_raster.SHAPE_RECTANGLE), np.zeros(len(xs)), _to_rgba(bg_rgba))
+    if stops is None:
+        stops = [(0.0, start_rgb), (1.0, end_rgb)]
+    
+    if gradient == "vertical":
+        # 每一行模块一种颜色：位置为 行号 / 矩阵边长
+        row_colors = qr_raster.interpolate_stops(np.arange(matrix_size) / matrix_size, stops)
+        palette = [tuple(c) + (255,) for c in row_colors.tolist()]
+        return qr_raster.RasterPlan(*geometry, palette=palette, labels=ys + 1)
     
-    # 添加Logo（如果提供）
-    logo = None
-    if logo_obj:
-        logo = logo_obj.convert("RGBA")
-    elif logo_path and os.path.exists(logo_path):
-        logo = Image.open(logo_path).convert("RGBA")
+    # 颜色场覆盖整个矩阵区域（含边框模块），与 vertical 的归一化方式一致
+    width, height = final_img_size
+    x0 = max(0, int(np.floor(centers_x[0] - half)))
+    y0 = max(0, int(np.floor(centers_y[0] - half)))
+    x1 = min(width, int(np.floor(centers_x[-1] + half)) + 1)
+    y1 = min(height, int(np.floor(centers_y[-1] + half)) + 1)
+    return qr_raster.RasterPlan(*geometry, labels=ys + 1, field=(gradient, stops, (x0, y0, x1, y1)))
 
-    if logo:
-        try:
-            # 调整Logo大小，不超过二维码的20%（较大数据时需要更小Logo）
-            logo_scale = 5 if data_length < 100 else 6
-            logo_max_size = gradient_img.size[0] // logo_scale
-            logo_size = min(logo.size[0], logo.size[1], logo_max_size)
-            logo = logo.resize((logo_size, logo_size), Image.LANCZOS)
-            
-            # 计算位置使Logo居中
-            pos = ((gradient_img.size[0] - logo.size[0]) // 2, (gradient_img.size[1] - logo.size[1]) // 2)
-            
-            # 创建圆形蒙版
-            mask = Image.new("L", logo.size, 0)
-            draw = ImageDraw.Draw(mask)
-            draw.ellipse((0, 0, logo.size[0], logo.size[1]), fill=255)
-            mask = mask.filter(ImageFilter.GaussianBlur(1))
-            
-            # 将Logo粘贴到二维码上
-            gradient_img.paste(logo, pos, mask)
-        except Exception as e:
-            print(f"添加Logo时出错: {e}")
-
-    # 保存图像
-    if isinstance(output_file, str):
-        gradient_img.save(output_file)
+
+def _render_gradient_fast(*args, **kwargs):
+    """批量光栅化渐变样式"""
+    return _gradient_plan(*args, **kwargs).render()
+
+
+def _logo_overlay(logo, img_size, symbol_size, data_length, scale=1):
+    """
+    缩放后的 Logo、居中位置和圆形蒙版，即 Image.paste 的参数；scale 在默认尺寸上再缩放
+
+    Logo 边长按符号区域（不含边框，symbol_size 像素）计算，与画布大小无关：
+    画布比二维码大时 Logo 不会随之变大而盖住更多模块。
+    """
+    # 调整Logo大小，不超过二维码的20%（较大数据时需要更小Logo）
+    logo_scale = 5 if data_length < 100 else 6
+    logo_max_size = int(symbol_size // logo_scale * scale)
+    # 缩放后的Logo和圆形蒙版按Logo内容和尺寸缓存
+    logo, mask = qr_logo.logo_store.overlay(logo, logo_max_size)
+    
+    # 计算位置使Logo居中
+    pos = ((img_size[0] - logo.size[0]) // 2, (img_size[1] - logo.size[1]) // 2)
+    return logo, pos, mask
+
+
+def _verify_render(mode, timer, qr_img, overlay, tiled, rerender, qr_matrix, border, layout,
+                   logo, data_length, error_correction):
+    """
+    可扫描性自检（见 qr_verify），返回 (图片, 尚未粘贴的 Logo 参数)
+
+    非分块渲染时 Logo 已经粘贴在 qr_img 上；分块渲染时 qr_img 是光栅化计划，
+    Logo 在写出时才粘贴，这里只在取样点上模拟粘贴。adjust 模式下不安全时
+    用 rerender() 重新绘制不含 Logo 的图片，依次换用更小的 Logo，最后去掉 Logo。
+    """
+    pending = overlay if tiled else None
+    centers = layout.centers
+    report = qr_verify.verify(qr_img, qr_matrix, border, centers, pending, error_correction)
+    if report.safe:
+        timer.verified("ok", report.usage)
+        return qr_img, pending
+
+    if mode == "adjust" and overlay is not None:
+        base = qr_img if tiled else rerender()
+        for scale in qr_verify.ADJUST_LOGO_SCALES + (0,):
+            overlay = (_logo_overlay(logo, layout.img_size, layout.symbol_size, data_length, scale)
+                       if scale else None)
+            adjusted = qr_verify.verify(base, qr_matrix, border, centers, overlay, error_correction)
+            if adjusted.safe:
+                print(f"可扫描性自检未通过，Logo 已缩小为原尺寸的 {scale:.0%}: {report}")
+                timer.verified("adjusted", adjusted.usage)
+                if tiled:
+                    return base, overlay
+                if overlay is not None:
+                    base.paste(*overlay)
+                return base, None
+
+    if mode == "report":
+        print(f"可扫描性自检未通过: {report}")
+        timer.verified("unsafe", report.usage)
+        return qr_img, pending
+    timer.verified("rejected", report.usage)
+    raise qr_verify.UnscannableRender(report)
+
+
+# 渲染规格：同一套样式参数渲染多条内容时，颜色、色标、Logo、纠错等级和自检模式只解析一次；
+# 画布布局和光栅化模板按 (矩阵边长, 边框, 模块大小) 缓存，每条内容只需编码矩阵、
+# 取出深色模块、合成和编码输出
+SPEC_CACHE_SIZE = int(os.environ.get("QR_SPEC_CACHE_SIZE", "64"))
+# 规格持有 Logo 原图，按原图像素缓冲区大小限制总量
+SPEC_CACHE_MB = int(os.environ.get("QR_SPEC_CACHE_MB", "64"))
+LAYOUT_CACHE_MB = int(os.environ.get("QR_LAYOUT_CACHE_MB", "64"))
+# 画布超过此像素数时不缓存渐变颜色场（这样的输出通常分块渲染，按条带计算颜色场）
+FIELD_CACHE_PIXELS = 4_000_000
+
+spec_cache = LRUCache(SPEC_CACHE_SIZE, maxbytes=SPEC_CACHE_MB * 1024 * 1024, sizeof=lambda spec: spec.nbytes)
+layout_cache = LRUCache(256, maxbytes=LAYOUT_CACHE_MB * 1024 * 1024, sizeof=lambda layout: layout.nbytes)
+
+
+class _Layout:
+    """渲染规格在给定矩阵边长、边框和模块大小下的画布布局"""
+
+    def __init__(self, spec, matrix_size, border, module_size):
+        # 计算实际需要的图像大小
+        border_size = border * module_size
+        total_qr_size = matrix_size * module_size + 2 * border_size
+        img_size = spec.img_size
+        # 自动调整输出图像大小，确保足够大以容纳二维码
+        if spec.auto_adjust:
+            min_img_size = total_qr_size + 40  # 添加额外的40像素作为边距
+            if img_size[0] < min_img_size or img_size[1] < min_img_size:
+                img_size = (min_img_size, min_img_size)
+        self.img_size = img_size
+        self.module_size = module_size
+        # 符号区域（不含边框）的边长，Logo 按它缩放
+        self.symbol_size = (matrix_size - 2 * border) * module_size
+
+        # 计算居中位置的起始坐标
+        self.start_x = (img_size[0] - total_qr_size) // 2 + border_size
+        self.start_y = (img_size[1] - total_qr_size) // 2 + border_size
+        self.centers = qr_raster.module_centers(matrix_size, self.start_x, self.start_y, module_size)
+
+        # 覆盖全部模块位置的光栅化模板，渲染时按矩阵取出深色模块
+        full = np.ones((matrix_size, matrix_size), dtype=bool)
+        plan = spec.plan_function(*self.args(spec, full), **spec.plan_options)
+        cache_field = img_size[0] * img_size[1] <= FIELD_CACHE_PIXELS
+        self.template = qr_raster.PlanTemplate(plan, cache_field=cache_field)
+        # Logo 参数按内容长度档位（见 _logo_overlay）缓存
+        self.overlays = {}
+
+    def args(self, spec, qr_matrix):
+        """逐模块绘制函数和光栅化计划函数的位置参数"""
+        return spec.arguments(qr_matrix, self.img_size, self.start_x, self.start_y, self.module_size)
+
+    def overlay(self, logo, data_length):
+        """默认尺寸的 Logo 参数"""
+        key = data_length < 100
+        overlay = self.overlays.get(key)
+        if overlay is None:
+            overlay = self.overlays[key] = _logo_overlay(logo, self.img_size, self.symbol_size, data_length)
+        return overlay
+
+    @property
+    def nbytes(self):
+        return self.template.nbytes + self.centers[0].nbytes + self.centers[1].nbytes
+
+
+def _parse_hex(color):
+    """把 "#RRGGBB" 转为 RGB 元组"""
+    color = color.lstrip('#')
+    return tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
+
+
+def _freeze(value):
+    """把列表（可嵌套）转为元组，用作缓存键"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class RenderSpec:
+    """
+    编译后的渲染规格：一套样式参数，可渲染任意多条内容
+
+    构造时校验参数，解析颜色和色标，选定纠错等级和自检模式；画布布局和光栅化模板
+    （含定位图形判断、模块几何、形状分组和渐变颜色场）按 (矩阵边长, 边框, 模块大小)
+    缓存在 layout_cache 中，不同内容只要矩阵边长相同就共用。render() 的输出与
+    generate_styled_qr_code / generate_gradient_qr 相同，两者即通过 render_spec 复用规格。
+
+    参数:
+        kind: "styled"（圆角/圆形/经典样式）或 "gradient"（渐变色）
+        logo: 已解析的 qr_logo.Logo，或 None
+        其余参数同 generate_styled_qr_code / generate_gradient_qr，只对相应 kind 生效
+    """
+
+    def __init__(self, kind="styled", style="rounded", color="#000000", bg_color="#FFFFFF",
+                 start_color="#1E88E5", end_color="#8BC34A", gradient="vertical", gradient_stops=None,
+                 box_size=12, border=4, img_size=(350, 350), auto_adjust=True, logo=None, engine=None,
+                 image_format=None, encode_preset=None, tiled=None, verify=None, ecc=None):
+        if kind not in ("styled", "gradient"):
+            raise ValueError(f"不支持的渲染类型: {kind}")
+        if kind == "gradient" and gradient not in GRADIENT_TYPES:
+            raise ValueError(f"不支持的渐变类型: {gradient}")
+        self.kind = kind
+        self.style = style
+        self.gradient = gradient
+        self.box_size = box_size
+        self.border = border
+        self.img_size = tuple(img_size)
+        self.auto_adjust = auto_adjust
+        self.logo = logo
+        self.engine = engine
+        self.image_format = image_format
+        self.encode_preset = encode_preset
+        self.tiled = tiled
+        self.verify = qr_verify.resolve_mode(verify)
+        # Logo 决定纠错等级
+        self.error_correction = choose_error_correction(bool(logo), ecc)
+        self.plan_options = {}
+
+        if kind == "gradient":
+            self.start_rgb = _parse_hex(start_color)
+            self.end_rgb = _parse_hex(end_color)
+            bg_rgb = (0, 0, 0, 0) if bg_color == "transparent" else _parse_hex(bg_color)
+            self.background = bg_rgb if len(bg_rgb) == 4 else bg_rgb + (255,)
+            stops = _parse_gradient_stops(gradient_stops) if gradient_stops else None
+            self.plan_options = {"gradient": gradient, "stops": stops}
+            self.plan_function = _gradient_plan
+            self.fast, self.legacy = _render_gradient_fast, _render_gradient_legacy
+            # 其他渐变类型和多色标只有批量光栅化实现
+            self.fast_only = gradient != "vertical" or gradient_stops is not None
+            colors = (start_color, end_color, bg_color, gradient, _freeze(gradient_stops))
+        else:
+            if color.startswith('#'):
+                self.color = tuple(int(color[i:i+2], 16) for i in (1, 3, 5)) + (255,)
+            else:
+                self.color = color
+            if style == "rounded" or style == "circle":
+                if bg_color == "transparent":
+                    self.background = (0, 0, 0, 0)
+                elif bg_color.upper() == "#FFFFFF":
+                    self.background = (255, 255, 255, 255)
+                else:
+                    self.background = tuple(int(bg_color[i:i+2], 16) for i in (1, 3, 5)) + (255,)
+                self.plan_function = _styled_plan
+                self.fast, self.legacy = _render_styled_fast, _render_styled_legacy
+            else:
+                # 经典样式 - 直接使用指定颜色
+                self.background = (0, 0, 0, 0) if bg_color == "transparent" else bg_color
+                self.plan_function = _classic_plan
+                self.fast, self.legacy = _render_classic_fast, _render_classic_legacy
+            self.fast_only = False
+            colors = (style, color, bg_color)
+        # 决定画布布局的参数（输出格式、引擎、自检等不影响布局）
+        self.key = (kind,) + colors + (box_size, border, self.img_size, auto_adjust,
+                                       logo.digest if logo else None)
+
+    @property
+    def nbytes(self):
+        """Logo 原图按 RGBA 估算的字节数"""
+        if not self.logo:
+            return 0
+        width, height = self.logo.size
+        return width * height * 4
+
+    def arguments(self, qr_matrix, img_size, start_x, start_y, module_size):
+        """逐模块绘制函数和光栅化计划函数的位置参数"""
+        geometry = (img_size, start_x, start_y, module_size)
+        if self.kind == "gradient":
+            return (qr_matrix,) + geometry + (self.start_rgb, self.end_rgb, self.background)
+        if self.plan_function is _styled_plan:
+            return (qr_matrix, self.style) + geometry + (self.color, self.background)
+        return (qr_matrix,) + geometry + (self.color, self.background)
+
+    def layout(self, matrix_size, border, module_size):
+        """取得（必要时构建）画布布局"""
+        key = self.key + (matrix_size, border, module_size)
+        return layout_cache.get_or_create(key, lambda: _Layout(self, matrix_size, border, module_size))
+
+    def render(self, data, output_file):
+        """
+        渲染一条内容并写入 output_file（文件名或文件对象），返回 output_file
+
+        reject/adjust 自检模式下无法补救时抛出 qr_verify.UnscannableRender。
+        """
+        border, box_size = self.border, self.box_size
+        # 根据数据长度自动调整参数
+        if self.auto_adjust:
+            # 长链接需要更多空间：边框缓慢增大，盒子大小缓慢减小但保持足够明显
+            border = max(border, max(4, 4 + (len(data) // 300)))
+            box_size = max(10, box_size - (len(data) // 300))
+
+        # 生成QR码（编码结果由 qr_matrix 模块缓存）
+        timer = qr_metrics.stage_timer(self.kind)
+        qr_matrix = get_matrix(
+            data,
+            border=border,
+            version=1,  # 按分段后的比特数选择能容纳的最小版本
+            error_correction=self.error_correction,
+        )
+        timer.lap("matrix")
+        matrix_size = len(qr_matrix)
+
+        layout = self.layout(matrix_size, border, box_size)
+        image_format = qr_encode.resolve_format(output_file, self.image_format)
+        tiled = qr_tiled.should_tile(self.tiled, layout.img_size, image_format)
+        plan = layout.template.select(qr_matrix)
+        # 分块渲染时这里只生成光栅化计划，写出时才逐条带绘制
+        if tiled:
+            qr_img = plan
+        elif self.fast_only or (self.engine or RENDER_ENGINE) not in ("legacy", "compare"):
+            qr_img = plan.render()
+        else:
+            qr_img = _run_engine(self.engine, self.fast, self.legacy, layout.args(self, qr_matrix))
+        timer.lap("render")
+
+        # 添加Logo（如果提供）
+        overlay = None
+        if self.logo:
+            try:
+                overlay = layout.overlay(self.logo, len(data))
+                # 将Logo粘贴到二维码上（分块渲染时在写出每个条带时粘贴）
+                if not tiled:
+                    qr_img.paste(*overlay)
+            except Exception as e:
+                print(f"添加Logo时出错: {e}")
+            timer.lap("logo")
+
+        # 可扫描性自检（见 qr_verify），adjust 模式下可能换用更小的 Logo
+        if self.verify != "off":
+            qr_img, overlay = _verify_render(self.verify, timer, qr_img, overlay, tiled, plan.render,
+                                             qr_matrix, border, layout, self.logo, len(data),
+                                             self.error_correction)
+            timer.lap("verify")
+
+        # 编码并保存（可无损转换为调色板/灰度模式，见 qr_encode）
+        # 分块渲染时光栅化与编码交替进行，两者的耗时都计入 encode 阶段
+        if tiled:
+            qr_tiled.write_tiled(qr_img, output_file, image_format, overlay, self.encode_preset)
+        else:
+            qr_encode.save_image(qr_img, output_file, image_format, self.encode_preset)
+        timer.lap("encode")
+        timer.done(self.gradient if self.kind == "gradient" else self.style, image_format.lower(), matrix_size)
+        return output_file
+
+
+def render_spec(kind, logo_obj=None, logo_path=None, **options):
+    """
+    取得渲染规格，按参数缓存在 spec_cache 中
+
+    参数同 RenderSpec，Logo 用 logo_obj（qr_logo.Logo 或 PIL 图片）或 logo_path 指定。
+    """
+    logo = qr_logo.resolve(logo_obj, logo_path)
+    key = (kind, logo.digest if logo else None) + tuple(sorted((k, _freeze(v)) for k, v in options.items()))
+    return spec_cache.get_or_create(key, lambda: RenderSpec(kind, logo=logo, **options))
+
+
+def generate_styled_qr_code(data, output_file="styled_qrcode.png", logo_path=None, logo_obj=None,
+                           color="#000000", bg_color="#FFFFFF", box_size=12, 
+                           border=4, style="rounded", img_size=(350, 350), auto_adjust=True,
+                           engine=None, image_format=None, encode_preset=None, tiled=None, verify=None,
+                           ecc=None):
+    """
+    生成美化的二维码
+    
+    参数:
+        data: 要编码的数据
+        output_file: 输出文件名
+        logo_path: 可选的居中logo图片路径
+        color: 二维码颜色
+        bg_color: 背景颜色
+        box_size: 二维码方块大小
+        border: 边界大小
+        style: 样式 ("rounded", "circle", "classic")
+        img_size: 最终输出图片的大小 (宽, 高)
+        auto_adjust: 是否根据数据长度自动调整参数
+        engine: 光栅化引擎 ("numpy", "legacy", "compare")，默认取 QR_RENDER_ENGINE 环境变量
+        image_format: 输出格式 ("PNG", "WEBP", "TIFF")，默认按文件扩展名判断，文件对象为 PNG
+        encode_preset: 编码预设 ("fast", "balanced", "small")，默认取 QR_ENCODE_PRESET 环境变量
+        tiled: 是否分块渲染并流式写出（只支持 PNG/TIFF，忽略 engine），
+               默认对超过 QR_TILE_PIXELS 像素的输出自动启用，见 qr_tiled
+        verify: 可扫描性自检 ("off", "report", "reject", "adjust")，默认取 QR_VERIFY 环境变量，
+                见 qr_verify；reject/adjust 模式下无法补救时抛出 qr_verify.UnscannableRender
+        ecc: 纠错等级策略 ("auto", "L", "M", "Q", "H")，默认取 QR_ECC 环境变量；
+             auto 只在有 Logo 时使用 H，否则使用 M
+    """
+    spec = render_spec("styled", logo_obj=logo_obj, logo_path=logo_path, style=style, color=color,
+                       bg_color=bg_color, box_size=box_size, border=border, img_size=img_size,
+                       auto_adjust=auto_adjust, engine=engine, image_format=image_format,
+                       encode_preset=encode_preset, tiled=tiled, verify=verify, ecc=ecc)
+    return spec.render(data, output_file)
+
+
+def generate_gradient_qr(data, output_file="gradient_qrcode.png", start_color="#1E88E5", 
+                         end_color="#8BC34A", bg_color="#FFFFFF", box_size=12, 
+                         border=4, img_size=(350, 350), auto_adjust=True, logo_obj=None, logo_path=None,
+                         engine=None, gradient="vertical", gradient_stops=None,
+                         image_format=None, encode_preset=None, tiled=None, verify=None, ecc=None):
+    """
+    生成渐变色二维码
+    
+    参数:
+        data: 要编码的数据
+        output_file: 输出文件名
+        start_color: 渐变起始颜色
+        end_color: 渐变结束颜色
+        bg_color: 背景颜色
+        box_size: 二维码方块大小
+        border: 边界大小
+        img_size: 最终输出图片的大小 (宽, 高)
+        auto_adjust: 是否根据数据长度自动调整参数
+        engine: 光栅化引擎 ("numpy", "legacy", "compare")，默认取 QR_RENDER_ENGINE 环境变量
+        gradient: 渐变类型 ("vertical", "horizontal", "diagonal", "radial")
+        gradient_stops: 可选的多色标，颜色列表或 (位置, 颜色) 列表，提供时忽略 start_color/end_color
+        image_format: 输出格式 ("PNG", "WEBP", "TIFF")，默认按文件扩展名判断，文件对象为 PNG
+        encode_preset: 编码预设 ("fast", "balanced", "small")，默认取 QR_ENCODE_PRESET 环境变量
+        tiled: 是否分块渲染并流式写出（只支持 PNG/TIFF，忽略 engine），
+               默认对超过 QR_TILE_PIXELS 像素的输出自动启用，见 qr_tiled
+        verify: 可扫描性自检 ("off", "report", "reject", "adjust")，默认取 QR_VERIFY 环境变量，
+                见 qr_verify；reject/adjust 模式下无法补救时抛出 qr_verify.UnscannableRender
+        ecc: 纠错等级策略 ("auto", "L", "M", "Q", "H")，默认取 QR_ECC 环境变量；
+             auto 只在有 Logo 时使用 H，否则使用 M
+    """
+    spec = render_spec("gradient", logo_obj=logo_obj, logo_path=logo_path, start_color=start_color,
+                       end_color=end_color, bg_color=bg_color, box_size=box_size, border=border,
+                       img_size=img_size, auto_adjust=auto_adjust, engine=engine, gradient=gradient,
+                       gradient_stops=gradient_stops, image_format=image_format,
+                       encode_preset=encode_preset, tiled=tiled, verify=verify, ecc=ecc)
+    return spec.render(data, output_file)
+
+# 命令行批量模式
+# CSV 中可按行覆盖的列
+CLI_OVERRIDE_COLUMNS = ("style", "color", "bg_color", "start_color", "end_color", "gradient", "size", "format", "name")
+
+# 工作进程内的 Logo（在进程初始化时加载一次）
+_cli_logo = None
+
+
+def _init_cli_worker(logo_path):
+    """工作进程初始化：只加载一次 Logo，避免逐条重复解码"""
+    global _cli_logo
+    if logo_path:
+        _cli_logo = qr_logo.Logo.from_path(logo_path)
+
+
+def render_to_file(data, output_file, fmt="png", style="rounded", color="#000000", bg_color="#FFFFFF",
+                   start_color="#1E88E5", end_color="#8BC34A", size=350, logo_obj=None, compact_svg=True,
+                   gradient="vertical", encode_preset=None, verify=None, ecc=None):
+    """
+    按格式和样式选择生成函数，写入 output_file（fmt 为 "png"、"webp"、"tiff" 或 "svg"）
+
+    verify 只作用于位图输出，SVG 不做可扫描性自检。
+    """
+    image_format = fmt.upper()
+    if fmt == "svg":
+        generate_svg_qr_code(data, output_file=output_file, color=color, bg_color=bg_color,
+                             style=style, box_size=max(10, size // 25), logo_obj=logo_obj,
+                             compact=compact_svg, ecc=ecc)
+    elif style == "gradient":
+        generate_gradient_qr(data, output_file=output_file, start_color=start_color, end_color=end_color,
+                             bg_color=bg_color, img_size=(size, size), logo_obj=logo_obj, gradient=gradient,
+                             image_format=image_format, encode_preset=encode_preset, verify=verify, ecc=ecc)
     else:
-        gradient_img.save(output_file, format='PNG')
-    return output_file
+        generate_styled_qr_code(data, output_file=output_file, style=style, color=color,
+                                bg_color=bg_color, img_size=(size, size), logo_obj=logo_obj,
+                                image_format=image_format, encode_preset=encode_preset, verify=verify,
+                                ecc=ecc)
 
-# 使用示例
-if __name__ == "__main__":
+
+def _render_cli_task(task):
+    """工作进程：渲染一条记录，返回 (序号, 耗时, 错误信息)"""
+    index, data, options, path = task
+    start = time.perf_counter()
+    try:
+        options = dict(options, size=int(options["size"]))
+        render_to_file(data, path, logo_obj=_cli_logo, **options)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return index, time.perf_counter() - start, error
+
+
+def read_cli_records(stream, use_csv):
+    """
+    逐条读取输入记录
+
+    纯文本每行一条内容；CSV 需要 data 列，其余列名见 CLI_OVERRIDE_COLUMNS。
+    """
+    if not use_csv:
+        for line in stream:
+            line = line.rstrip("\r\n")
+            if line.strip():
+                yield {"data": line}
+        return
+    for row in csv.DictReader(stream):
+        if row.get("data"):
+            yield {k: v for k, v in row.items() if k and v not in (None, "")}
+
+
+def _cli_tasks(records, args, used_names):
+    """把输入记录转换为渲染任务（合并命令行默认值与逐行覆盖）"""
+    for index, record in enumerate(records):
+        options = {
+            "fmt": record.get("format", args.format),
+            "style": record.get("style", args.style),
+            "color": record.get("color", args.color),
+            "bg_color": record.get("bg_color", args.bg_color),
+            "start_color": record.get("start_color", args.start_color),
+            "end_color": record.get("end_color", args.end_color),
+            "gradient": record.get("gradient", args.gradient),
+            "size": record.get("size", args.size),
+            "compact_svg": not args.verbose_svg,
+            "encode_preset": args.encode_preset,
+            "verify": args.verify,
+            "ecc": args.ecc,
+        }
+        name = args.name_template.format(
+            index=index + 1,
+            name=record.get("name", f"{index + 1:06d}"),
+            style=options["style"],
+            hash=hashlib.sha1(record["data"].encode("utf-8")).hexdigest()[:12],
+            ext=options["fmt"],
+        )
+        name = os.path.basename(name)
+        if name in used_names:
+            root, ext = os.path.splitext(name)
+            name = f"{root}-{index + 1}{ext}"
+        used_names.add(name)
+        yield index, record["data"], options, os.path.join(args.output_dir, name)
+
+
+def run_cli(argv=None):
+    """命令行批量生成入口"""
+    parser = argparse.ArgumentParser(description="批量生成美化二维码")
+    parser.add_argument("-i", "--input", required=True, help="输入文件，每行一条内容或 CSV；'-' 表示标准输入")
+    parser.add_argument("-o", "--output-dir", default="qrcodes", help="输出目录")
+    parser.add_argument("--csv", action="store_true", help="按 CSV 解析输入（.csv 文件自动识别）")
+    parser.add_argument("--name-template", default="{index:06d}.{ext}",
+                        help="文件名模板，可用字段: index, name, style, hash, ext")
+    parser.add_argument("--format", default="png", choices=("png", "webp", "tiff", "svg"))
+    parser.add_argument("--encode-preset", choices=tuple(qr_encode.ENCODE_PRESETS), help="PNG/WebP 编码预设")
+    parser.add_argument("--style", default="rounded", choices=("rounded", "circle", "classic", "gradient"))
+    parser.add_argument("--color", default="#000000")
+    parser.add_argument("--bg-color", default="#FFFFFF")
+    parser.add_argument("--start-color", default="#1E88E5")
+    parser.add_argument("--end-color", default="#8BC34A")
+    parser.add_argument("--gradient", default="vertical", choices=GRADIENT_TYPES, help="渐变类型（gradient 样式）")
+    parser.add_argument("--size", type=int, default=350)
+    parser.add_argument("--logo", help="Logo 图片路径")
+    parser.add_argument("--verify", choices=qr_verify.VERIFY_MODES,
+                        help="可扫描性自检模式（默认取 QR_VERIFY 环境变量），reject/adjust 下未通过的条目计为失败")
+    parser.add_argument("--ecc", choices=("auto", "L", "M", "Q", "H"),
+                        help="纠错等级策略（默认取 QR_ECC 环境变量），auto 只在有 Logo 时使用 H")
+    parser.add_argument("--verbose-svg", action="store_true", help="SVG 中每个模块输出一个元素（默认合并为单个 path）")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("--chunksize", type=int, default=32, help="每次分发给工作进程的条目数")
+    parser.add_argument("--progress-interval", type=float, default=2.0, help="进度输出间隔（秒）")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    use_csv = args.csv or args.input.lower().endswith(".csv")
+    stream = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+
+    durations = []
+    failures = []
+    start = last_report = time.perf_counter()
+    try:
+        tasks = _cli_tasks(read_cli_records(stream, use_csv), args, set())
+        if args.workers > 1:
+            pool = multiprocessing.Pool(args.workers, initializer=_init_cli_worker, initargs=(args.logo,))
+            results = pool.imap_unordered(_render_cli_task, tasks, chunksize=args.chunksize)
+        else:
+            pool = None
+            _init_cli_worker(args.logo)
+            results = map(_render_cli_task, tasks)
+
+        for index, elapsed, error in results:
+            durations.append(elapsed)
+            if error:
+                failures.append((index, error))
+            now = time.perf_counter()
+            if now - last_report >= args.progress_interval:
+                last_report = now
+                print(f"已完成 {len(durations)} 条, {len(durations) / (now - start):.1f} 条/秒", file=sys.stderr)
+        if pool:
+            pool.close()
+            pool.join()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    total_time = time.perf_counter() - start
+    for index, error in sorted(failures):
+        print(f"第 {index + 1} 条生成失败: {error}", file=sys.stderr)
+    if durations:
+        p50, p99 = np.percentile(durations, [50, 99]) * 1000
+        print(f"共 {len(durations)} 条，失败 {len(failures)} 条，耗时 {total_time:.2f} 秒，"
+              f"{len(durations) / total_time:.1f} 条/秒，单条 p50 {p50:.1f} ms / p99 {p99:.1f} ms")
+    else:
+        print("没有读取到任何内容")
+    return 1 if failures else 0
+
+
+def _generate_demo():
+    """生成示例二维码"""
     print("正在生成美化二维码...")
     
     # 测试链接，包括短链接和长链接
@@ -558,4 +1108,10 @@ if __name__ == "__main__":
     )
     print("橙色圆形二维码已生成: orange_circle_qrcode.png")
     
-    print("所有二维码生成完成!") 
\ No newline at end of file
+    print("所有二维码生成完成!") 
+
+# 使用示例
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli())
+    _generate_demo()
@@ -0,0 +1,207 @@
+"""
+Logo 预处理缓存
+
+每次带 Logo 的生成都要解码图片、转换为 RGBA、LANCZOS 缩放，并重新绘制
+高斯模糊的圆形蒙版；SVG 还要把 Logo 重新编码为 PNG 再转 base64。
+实际流量中反复出现的通常只是少数几个品牌 Logo，这里按图片内容的哈希
+缓存这些处理结果，同一个 Logo 只解码、缩放和模糊一次。
+
+上传的 Logo 在解码前先检查字节数、格式和声明的像素数（拒绝解压炸弹），
+JPEG 用 draft 模式直接按 1/2、1/4、1/8 缩小解码，因此无论上传多大的照片，
+单次处理的内存都有固定上限。
+"""
+import base64
+import hashlib
+import io
+import math
+import os
+import threading
+import warnings
+
+from PIL import Image, ImageDraw, ImageFilter, JpegImagePlugin
+
+from qr_cache import LRUCache
+
+# 上传限制
+MAX_BYTES = int(os.environ.get("QR_LOGO_MAX_BYTES", 20 * 1024 * 1024))
+# 图片头中声明的像素数上限，超出即视为解压炸弹
+MAX_PIXELS = int(os.environ.get("QR_LOGO_MAX_PIXELS", 50_000_000))
+# 实际解码的像素数上限（JPEG 按 draft 缩小后计算，其他格式即原始尺寸）
+MAX_DECODE_PIXELS = int(os.environ.get("QR_LOGO_MAX_DECODE_PIXELS", 2048 * 2048))
+# JPEG 缩小解码的目标边长；draft 只能按 2 的幂缩小，解码结果的最长边在 [MAX_EDGE, 2 * MAX_EDGE) 内，
+# 默认值保证任何 JPEG 解码后都不超过 MAX_DECODE_PIXELS（Logo 最终只占输出的 1/5 左右）
+MAX_EDGE = int(os.environ.get("QR_LOGO_MAX_EDGE", 1024))
+ALLOWED_FORMATS = ("PNG", "JPEG", "GIF", "WEBP", "BMP")
+
+
+class LogoRejected(ValueError):
+    """Logo 无法识别或超出像素限制"""
+
+
+class LogoTooLarge(LogoRejected):
+    """Logo 文件超出字节数限制"""
+
+
+def open_limited(data):
+    """
+    按上传限制打开 Logo，只读取图片头
+
+    JPEG 会被设置为按需缩小解码（最长边不小于 MAX_EDGE），像素数据在第一次使用时才解码。
+    超出限制或无法识别时抛出 LogoRejected。
+    """
+    if len(data) > MAX_BYTES:
+        raise LogoTooLarge(f"Logo 文件超过 {MAX_BYTES // 1024} KB")
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            image = Image.open(io.BytesIO(data), formats=ALLOWED_FORMATS)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise LogoRejected("Logo 像素数过大") from None
+    except (OSError, SyntaxError, ValueError):
+        raise LogoRejected("无法识别的 Logo 图片") from None
+
+    width, height = image.size
+    if width * height > MAX_PIXELS:
+        raise LogoRejected(f"Logo 像素数过大 ({width}x{height})")
+    if isinstance(image, JpegImagePlugin.JpegImageFile) and max(width, height) > MAX_EDGE:
+        scale = MAX_EDGE / max(width, height)
+        image.draft(image.mode, (math.ceil(width * scale), math.ceil(height * scale)))
+    if image.size[0] * image.size[1] > MAX_DECODE_PIXELS:
+        raise LogoRejected(f"Logo 分辨率过高 ({width}x{height})")
+    return image
+
+
+class Logo:
+    """
+    按内容寻址的 Logo
+
+    digest 唯一标识图片内容；image 只在缓存未命中时才会被用到（并解码）。
+    缓存的渲染规格持有同一个 Logo，多个渲染线程可能同时第一次访问 image，
+    而 PIL 的 load() 不是线程安全的，所以解码在锁内完成，之后只读取已解码的图片。
+    """
+
+    def __init__(self, digest, image):
+        self.digest = digest
+        self._image = image
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def image(self):
+        """解码后的图片（第一次访问时解码）"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._image.load()
+                    self._loaded = True
+        return self._image
+
+    @property
+    def size(self):
+        # 图片头中已有尺寸，无需解码
+        return self._image.size
+
+    def __reduce__(self):
+        # 锁不能序列化；传给进程池时发送解码后的图片
+        return type(self), (self.digest, self.image)
+
+    @classmethod
+    def from_bytes(cls, data, digest=None):
+        """从上传的字节创建；只读取图片头并检查上传限制，像素数据按需解码"""
+        image = open_limited(data)
+        return cls(digest or hashlib.sha256(data).hexdigest(), image)
+
+    @classmethod
+    def from_path(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    @classmethod
+    def from_image(cls, image):
+        """从已打开的 PIL 图片创建，按像素内容计算哈希"""
+        h = hashlib.sha256(f"{image.mode}:{image.size}:".encode())
+        h.update(image.tobytes())
+        return cls(h.hexdigest(), image)
+
+
+def resolve(logo_obj=None, logo_path=None):
+    """把生成函数的 logo_obj / logo_path 参数统一为 Logo，没有 Logo 时返回 None"""
+    if logo_obj:
+        return logo_obj if isinstance(logo_obj, Logo) else Logo.from_image(logo_obj)
+    if logo_path and os.path.exists(logo_path):
+        return Logo.from_path(logo_path)
+    return None
+
+
+def _image_bytes(value):
+    if isinstance(value, str):
+        return len(value)
+    image, mask = value
+    return len(image.getbands()) * image.width * image.height + mask.width * mask.height
+
+
+class LogoStore:
+    """
+    Logo 处理结果缓存
+
+    参数:
+        maxsize: 最多缓存的条目数
+        maxbytes: 缓存占用的内存上限（按像素缓冲区大小估算）
+    """
+
+    def __init__(self, maxsize=256, maxbytes=64 * 1024 * 1024):
+        self.cache = LRUCache(maxsize, maxbytes=maxbytes, sizeof=_image_bytes)
+
+    def overlay(self, logo, max_size):
+        """
+        获取缩放后的 RGBA Logo 和圆形蒙版
+
+        边长为 min(宽, 高, max_size)，与原有的逐次处理结果一致。
+        """
+        logo_size = min(logo.size[0], logo.size[1], max_size)
+        key = ("overlay", logo.digest, logo_size)
+
+        def build():
+            image = logo.image.convert("RGBA").resize((logo_size, logo_size), Image.LANCZOS)
+            # 创建圆形蒙版
+            mask = Image.new("L", image.size, 0)
+            draw = ImageDraw.Draw(mask)
+            draw.ellipse((0, 0, image.size[0], image.size[1]), fill=255)
+            mask = mask.filter(ImageFilter.GaussianBlur(1))
+            return image, mask
+
+        return self.cache.get_or_create(key, build)
+
+    def preview(self, logo, size, colors=64):
+        """
+        获取预览用的 Logo 和蒙版：最近邻缩放到 size × size，硬边圆形蒙版，不做模糊
+
+        Logo 量化为最多 colors 种颜色的调色板图像（调色板为 RGBA），预览直接把调色板下标
+        写进自己的调色板图像，不必转换为 RGBA 再合成。
+        """
+        def build():
+            image = logo.image.convert("RGBA").resize((size, size), Image.NEAREST)
+            image = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+            mask = Image.new("L", image.size, 0)
+            ImageDraw.Draw(mask).ellipse((0, 0, size, size), fill=255)
+            return image, mask
+
+        return self.cache.get_or_create(("preview", logo.digest, size, colors), build)
+
+    def png_base64(self, logo):
+        """获取 Logo 的 PNG base64 编码（用于 SVG 内嵌）"""
+        def build():
+            buffered = io.BytesIO()
+            logo.image.save(buffered, format="PNG")
+            return base64.b64encode(buffered.getvalue()).decode()
+
+        return self.cache.get_or_create(("png_base64", logo.digest), build)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+logo_store = LogoStore(
+    maxsize=int(os.environ.get("QR_LOGO_CACHE_SIZE", "256")),
+    maxbytes=int(os.environ.get("QR_LOGO_CACHE_MB", "64")) * 1024 * 1024,
+)
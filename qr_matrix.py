@@ -0,0 +1,226 @@
+"""
+二维码矩阵编码与缓存
+
+数据编码、Reed-Solomon 纠错计算和 8 种掩码的罚分评估是每次生成中最重的一步。
+同一内容经常以不同样式、颜色或格式重复生成，这里把编码结果（不含边框）按
+(内容, 纠错等级, 起始版本) 缓存在进程级 LRU 缓存中，以位压缩形式存储。
+
+数据按最优的数字/字母数字/字节模式分段，版本取容量表中能容纳的最小值（见
+qr_segments）；纠错等级由 choose_error_correction 按装饰方式选择。矩阵默认由
+qr_builder 的向量化实现构建，结果与 qrcode 库相同。
+"""
+import base64
+import functools
+import os
+
+import numpy as np
+import qrcode
+import qrcode.util
+
+import qr_builder
+import qr_segments
+from qr_cache import LRUCache
+
+# 编码结果缓存，值为 (边长, 位压缩后的模块数据)
+matrix_cache = LRUCache(int(os.environ.get("QR_MATRIX_CACHE_SIZE", "1024")))
+
+ECC_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# 矩阵构建后端: "numpy" 为 qr_builder 的向量化实现，"qrcode" 为 qrcode 库，
+# "compare" 同时运行两者并逐模块比对（结果以 qrcode 库为准）
+MATRIX_BACKEND = os.environ.get("QR_MATRIX_BACKEND", "numpy")
+
+# 纠错等级策略：auto 时只有 Logo 遮挡中心才用 H（约 30% 可恢复），否则用 M（约 15%）；
+# 设为 L/M/Q/H 时固定使用该等级
+ECC_POLICY = os.environ.get("QR_ECC", "auto")
+
+
+def choose_error_correction(has_logo, policy=None):
+    """
+    按装饰方式选择纠错等级
+
+    参数:
+        has_logo: 是否在中心覆盖 Logo
+        policy: "auto" 或 "L"/"M"/"Q"/"H"，默认取 QR_ECC 环境变量
+    """
+    policy = (policy or ECC_POLICY).upper()
+    if policy == "AUTO":
+        return ECC_LEVELS["H" if has_logo else "M"]
+    if policy not in ECC_LEVELS:
+        raise ValueError(f"不支持的纠错等级策略: {policy}")
+    return ECC_LEVELS[policy]
+
+
+def _build_qrcode(version, error_correction, data_list):
+    """用 qrcode 库构建矩阵"""
+    qr = qrcode.QRCode(
+        version=version,
+        error_correction=error_correction,
+        border=0,
+    )
+    for item in data_list:
+        qr.add_data(item)
+    qr.make(fit=False)
+    return np.asarray(qr.get_matrix(), dtype=bool)
+
+
+def _encode(data, version, error_correction, backend=None):
+    """按最优分段编码，返回不含边框的布尔数组"""
+    version, segments = qr_segments.fit(data, error_correction, version)
+    data_list = [qrcode.util.QRData(text, mode=mode) for mode, text in segments]
+    backend = backend or MATRIX_BACKEND
+    if backend == "qrcode":
+        return _build_qrcode(version, error_correction, data_list)
+    if backend == "compare":
+        expected = _build_qrcode(version, error_correction, data_list)
+        actual = qr_builder.build(version, error_correction, data_list)
+        if not np.array_equal(expected, actual):
+            print(f"矩阵构建结果不一致: 版本 {version} 有 {int((expected != actual).sum())} 个模块不同")
+        return expected
+    return qr_builder.build(version, error_correction, data_list)
+
+
+def encode_matrix(data, version=1, error_correction=qrcode.constants.ERROR_CORRECT_H):
+    """
+    获取二维码模块矩阵（不含边框），结果会被缓存
+
+    参数:
+        data: 要编码的数据
+        version: 最小版本，实际版本是不小于它且能容纳数据的最小版本
+        error_correction: 纠错等级
+
+    返回:
+        (边长, 边长) 的布尔数组
+    """
+    size, packed = packed_matrix(data, version, error_correction)
+    return np.unpackbits(packed, count=size * size).reshape(size, size).astype(bool)
+
+
+def packed_matrix(data, version=1, error_correction=qrcode.constants.ERROR_CORRECT_H):
+    """
+    缓存中的位压缩矩阵（不含边框），参数同 encode_matrix
+
+    返回:
+        (边长, uint8 数组)：模块按行优先、每字节高位在前排列，最后一个字节不足 8 位时补 0；
+        数组与缓存共享，调用方不得修改
+    """
+    key = (data, error_correction, version)
+    entry = matrix_cache.get(key)
+    if entry is None:
+        modules = _encode(data, version, error_correction)
+        entry = (len(modules), np.packbits(modules))
+        matrix_cache.put(key, entry)
+    return entry
+
+
+def get_matrix(data, border=4, version=1, error_correction=qrcode.constants.ERROR_CORRECT_H):
+    """
+    获取带边框的二维码矩阵，与 qr.get_matrix() 的结果一致
+
+    参数:
+        data: 要编码的数据
+        border: 边框模块数
+        version: 最小版本
+        error_correction: 纠错等级
+
+    返回:
+        (边长 + 2 * border, 边长 + 2 * border) 的布尔数组
+    """
+    modules = encode_matrix(data, version, error_correction)
+    if border:
+        modules = np.pad(modules, border, constant_values=False)
+    return modules
+
+
+# 模块角色：功能图形之外的都是数据模块（含纠错码字和剩余位）
+ROLE_DATA = 0
+ROLE_FINDER = 1  # 定位图形及其分隔符
+ROLE_TIMING = 2
+ROLE_ALIGNMENT = 3
+ROLE_FORMAT = 4  # 格式信息及固定的深色模块
+ROLE_VERSION = 5  # 版本信息（版本 7 起）
+
+
+def symbol_version(size):
+    """由不含边框的边长得到版本号"""
+    version, rest = divmod(size - 17, 4)
+    if rest or not 1 <= version <= 40:
+        raise ValueError(f"不是合法的二维码边长: {size}")
+    return version
+
+
+@functools.lru_cache(maxsize=40)
+def module_roles(version):
+    """
+    各模块的角色（不含边框），与 qrcode 库绘制功能图形的位置一致
+
+    返回只读的 (边长, 边长) uint8 数组，取值为 ROLE_* 常量。
+    """
+    n = version * 4 + 17
+    roles = np.full((n, n), ROLE_DATA, dtype=np.uint8)
+    for row, col in ((0, 0), (0, n - 8), (n - 8, 0)):
+        roles[row:row + 8, col:col + 8] = ROLE_FINDER
+    # 校正图形先于定时图形绘制，中心落在定位图形上的位置跳过
+    positions = qrcode.util.pattern_position(version)
+    for row in positions:
+        for col in positions:
+            if roles[row, col] == ROLE_DATA:
+                roles[row - 2:row + 3, col - 2:col + 3] = ROLE_ALIGNMENT
+    timing = roles[6, 8:n - 8]
+    timing[timing == ROLE_DATA] = ROLE_TIMING
+    timing = roles[8:n - 8, 6]
+    timing[timing == ROLE_DATA] = ROLE_TIMING
+    roles[8, :9][roles[8, :9] == ROLE_DATA] = ROLE_FORMAT
+    roles[:9, 8][roles[:9, 8] == ROLE_DATA] = ROLE_FORMAT
+    roles[8, n - 8:] = ROLE_FORMAT
+    roles[n - 8:, 8] = ROLE_FORMAT
+    if version >= 7:
+        roles[:6, n - 11:n - 8] = ROLE_VERSION
+        roles[n - 11:n - 8, :6] = ROLE_VERSION
+    roles.setflags(write=False)
+    return roles
+
+
+def alignment_centers(version):
+    """实际绘制的校正图形中心 [(行, 列), ...]（不含边框），与定位图形重叠的位置已跳过"""
+    roles = module_roles(version)
+    positions = qrcode.util.pattern_position(version)
+    return [(row, col) for row in positions for col in positions if roles[row, col] == ROLE_ALIGNMENT]
+
+
+def export_matrix(data, error_correction=qrcode.constants.ERROR_CORRECT_H, roles=False):
+    """
+    供客户端自行绘制的矩阵描述，可直接序列化为 JSON
+
+    模块数据取自矩阵缓存中的位压缩形式，不含边框（客户端按 border 留出静区），
+    版本 13 以内整个 JSON 不到 1 KB，版本 40 约 5.7 KB。定位图形固定在三个角上，
+    校正图形以中心坐标给出；roles 为真时另附两者的位压缩蒙版，排列方式与 modules 相同。
+
+    返回:
+        {"version", "size", "ecc", "border", "modules", "finders", "alignment"[, "roles"]}
+    """
+    size, packed = packed_matrix(data, 1, error_correction)
+    version = symbol_version(size)
+    document = {
+        "version": version,
+        "size": size,
+        "ecc": next(name for name, level in ECC_LEVELS.items() if level == error_correction),
+        "border": 4,
+        "modules": base64.b64encode(packed.tobytes()).decode("ascii"),
+        # 左上角坐标（行, 列），每个占 7 × 7 个模块
+        "finders": [[0, 0], [0, size - 7], [size - 7, 0]],
+        # 中心坐标（行, 列），每个占 5 × 5 个模块
+        "alignment": [[row, col] for row, col in alignment_centers(version)],
+    }
+    if roles:
+        role_map = module_roles(version)
+        document["roles"] = {
+            name: base64.b64encode(np.packbits(role_map == role).tobytes()).decode("ascii")
+            for name, role in (("finder", ROLE_FINDER), ("alignment", ROLE_ALIGNMENT))
+        }
+    return document
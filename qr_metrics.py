@@ -0,0 +1,380 @@
+"""
+渲染分阶段计时与 Prometheus 指标
+
+生成函数在热点路径上用 stage_timer() 记录各阶段耗时（矩阵编码、绘制、Logo、
+图片编码）以及模块数、样式和格式。没有挂接收集器时 stage_timer() 返回一个
+空操作对象，开销只是几次方法调用。
+
+Registry 提供计数器、仪表和直方图，并输出 Prometheus 文本格式。gunicorn 的
+多个工作进程各自记录指标；设置共享目录后，每个进程定期把快照写入该目录，
+/metrics 汇总所有进程的快照，无论请求落在哪个进程上结果都一致。
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+# 阶段耗时的直方图分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 模块数（含边框的矩阵边长）的分桶，大致对应版本 1–40
+MODULE_BUCKETS = (29, 33, 37, 45, 53, 65, 81, 101, 121, 145, 161, 185)
+
+# 纠错预算占用比例的分桶，超过 1 无法解码
+USAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 2.0)
+
+# 样式和格式标签的取值范围（渐变图以渐变类型作为样式），其余值一律记为 "other"，
+# 避免请求中的任意字符串各自生成一条时间序列
+STYLE_LABELS = frozenset(("rounded", "circle", "classic", "orange_circle",
+                          "vertical", "horizontal", "diagonal", "radial"))
+FORMAT_LABELS = frozenset(("png", "webp", "tiff", "jpeg", "svg", "svgz"))
+
+
+# 热点路径计时
+
+_collector = None
+
+
+def set_collector(collector):
+    """
+    挂接（或以 None 卸下）渲染指标收集器
+
+    收集器需提供 observe_stage(generator, stage, seconds)、
+    record_render(generator, style, fmt, modules) 和
+    record_verify(generator, outcome, usage) 三个方法。
+    """
+    global _collector
+    _collector = collector
+
+
+def get_collector():
+    return _collector
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+    def done(self, style, fmt, modules):
+        pass
+
+    def verified(self, outcome, usage):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class StageTimer:
+    """
+    逐段计时：lap(stage) 记录距上一次 lap 的耗时，done() 记录本次渲染的属性，
+    verified() 记录可扫描性自检的结果（见 qr_verify）
+    """
+
+    __slots__ = ("collector", "generator", "last")
+
+    def __init__(self, collector, generator):
+        self.collector = collector
+        self.generator = generator
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.collector.observe_stage(self.generator, stage, now - self.last)
+        self.last = now
+
+    def done(self, style, fmt, modules):
+        self.collector.record_render(self.generator, style, fmt, modules)
+
+    def verified(self, outcome, usage):
+        self.collector.record_verify(self.generator, outcome, usage)
+
+
+def stage_timer(generator):
+    """开始一次渲染的计时；没有收集器时返回空操作对象"""
+    collector = _collector
+    if collector is None:
+        return _NULL_TIMER
+    return StageTimer(collector, generator)
+
+
+# 指标
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """指标基类，按标签值元组保存数据"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, value, *labels):
+        """用于从其他组件的累计统计同步计数"""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # 每个标签组合保存 [各桶计数（非累计）..., +Inf 桶, 总和]
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), list(value)] for labels, value in self._values.items()]
+
+
+class Registry:
+    """
+    指标注册表
+
+    参数:
+        directory: 多进程共享目录，为空时只导出本进程的指标
+        flush_interval: 写入快照的间隔（秒）
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._callbacks = []
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_callback(self, fn):
+        """注册在导出前调用的函数，用于同步缓存统计等外部状态"""
+        self._callbacks.append(fn)
+
+    def snapshot(self):
+        """本进程全部指标的可 JSON 序列化快照"""
+        for fn in self._callbacks:
+            fn()
+        return {
+            "pid": os.getpid(),
+            "metrics": {
+                name: {
+                    "kind": metric.kind,
+                    "help": metric.documentation,
+                    "labels": list(metric.labelnames),
+                    "buckets": list(getattr(metric, "buckets", ())),
+                    "values": metric.snapshot(),
+                }
+                for name, metric in self._metrics.items()
+            },
+        }
+
+    # 多进程共享
+
+    def start(self):
+        """在当前进程中启动定期写快照的后台线程（fork 后需在每个进程中调用，重复调用无副作用）"""
+        if not self.directory:
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        thread = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """把本进程快照原子地写入共享目录"""
+        if not self.directory:
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except OSError as e:
+            print(f"写入指标快照失败: {e}")
+
+    def _snapshots(self):
+        own = self.snapshot()
+        snapshots = [(own, True)]
+        if not self.directory:
+            return snapshots
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name == f"{own['pid']}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((snapshot, _pid_alive(snapshot.get("pid"))))
+        return snapshots
+
+    def collect(self):
+        """
+        汇总所有进程的指标
+
+        计数器和直方图对所有快照求和（已退出进程的累计值仍然保留）；
+        仪表只统计仍在运行的进程。
+        """
+        merged = {}
+        for snapshot, alive in self._snapshots():
+            for name, metric in snapshot["metrics"].items():
+                if metric["kind"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, dict(metric, values={}))
+                for labels, value in metric["values"]:
+                    key = tuple(labels)
+                    if metric["kind"] == "histogram":
+                        old = target["values"].get(key)
+                        target["values"][key] = value if old is None else [a + b for a, b in zip(old, value)]
+                    else:
+                        target["values"][key] = target["values"].get(key, 0) + value
+        return merged
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            labelnames = metric["labels"]
+            for labels, value in sorted(metric["values"].items()):
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric["buckets"]) + [math.inf], value[:-1]):
+                    cumulative += count
+                    le = ("le", _format_value(bound))
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+def clear_directory(directory):
+    """删除共享目录中的旧快照（服务启动时调用，避免上次运行的计数混入）"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".json") or name.startswith(".tmp-"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+class RenderMetrics:
+    """把生成函数的阶段计时记录到 Registry 中的收集器"""
+
+    def __init__(self, registry):
+        self.stage_seconds = registry.histogram(
+            "qr_render_stage_seconds", "Time spent in each render stage", ("generator", "stage"))
+        self.renders = registry.counter(
+            "qr_renders_total", "Completed renders", ("generator", "style", "format"))
+        self.modules = registry.histogram(
+            "qr_matrix_modules", "QR matrix side length in modules, border included",
+            ("generator",), buckets=MODULE_BUCKETS)
+        self.verifications = registry.counter(
+            "qr_verify_total", "Scannability self-checks by outcome", ("generator", "outcome"))
+        self.verify_usage = registry.histogram(
+            "qr_verify_ecc_usage", "Share of the error-correction budget used by misread modules (worst block)",
+            ("generator",), buckets=USAGE_BUCKETS)
+
+    def observe_stage(self, generator, stage, seconds):
+        self.stage_seconds.observe(seconds, generator, stage)
+
+    def record_render(self, generator, style, fmt, modules):
+        self.renders.inc(generator, style if style in STYLE_LABELS else "other",
+                         fmt if fmt in FORMAT_LABELS else "other")
+        self.modules.observe(modules, generator)
+
+    def record_verify(self, generator, outcome, usage):
+        self.verifications.inc(generator, outcome)
+        self.verify_usage.observe(usage, generator)
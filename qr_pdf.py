@@ -0,0 +1,480 @@
+"""
+PDF 标签页
+
+批量印刷时，把矢量二维码按标签纸模板（A4/Letter 网格，带说明文字）排版成多页 PDF。
+模块形状与精简 SVG 相同（qr_generator.compact_module_geometry），以模块为单位写入内容流，
+每个二维码只占几 KB。
+
+页面逐页写出：一页排满后立即压缩写入文件，页树和交叉引用表最后写出，内存中只保留
+当前页的内容和每个对象的偏移量，十万条的任务也不会随条目数增长。同一个 Logo 只作为
+图片资源嵌入一次，所有页面共同引用。说明文字使用 PDF 标准字体，不嵌入字体文件：
+Latin-1 文字用 Helvetica，其他文字（如中文）用 STSong-Light。
+
+    python qr_pdf.py -i products.csv -o labels.pdf --template a4-3x7 --logo logo.png
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import zlib
+
+from PIL import Image
+
+import qr_generator
+import qr_logo
+from qr_matrix import choose_error_correction, get_matrix
+
+MM = 72 / 25.4
+
+# 标签纸模板（单位毫米）：纸张尺寸、列数×行数、标签尺寸、左/上页边距、列/行间距
+SHEET_TEMPLATES = {
+    # 21 格，63.5×38.1 mm（Avery L7160 规格）
+    "a4-3x7": {"page": (210, 297), "grid": (3, 7), "label": (63.5, 38.1), "margin": (7.2, 15.15), "gap": (2.5, 0)},
+    # 24 格方形标签，48×45 mm
+    "a4-4x6": {"page": (210, 297), "grid": (4, 6), "label": (48, 45), "margin": (6, 8.5), "gap": (2, 2)},
+    # 65 格，38.1×21.2 mm（Avery L7651 规格）
+    "a4-5x13": {"page": (210, 297), "grid": (5, 13), "label": (38.1, 21.2), "margin": (4.75, 10.7), "gap": (2.5, 0)},
+    # 30 格，2.625×1 英寸（Avery 5160 规格）
+    "letter-3x10": {"page": (215.9, 279.4), "grid": (3, 10), "label": (66.675, 25.4), "margin": (4.7625, 12.7),
+                    "gap": (3.175, 0)},
+}
+DEFAULT_TEMPLATE = "a4-3x7"
+# 模板中可省略的项：间距、标签内边距（毫米）、说明文字字号（磅，0 表示不留文字区域）
+TEMPLATE_DEFAULTS = {"margin": (0, 0), "gap": (0, 0), "padding": 2.0, "caption_size": 7.0}
+
+# 嵌入的 Logo 最长边（像素），足够 600 dpi 下 20 mm 宽的 Logo
+LOGO_MAX_EDGE = int(os.environ.get("QR_PDF_LOGO_EDGE", 512))
+
+# 并行渲染时每次分发给工作进程的条目数
+WORKER_CHUNKSIZE = 64
+
+# Helvetica 中 ASCII 可打印字符的宽度（1/1000 em），其余 WinAnsi 字符按 556 估算
+_HELVETICA_WIDTHS = dict(zip(range(32, 127), (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)))
+ELLIPSIS = "…"
+
+
+def resolve_template(template):
+    """模板名或模板字典（可只覆盖部分项）转换为完整模板，放不下时抛出 ValueError"""
+    if isinstance(template, str):
+        if template not in SHEET_TEMPLATES:
+            raise ValueError(f"未知的标签模板: {template}（可选 {', '.join(SHEET_TEMPLATES)}）")
+        template = SHEET_TEMPLATES[template]
+    spec = dict(TEMPLATE_DEFAULTS, **template)
+    for axis, name in ((0, "宽度"), (1, "高度")):
+        count = spec["grid"][axis]
+        used = spec["margin"][axis] + count * spec["label"][axis] + (count - 1) * spec["gap"][axis]
+        if count < 1 or used > spec["page"][axis] + 0.01:
+            raise ValueError(f"标签网格超出纸张{name}")
+    return spec
+
+
+class SheetLayout:
+    """
+    标签纸版面（单位磅）
+
+    二维码与说明文字作为一组在标签内居中；二维码边长取内边距以内、
+    扣除文字行后的最大正方形。
+    """
+
+    def __init__(self, template=DEFAULT_TEMPLATE):
+        spec = resolve_template(template)
+        self.page_width, self.page_height = (v * MM for v in spec["page"])
+        self.columns, self.rows = spec["grid"]
+        self.per_page = self.columns * self.rows
+        self.label_width, self.label_height = (v * MM for v in spec["label"])
+        self.margin = tuple(v * MM for v in spec["margin"])
+        self.gap = tuple(v * MM for v in spec["gap"])
+        padding = spec["padding"] * MM
+
+        self.caption_size = spec["caption_size"]
+        caption_height = self.caption_size * 1.25
+        self.caption_width = self.label_width - 2 * padding
+        self.code_size = min(self.caption_width, self.label_height - 2 * padding - caption_height)
+        if self.code_size <= 0:
+            raise ValueError("标签太小，放不下二维码")
+        self.code_x = (self.label_width - self.code_size) / 2
+        self.code_y = (self.label_height - self.code_size - caption_height) / 2
+        # 文字基线：二维码下方留出约 0.25 行，再加上字母高度
+        self.caption_baseline = self.code_y + self.code_size + self.caption_size * 1.0
+
+    def origin(self, slot):
+        """第 slot 个标签左上角在页面坐标（原点在左下角）中的位置"""
+        column, row = slot % self.columns, slot // self.columns
+        x = self.margin[0] + column * (self.label_width + self.gap[0])
+        y = self.page_height - self.margin[1] - row * (self.label_height + self.gap[1])
+        return x, y
+
+
+def _num(value):
+    """PDF 数字：最多 3 位小数，去掉多余的 0"""
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _rgb(color):
+    r, g, b = qr_generator._to_rgba(color)[:3]
+    return f"{_num(r / 255)} {_num(g / 255)} {_num(b / 255)}"
+
+
+def logo_resource_name(logo):
+    """Logo 图片资源名（按内容哈希，同一 Logo 在所有页面中同名）"""
+    return "Lg" + logo.digest[:16]
+
+
+def _caption_run(text, max_width, size):
+    """
+    选择字体并按可用宽度截断说明文字
+
+    返回 (字体资源名, PDF 字符串, 文字宽度)。
+    """
+    try:
+        text.encode("cp1252")
+        font = "F1"
+
+        def width(ch):
+            return _HELVETICA_WIDTHS.get(ord(ch), 1000 if ch == ELLIPSIS else 556)
+    except UnicodeEncodeError:
+        font = "F2"
+
+        def width(ch):
+            return 500 if ord(ch) < 128 else 1000
+
+    limit = max_width * 1000 / size
+    widths = [width(ch) for ch in text]
+    if sum(widths) > limit:
+        # 截断到加上省略号后放得下为止
+        budget = limit - width(ELLIPSIS)
+        kept = 0
+        while kept < len(widths) and budget >= widths[kept]:
+            budget -= widths[kept]
+            kept += 1
+        text = text[:kept] + ELLIPSIS
+        widths = widths[:kept] + [width(ELLIPSIS)]
+
+    if font == "F1":
+        raw = text.encode("cp1252").decode("latin-1")
+        string = "(" + raw.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+    else:
+        string = "<" + text.encode("utf-16-be").hex() + ">"
+    return font, string, sum(widths) * size / 1000
+
+
+def _module_ops(matrix, style):
+    """以模块为单位的模块绘制指令（几何与精简 SVG 相同）"""
+    xs, ys, widths, height, pen = qr_generator.compact_module_geometry(matrix, style, 0, 1)
+    coords = {v: _num(v) for v in set(xs.tolist()) | set(ys.tolist())}
+    xs = [coords[v] for v in xs.tolist()]
+    ys = [coords[v] for v in ys.tolist()]
+    if style == "circle":
+        # 零长度线段 + 圆头线帽 = 实心圆
+        ops = [f"{x} {y} m {x} {y} l" for x, y in zip(xs, ys)]
+        return "1 J {} w\n{}\nS\n".format(_num(pen), "\n".join(ops))
+    if style == "rounded":
+        side = _num(height)
+        ops = [f"{x} {y} {side} {side} re" for x, y in zip(xs, ys)]
+        return "1 j {} w\n{}\nB\n".format(_num(pen), "\n".join(ops))
+    ops = [f"{x} {y} {_num(w)} 1 re" for x, y, w in zip(xs, ys, widths.tolist())]
+    return "\n".join(ops) + "\nf\n"
+
+
+def render_label(data, caption, layout, style="rounded", color="#000000", bg_color="#FFFFFF",
+                 border=2, logo=None):
+    """
+    单个标签的内容流
+
+    坐标以标签左上角为原点、y 轴向下，单位为磅（由 LabelSheetWriter 平移和翻转到页面上）。
+    可以在进程池中执行。返回 (内容字节, 用到的字体资源名)。
+
+    参数:
+        data: 要编码的数据
+        caption: 说明文字，为空时不写
+        layout: SheetLayout
+        style: 模块样式 ("rounded", "circle", "classic")
+        color, bg_color: 模块颜色和二维码背景色（"transparent" 为无背景）
+        border: 静区宽度（模块数）
+        logo: 可选的 qr_logo.Logo，居中占二维码边长的 20%
+    """
+    matrix = get_matrix(data, border=border, version=1, error_correction=choose_error_correction(bool(logo)))
+    count = len(matrix)
+    size = layout.code_size
+    parts = ["q\n"]
+    if bg_color != "transparent":
+        parts.append(f"{_rgb(bg_color)} rg {_num(layout.code_x)} {_num(layout.code_y)} "
+                     f"{_num(size)} {_num(size)} re f\n")
+    parts.append(f"{_num(size / count)} 0 0 {_num(size / count)} {_num(layout.code_x)} {_num(layout.code_y)} cm\n")
+    parts.append(f"{_rgb(color)} rg {_rgb(color)} RG\n")
+    parts.append(_module_ops(matrix, style))
+    if logo:
+        # 与 SVG 相同：边长 20% 的方框内按比例居中
+        box = count * 0.2
+        scale = box / max(logo.size)
+        width, height = logo.size[0] * scale, logo.size[1] * scale
+        x, y = (count - width) / 2, (count - height) / 2
+        # 图片按原点在左下角绘制，y 轴向下的坐标系中需要再翻转一次
+        parts.append(f"q {_num(width)} 0 0 {_num(-height)} {_num(x)} {_num(y + height)} cm "
+                     f"/{logo_resource_name(logo)} Do Q\n")
+    parts.append("Q\n")
+
+    fonts = set()
+    if caption and layout.caption_size:
+        font, string, width = _caption_run(caption, layout.caption_width, layout.caption_size)
+        x = (layout.label_width - width) / 2
+        parts.append(f"BT 0 g /{font} {_num(layout.caption_size)} Tf 1 0 0 -1 {_num(x)} "
+                     f"{_num(layout.caption_baseline)} Tm {string} Tj ET\n")
+        fonts.add(font)
+    return "".join(parts).encode("latin-1"), fonts
+
+
+# 标准字体（不嵌入）
+_FONTS = {
+    "F1": [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"],
+    "F2": [
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UTF16-H "
+        b"/DescendantFonts [{1} 0 R] >>",
+        b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 4 >> "
+        b"/FontDescriptor {2} 0 R /DW 1000 /W [1 95 500] >>",
+        b"<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [-25 -254 1000 880] "
+        b"/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>",
+    ],
+}
+
+
+class LabelSheetWriter:
+    """
+    逐页写出的标签 PDF
+
+    fileobj 只需要 write()（不需要 seek），可以直接写入 HTTP 响应流。
+
+    参数:
+        fileobj: 可写的二进制文件对象
+        template: 模板名或模板字典，见 SHEET_TEMPLATES
+        style, color, bg_color, border: 见 render_label
+    """
+
+    def __init__(self, fileobj, template=DEFAULT_TEMPLATE, style="rounded", color="#000000",
+                 bg_color="#FFFFFF", border=2):
+        self.fileobj = fileobj
+        self.layout = SheetLayout(template)
+        self.options = {"style": style, "color": color, "bg_color": bg_color, "border": border}
+        self.count = 0
+        self._position = 0
+        self._offsets = {}
+        # 1 号为文档目录，2 号为页树，都在最后写出
+        self._next_object = 3
+        self._pages = []
+        self._fonts = {}
+        self._logos = {}
+        self._content = []
+        self._page_fonts = set()
+        self._page_logos = set()
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self._position += len(data)
+
+    def _reserve(self):
+        number = self._next_object
+        self._next_object += 1
+        return number
+
+    def _object(self, number, body, stream=None):
+        self._offsets[number] = self._position
+        if stream is None:
+            self._write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        else:
+            self._write(b"%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n" % (number, body, stream))
+        return number
+
+    def _stream(self, header, data):
+        """写入 Flate 压缩的流对象，返回对象号"""
+        data = zlib.compress(data, 6)
+        body = b"<< %s /Filter /FlateDecode /Length %d >>" % (header, len(data))
+        return self._object(self._reserve(), body, data)
+
+    def _font(self, name):
+        if name not in self._fonts:
+            numbers = [self._reserve() for _ in _FONTS[name]]
+            for number, body in zip(numbers, _FONTS[name]):
+                # {i} 引用同一字体的第 i 个对象
+                for i, other in enumerate(numbers):
+                    body = body.replace(b"{%d}" % i, b"%d" % other)
+                self._object(number, body)
+            self._fonts[name] = numbers[0]
+        return self._fonts[name]
+
+    def _logo(self, logo):
+        """Logo 图片资源，每个 Logo 只写入一次"""
+        name = logo_resource_name(logo)
+        if name not in self._logos:
+            image = logo.image.convert("RGBA")
+            if max(image.size) > LOGO_MAX_EDGE:
+                image.thumbnail((LOGO_MAX_EDGE, LOGO_MAX_EDGE), Image.LANCZOS)
+            header = b"/Type /XObject /Subtype /Image /Width %d /Height %d /BitsPerComponent 8" % image.size
+            alpha = image.getchannel("A")
+            smask = b""
+            if alpha.getextrema()[0] < 255:
+                number = self._stream(header + b" /ColorSpace /DeviceGray", alpha.tobytes())
+                smask = b" /SMask %d 0 R" % number
+            rgb = image.convert("RGB").tobytes()
+            self._logos[name] = self._stream(header + b" /ColorSpace /DeviceRGB" + smask, rgb)
+        return name
+
+    def add(self, data, caption=None, logo=None):
+        """排入一个二维码标签"""
+        self.add_rendered(render_label(data, caption, self.layout, logo=logo, **self.options), logo)
+
+    def add_rendered(self, label, logo=None):
+        """排入 render_label 的结果（可在其他进程中渲染），logo 须与渲染时相同"""
+        content, fonts = label
+        slot = self.count % self.layout.per_page
+        x, y = self.layout.origin(slot)
+        self._content.append(b"q 1 0 0 -1 %s %s cm\n" % (_num(x).encode(), _num(y).encode()) + content + b"Q\n")
+        self._page_fonts.update(fonts)
+        if logo:
+            self._page_logos.add(self._logo(logo))
+        self.count += 1
+        if slot == self.layout.per_page - 1:
+            self._finish_page()
+
+    def _finish_page(self):
+        content = self._stream(b"", b"".join(self._content))
+        fonts = b"".join(b"/%s %d 0 R " % (name.encode(), self._font(name)) for name in sorted(self._page_fonts))
+        logos = b"".join(b"/%s %d 0 R " % (name.encode(), self._logos[name]) for name in sorted(self._page_logos))
+        resources = b"/ProcSet [/PDF /Text /ImageC]"
+        if fonts:
+            resources += b" /Font << %s>>" % fonts
+        if logos:
+            resources += b" /XObject << %s>>" % logos
+        page = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %s %s] /Resources << %s >> /Contents %d 0 R >>"
+                % (_num(self.layout.page_width).encode(), _num(self.layout.page_height).encode(), resources, content))
+        self._pages.append(self._object(self._reserve(), page))
+        self._content = []
+        self._page_fonts = set()
+        self._page_logos = set()
+
+    def close(self):
+        """写出最后一页、页树和交叉引用表"""
+        if self._content or not self._pages:
+            self._finish_page()
+        kids = b" ".join(b"%d 0 R" % number for number in self._pages)
+        self._object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages)))
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref = self._position
+        count = self._next_object
+        entries = [b"0000000000 65535 f \n"] + [b"%010d 00000 n \n" % self._offsets[n] for n in range(1, count)]
+        self._write(b"xref\n0 %d\n%s" % (count, b"".join(entries)))
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+
+
+# 工作进程内的版面、样式和共用 Logo（在进程初始化时设置一次）
+_worker_state = None
+
+
+def _init_worker(layout, options, logo):
+    global _worker_state
+    _worker_state = (layout, options, logo)
+
+
+def _render_worker(item):
+    """工作进程：渲染一个标签，返回 (内容, 该条目单独指定的 Logo)"""
+    data, caption, logo = item
+    layout, options, shared_logo = _worker_state
+    return render_label(data, caption, layout, logo=logo or shared_logo, **options), logo
+
+
+def _normalize_item(item):
+    if isinstance(item, str):
+        return item, None, None
+    if isinstance(item, dict):
+        return item["data"], item.get("caption"), item.get("logo")
+    return item[0], item[1], None
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_label_sheets(items, output_file, template=DEFAULT_TEMPLATE, style="rounded", color="#000000",
+                          bg_color="#FFFFFF", border=2, logo_obj=None, logo_path=None, workers=1):
+    """
+    把一批内容排版为标签 PDF，返回标签数
+
+    参数:
+        items: 可迭代对象（可以是生成器），每项为字符串、(内容, 说明文字) 或
+               {"data": ..., "caption": ..., "logo": Logo} 字典（logo 覆盖统一的 Logo）
+        output_file: 文件路径或二进制文件对象
+        template: 模板名或模板字典，见 SHEET_TEMPLATES
+        logo_obj / logo_path: 所有标签共用的 Logo
+        workers: 大于 1 时在多个进程中并行编码二维码，按输入顺序排版
+        其余参数见 render_label
+    """
+    if isinstance(output_file, str):
+        with open(output_file, "wb") as f:
+            return generate_label_sheets(items, f, template, style, color, bg_color, border,
+                                         logo_obj, logo_path, workers)
+
+    logo = qr_logo.resolve(logo_obj, logo_path)
+    writer = LabelSheetWriter(output_file, template, style=style, color=color, bg_color=bg_color, border=border)
+    items = (_normalize_item(item) for item in items)
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(writer.layout, writer.options, logo)) as pool:
+            # 分批提交，未处理的条目不会全部堆积在任务队列中
+            for batch in _batches(items, workers * WORKER_CHUNKSIZE * 4):
+                for label, item_logo in pool.imap(_render_worker, batch, chunksize=WORKER_CHUNKSIZE):
+                    writer.add_rendered(label, item_logo or logo)
+    else:
+        for data, caption, item_logo in items:
+            writer.add(data, caption, item_logo or logo)
+    writer.close()
+    return writer.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成二维码标签 PDF")
+    parser.add_argument("-i", "--input", required=True, help="输入文件，每行一条内容或 CSV；'-' 表示标准输入")
+    parser.add_argument("-o", "--output", required=True, help="输出 PDF 路径")
+    parser.add_argument("--csv", action="store_true", help="按 CSV 解析输入（.csv 文件自动识别）")
+    parser.add_argument("--caption-column", default="name", help="CSV 中作为说明文字的列")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, choices=tuple(SHEET_TEMPLATES))
+    parser.add_argument("--style", default="rounded", choices=("rounded", "circle", "classic"))
+    parser.add_argument("--color", default="#000000")
+    parser.add_argument("--bg-color", default="#FFFFFF")
+    parser.add_argument("--border", type=int, default=2, help="静区宽度（模块数）")
+    parser.add_argument("--logo", help="Logo 图片路径")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    args = parser.parse_args(argv)
+
+    use_csv = args.csv or args.input.lower().endswith(".csv")
+    stream = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    try:
+        records = qr_generator.read_cli_records(stream, use_csv)
+        items = ((record["data"], record.get(args.caption_column)) for record in records)
+        count = generate_label_sheets(items, args.output, args.template, args.style, args.color,
+                                      args.bg_color, args.border, logo_path=args.logo, workers=args.workers)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"已生成 {count} 个标签: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
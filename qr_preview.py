@@ -0,0 +1,148 @@
+"""
+低分辨率实时预览
+
+网页端调整选项时如果每次都请求完整渲染，就要经过逐模块光栅化、Logo 的 LANCZOS 缩放和模糊蒙版、
+按输出尺寸的 PNG 编码。预览只需让用户看出内容、样式和颜色，所以这里按模块网格渲染：
+
+- 每个模块固定为几个像素（默认 QR_PREVIEW_MODULE_PX），用预先生成的小块图案拼出圆角、圆形或方形模块，
+  不做抗锯齿，也不按输出尺寸计算间距
+- 颜色通过调色板图像查表；渐变按模块取色（量化为最多 GRADIENT_LEVELS 级）
+- Logo 用最近邻缩放并量化为 LOGO_COLORS 种颜色，配硬边圆形蒙版，结果按 Logo 内容和尺寸缓存；
+  合成时直接写入调色板下标，整张图始终是调色板图像，不经过 RGBA 转换
+- 以最快的压缩级别编码为 PNG，由浏览器按最近邻方式放大显示（image-rendering: pixelated）
+
+矩阵已缓存时各种内容的预览都在 1–3 ms 内；内容变化后第一次预览要先编码矩阵，
+长内容（约 1 KB 的 vCard，H 级纠错、版本 33 左右）这一步约 20–30 ms。
+
+预览与最终渲染分开：模块间距、Logo 大小和边框都是近似效果，下载和最终图片始终走完整渲染。
+"""
+import functools
+import os
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+import qr_encode
+import qr_logo
+import qr_metrics
+import qr_raster
+from qr_generator import GRADIENT_TYPES
+from qr_matrix import choose_error_correction, get_matrix
+
+# 每个模块的像素数，请求可在 1 到 MAX_MODULE_PX 之间覆盖
+MODULE_PX = int(os.environ.get("QR_PREVIEW_MODULE_PX", "4"))
+MAX_MODULE_PX = 8
+# 预览固定使用标准的 4 模块静区
+BORDER = 4
+# Logo 的颜色数和渐变颜色的量化级数：调色板依次为背景、前景（或渐变各级）、Logo，共 256 项
+LOGO_COLORS = 64
+GRADIENT_LEVELS = 256 - 1 - LOGO_COLORS
+
+
+@functools.lru_cache(maxsize=None)
+def module_tile(style, px):
+    """单个模块的像素图案（px × px 的 uint8 数组，1 为前景）；3 像素以下一律为方块"""
+    if px < 3 or style not in ("rounded", "circle"):
+        return np.ones((px, px), dtype=np.uint8)
+    img = Image.new("L", (px, px), 0)
+    draw = ImageDraw.Draw(img)
+    if style == "circle":
+        draw.ellipse((0, 0, px - 1, px - 1), fill=1)
+    else:
+        draw.rounded_rectangle((0, 0, px - 1, px - 1), radius=max(1, px // 3), fill=1)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _gradient_levels(gradient, n):
+    """每个模块在渐变中的位置，量化为 1..GRADIENT_LEVELS 的标签，(n, n) 数组"""
+    ys, xs = np.mgrid[0:n, 0:n]
+    if gradient == "vertical":
+        # 与完整渲染相同：位置为 行号 / 矩阵边长
+        t = ys / n
+    elif gradient == "horizontal":
+        t = xs / max(n - 1, 1)
+    elif gradient == "diagonal":
+        t = (xs + ys) / max(2 * n - 2, 1)
+    elif gradient == "radial":
+        center = (n - 1) / 2
+        t = np.hypot(xs - center, ys - center) / max(center, 1)
+    else:
+        raise ValueError(f"不支持的渐变类型: {gradient}")
+    return (np.minimum(t, 1.0) * (GRADIENT_LEVELS - 1)).astype(np.uint8) + 1
+
+
+def _rgba(color):
+    if color == "transparent":
+        return (0, 0, 0, 0)
+    return ImageColor.getcolor(color, "RGBA")
+
+
+def render_preview(data, output_file, style="rounded", color="#000000", bg_color="#FFFFFF",
+                   start_color="#1E88E5", end_color="#8BC34A", gradient="vertical",
+                   logo_obj=None, logo_path=None, module_px=None, ecc=None):
+    """
+    渲染低分辨率预览 PNG
+
+    参数:
+        data: 要编码的数据
+        output_file: 输出文件名或文件对象
+        style: 样式 ("rounded", "circle", "classic", "gradient")
+        color / bg_color: 前景色和背景色（背景可为 "transparent"）
+        start_color / end_color / gradient: 渐变样式的起止颜色和类型
+        logo_obj / logo_path: 可选的 Logo，同 generate_styled_qr_code
+        module_px: 每个模块的像素数，默认取 QR_PREVIEW_MODULE_PX 环境变量
+        ecc: 纠错等级策略，同 generate_styled_qr_code；预览与完整渲染的矩阵相同
+
+    返回:
+        output_file
+    """
+    px = min(max(int(module_px or MODULE_PX), 1), MAX_MODULE_PX)
+    if style == "gradient" and gradient not in GRADIENT_TYPES:
+        raise ValueError(f"不支持的渐变类型: {gradient}")
+    logo = qr_logo.resolve(logo_obj, logo_path)
+
+    timer = qr_metrics.stage_timer("preview")
+    matrix = get_matrix(data, border=BORDER, version=1,
+                        error_correction=choose_error_correction(bool(logo), ecc))
+    timer.lap("matrix")
+
+    n = len(matrix)
+    if style == "gradient":
+        labels = np.where(matrix, _gradient_levels(gradient, n), 0).astype(np.uint8)
+        stops = [(0.0, _rgba(start_color)[:3]), (1.0, _rgba(end_color)[:3])]
+        colors = qr_raster.interpolate_stops(np.arange(GRADIENT_LEVELS) / (GRADIENT_LEVELS - 1), stops)
+        palette = [tuple(c) + (255,) for c in colors.tolist()]
+        tile = module_tile("classic", px)
+    else:
+        labels = matrix.astype(np.uint8)
+        palette = [_rgba(color)]
+        tile = module_tile(style, px)
+
+    # 每个模块的标签乘以图案，拼成 (n * px, n * px) 的调色板下标
+    pixels = (labels[:, None, :, None] * tile[None, :, None, :]).reshape(n * px, n * px)
+    table = [_rgba(bg_color)] + palette
+    timer.lap("render")
+
+    if logo:
+        # 与完整渲染相同：按符号区域（不含边框）的 1/5 或 1/6
+        size = (n - 2 * BORDER) * px // (5 if len(data) < 100 else 6)
+        image, mask = qr_logo.logo_store.preview(logo, size, LOGO_COLORS)
+        indices = np.asarray(image)
+        visible = np.asarray(mask) > 0
+        # 只把蒙版内实际用到的 Logo 颜色接在二维码颜色之后，调色板越短，PNG 的位深越低
+        used = np.unique(indices[visible])
+        remap = np.zeros(256, dtype=np.uint8)
+        remap[used] = len(table) + np.arange(len(used))
+        logo_palette = image.getpalette("RGBA")
+        table += [tuple(logo_palette[4 * i:4 * i + 4]) for i in used.tolist()]
+        top = (n * px - size) // 2
+        np.copyto(pixels[top:top + size, top:top + size], remap[indices], where=visible)
+        timer.lap("logo")
+
+    img = Image.fromarray(pixels, "P")
+    img.putpalette([v for c in table for v in c], "RGBA")
+
+    qr_encode.save_image(img, output_file, "PNG", "fast")
+    timer.lap("encode")
+    timer.done(gradient if style == "gradient" else style, "png", n)
+    return output_file
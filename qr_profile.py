@@ -0,0 +1,265 @@
+"""
+按需渲染性能剖析
+
+某个内容或样式特别慢时，可以只对那一次渲染做剖析，而不必在本地复现：
+
+- cprofile：确定性剖析，产物是 pstats 格式的 .prof 文件（snakeviz、pstats 可直接打开）
+- sample：定时采样渲染线程的调用栈，产物是折叠栈 .folded 文本，可直接用
+  flamegraph.pl / speedscope 生成火焰图，多个文件按行求和即可聚合
+
+产物保存在目录中（只保留最近的若干个），热点函数的前 N 项写入日志。
+命令行工具可以汇总多个产物：
+
+    python qr_profile.py merge /tmp/qr-profiles -o merged.prof
+    python qr_profile.py merge /tmp/qr-profiles --mode sample -o merged.folded
+    python qr_profile.py top merged.prof
+"""
+import argparse
+import cProfile
+import collections
+import hmac
+import io
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+PROFILE_MODES = ("cprofile", "sample")
+EXTENSIONS = {"cprofile": ".prof", "sample": ".folded"}
+
+
+class StackSampler:
+    """在后台线程中定时采样当前线程的调用栈，按折叠栈计数"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def __enter__(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def run_profiled(mode, interval, fn, *args):
+    """
+    在剖析下运行 fn(*args)
+
+    可以直接交给进程池执行（参数和返回值都可序列化）。
+    返回 (fn 的结果, 产物字节, 耗时秒数)。
+    """
+    start = time.perf_counter()
+    if mode == "sample":
+        with StackSampler(interval) as sampler:
+            result = fn(*args)
+        artifact = sampler.folded().encode("utf-8")
+    else:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, *args)
+        profiler.create_stats()
+        # 与 Profile.dump_stats 写出的格式相同
+        artifact = marshal.dumps(profiler.stats)
+    return result, artifact, time.perf_counter() - start
+
+
+class _StatsSource:
+    """让 pstats.Stats 直接读取内存中的剖析数据"""
+
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+def summarize(mode, artifact, top=15):
+    """热点函数前 top 项的文本摘要"""
+    if mode == "sample":
+        return summarize_folded(artifact.decode("utf-8"), top)
+    out = io.StringIO()
+    stats = pstats.Stats(_StatsSource(artifact), stream=out)
+    stats.sort_stats("cumulative").print_stats(top)
+    # 去掉 pstats 输出开头的空行和统计说明
+    lines = [line for line in out.getvalue().splitlines() if line.strip()]
+    return "\n".join(lines)
+
+
+def summarize_folded(text, top=15):
+    """折叠栈中各函数的自身采样数和包含采样数"""
+    own = collections.Counter()
+    inclusive = collections.Counter()
+    total = 0
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(" ")
+        if not stack:
+            continue
+        count = int(count)
+        frames = stack.split(";")
+        total += count
+        own[frames[-1]] += count
+        for name in set(frames):
+            inclusive[name] += count
+    lines = [f"{total} 个采样  自身%  包含%  函数"]
+    for name, count in own.most_common(top):
+        lines.append(f"{count:>10} {count / total:6.1%} {inclusive[name] / total:6.1%}  {name}")
+    return "\n".join(lines)
+
+
+class ProfileStore:
+    """
+    剖析产物目录
+
+    参数:
+        directory: 保存目录
+        keep: 最多保留的产物数，超出时删除最旧的
+    """
+
+    def __init__(self, directory, keep=500):
+        self.directory = directory
+        self.keep = keep
+        self._written = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, mode, artifact):
+        """保存产物并返回其 id"""
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}{EXTENSIONS[mode]}"
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(artifact)
+        os.replace(tmp, os.path.join(self.directory, profile_id))
+        with self._lock:
+            self._written += 1
+            need_trim = self._written % 50 == 0
+        if need_trim:
+            self.trim()
+        return profile_id
+
+    def path(self, profile_id):
+        """产物路径；id 不合法或文件不存在时返回 None"""
+        if os.path.basename(profile_id) != profile_id or profile_id.startswith("."):
+            return None
+        path = os.path.join(self.directory, profile_id)
+        return path if os.path.isfile(path) else None
+
+    def trim(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith(".tmp-"):
+                continue
+            try:
+                entries.append((os.stat(os.path.join(self.directory, name)).st_mtime, name))
+            except OSError:
+                continue
+        entries.sort()
+        for _, name in entries[:max(0, len(entries) - self.keep)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class ProfilePolicy:
+    """
+    决定哪些渲染需要剖析
+
+    参数:
+        token: 请求中携带该令牌时剖析本次渲染，为空时不接受按请求开启
+        sample_every: 每 N 次渲染剖析 1 次，0 表示关闭；1 表示全部剖析
+        mode: 默认剖析方式 ("cprofile" 或 "sample")
+    """
+
+    def __init__(self, token=None, sample_every=0, mode="cprofile"):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的剖析方式: {mode}")
+        self.token = token
+        self.sample_every = sample_every
+        self.mode = mode
+        self._counter = itertools.count(1)
+
+    def requested(self, request_token):
+        """请求携带的令牌是否有效"""
+        if not (self.token and request_token):
+            return False
+        return hmac.compare_digest(self.token.encode("utf-8"), request_token.encode("utf-8"))
+
+    def sampled(self):
+        """周期采样：是否轮到本次渲染"""
+        return self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+
+
+def _merge_command(args):
+    files = sorted(
+        os.path.join(args.directory, name) for name in os.listdir(args.directory)
+        if name.endswith(EXTENSIONS[args.mode])
+    )
+    if not files:
+        print("没有找到剖析产物")
+        return 1
+    if args.mode == "sample":
+        merged = collections.Counter()
+        for path in files:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    if stack:
+                        merged[stack] += int(count)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in merged.most_common())
+    else:
+        pstats.Stats(*files).dump_stats(args.output)
+    print(f"已汇总 {len(files)} 个产物到 {args.output}")
+    return 0
+
+
+def _top_command(args):
+    mode = "sample" if args.file.endswith(EXTENSIONS["sample"]) else "cprofile"
+    with open(args.file, "rb") as f:
+        print(summarize(mode, f.read(), args.top))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="渲染剖析产物工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    merge = sub.add_parser("merge", help="汇总目录中的剖析产物")
+    merge.add_argument("directory")
+    merge.add_argument("--mode", default="cprofile", choices=PROFILE_MODES)
+    merge.add_argument("-o", "--output", required=True)
+    top = sub.add_parser("top", help="输出热点函数")
+    top.add_argument("file")
+    top.add_argument("--top", type=int, default=25)
+    args = parser.parse_args(argv)
+    return _merge_command(args) if args.command == "merge" else _top_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
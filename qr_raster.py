@@ -0,0 +1,563 @@
+"""
+批量光栅化引擎
+
+把二维码矩阵当作 NumPy 数组处理，一次性生成整张图片的像素缓冲区，
+取代逐模块调用 ImageDraw 的循环。
+
+原理：每个模块的外接框坐标只在小数部分上有差别（间距因子 0.95 导致），
+PIL 的光栅化在偶数像素平移下结果不变，所以把坐标按“偶数向下取整”拆成
+整数偏移 + 局部坐标后，同一局部坐标的模块形状完全一致。每种形状只用
+PIL 画一次（精灵图），再用数组索引批量盖印到画布上，结果与逐个绘制
+逐像素一致。
+"""
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from qr_cache import LRUCache
+
+# 形状类型
+SHAPE_RECTANGLE = 0
+SHAPE_ROUNDED = 1
+SHAPE_ELLIPSE = 2
+
+# 精灵图缓存：键为形状键（形状类型、取整后的局部坐标、圆角参数），
+# 与颜色无关，颜色在 compose 阶段才应用。稳定流量下热点键只有几十个。
+sprite_cache = LRUCache(int(os.environ.get("QR_SPRITE_CACHE_SIZE", "256")))
+
+
+def matrix_to_array(qr_matrix):
+    """将 qr.get_matrix() 的嵌套列表转换为布尔数组"""
+    return np.asarray(qr_matrix, dtype=bool)
+
+
+def finder_pattern_coords(matrix_size):
+    """定位点坐标列表（与原有渲染逻辑保持一致）"""
+    m = matrix_size
+    return [
+        (0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (0, 6),
+        (1, 0), (1, 6),
+        (2, 0), (2, 2), (2, 3), (2, 4), (2, 6),
+        (3, 0), (3, 2), (3, 3), (3, 4), (3, 6),
+        (4, 0), (4, 2), (4, 3), (4, 4), (4, 6),
+        (5, 0), (5, 6),
+        (6, 0), (6, 1), (6, 2), (6, 3), (6, 4), (6, 5), (6, 6),
+
+        (0, m-7), (0, m-6), (0, m-5), (0, m-4), (0, m-3), (0, m-2), (0, m-1),
+        (1, m-7), (1, m-1),
+        (2, m-7), (2, m-5), (2, m-4), (2, m-3), (2, m-1),
+        (3, m-7), (3, m-5), (3, m-4), (3, m-3), (3, m-1),
+        (4, m-7), (4, m-5), (4, m-4), (4, m-3), (4, m-1),
+        (5, m-7), (5, m-1),
+        (6, m-7), (6, m-6), (6, m-5), (6, m-4), (6, m-3), (6, m-2), (6, m-1),
+
+        (m-7, 0), (m-7, 1), (m-7, 2), (m-7, 3), (m-7, 4), (m-7, 5), (m-7, 6),
+        (m-6, 0), (m-6, 6),
+        (m-5, 0), (m-5, 2), (m-5, 3), (m-5, 4), (m-5, 6),
+        (m-4, 0), (m-4, 2), (m-4, 3), (m-4, 4), (m-4, 6),
+        (m-3, 0), (m-3, 2), (m-3, 3), (m-3, 4), (m-3, 6),
+        (m-2, 0), (m-2, 6),
+        (m-1, 0), (m-1, 1), (m-1, 2), (m-1, 3), (m-1, 4), (m-1, 5), (m-1, 6),
+    ]
+
+
+def finder_mask(matrix_size):
+    """
+    定位点掩码，按 [y, x] 索引
+
+    原逻辑判断的是 (x, y) in finder_patterns，这里保持相同的坐标顺序。
+    """
+    mask = np.zeros((matrix_size, matrix_size), dtype=bool)
+    for a, b in finder_pattern_coords(matrix_size):
+        # (x, y) == (a, b)  ->  mask[y, x] == mask[b, a]
+        mask[b, a] = True
+    return mask
+
+
+def module_centers(matrix_size, start_x, start_y, module_size, spacing_factor=0.95):
+    """
+    计算每一行/列模块的中心坐标
+
+    运算顺序与原有逐模块循环完全相同，保证浮点结果一致。
+    """
+    idx = np.arange(matrix_size)
+    step = module_size * spacing_factor
+    centers_x = start_x + idx * step + module_size // 2
+    centers_y = start_y + idx * step + module_size // 2
+    return centers_x, centers_y
+
+
+def render_sprite(shape, box, radius=0):
+    """
+    用 PIL 绘制单个模块形状，返回布尔掩码
+
+    box 为局部坐标 (x0, y0, x1, y1)，掩码原点在 (0, 0)，负坐标部分被裁掉。
+    """
+    width = max(int(np.ceil(max(box[0], box[2]))) + 2, 1)
+    height = max(int(np.ceil(max(box[1], box[3]))) + 2, 1)
+    img = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(img)
+    if shape == SHAPE_ROUNDED:
+        draw.rounded_rectangle(list(box), radius=radius, fill=255)
+    elif shape == SHAPE_ELLIPSE:
+        draw.ellipse(list(box), fill=255)
+    else:
+        draw.rectangle(list(box), fill=255)
+    return np.asarray(img) != 0
+
+
+def cached_sprite(key, shape, box, radius=0):
+    """
+    从精灵图缓存中取出模块掩码，未命中时绘制并写入缓存
+
+    key 必须唯一确定绘制结果（见 _shape_keys），返回的数组为只读。
+    """
+    def draw():
+        sprite = render_sprite(shape, box, radius)
+        sprite.setflags(write=False)
+        return sprite
+    return sprite_cache.get_or_create(key, draw)
+
+
+def _shape_keys(x0, y0, x1, y1, shapes, radii):
+    """
+    计算每个模块的形状键和偶数像素偏移
+
+    PIL 绘制矩形和椭圆时把坐标截断为整数，圆角矩形则用 round() 取整，
+    并依赖 d = min(宽, 高, 2 * 半径)。键只包含这些取整后的量（相对于
+    偶数偏移），因此浮点误差不会产生额外的形状。
+
+    圆角矩形的圆角和中间部分按 x0 + r + 1 等浮点坐标向零截断，在负坐标
+    （画布外，如关闭 auto_adjust 时二维码大于画布）上平移不变性不成立。
+    这样的模块在该方向上不平移（偏移为 0），键中改用精确的浮点坐标，
+    精灵图按原坐标绘制并由 PIL 裁掉负坐标部分，与逐个绘制一致。
+    """
+    off_x = (np.floor(x0).astype(np.int64) // 2) * 2
+    off_y = (np.floor(y0).astype(np.int64) // 2) * 2
+    rounded = shapes == SHAPE_ROUNDED
+    negative_x = rounded & (off_x < 0)
+    negative_y = rounded & (off_y < 0)
+    off_x[negative_x] = 0
+    off_y[negative_y] = 0
+
+    columns = [shapes.astype(np.int64) + np.where(negative_x, 4, 0) + np.where(negative_y, 8, 0)]
+    for values, off, exact in ((x0, off_x, negative_x), (y0, off_y, negative_y),
+                               (x1, off_x, negative_x), (y1, off_y, negative_y)):
+        columns.append(np.where(exact, values.view(np.int64), np.trunc(values).astype(np.int64) - off))
+    for values, off, exact in ((x0, off_x, negative_x), (y0, off_y, negative_y),
+                               (x1, off_x, negative_x), (y1, off_y, negative_y)):
+        columns.append(np.where(rounded & ~exact, np.round(values).astype(np.int64) - off, 0))
+
+    d = np.minimum(np.minimum(x1 - x0, y1 - y0), radii * 2)
+    # d 与半径作为浮点数参与比较，按位模式放入整数键中
+    columns.append(np.where(rounded, d, 0.0).view(np.int64))
+    columns.append(np.where(rounded, radii, 0.0).view(np.int64))
+    return np.column_stack(columns), off_x, off_y
+
+
+# 键的混合系数（大奇数），用于把多列整数键压缩为一列
+_KEY_WEIGHTS = np.array([
+    0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+    0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9,
+    0x2545F4914F6CDD1D, 0x9FB21C651E98DF25, 0xA0761D6478BD642F,
+], dtype=np.uint64)
+
+
+def _group_rows(keys):
+    """
+    按行分组，返回 (每组第一个行号, 每行所属组号)
+
+    先把每行哈希为一个整数做一维去重；若出现哈希冲突则退回逐行比较。
+    """
+    weights = _KEY_WEIGHTS[:keys.shape[1]]
+    with np.errstate(over="ignore"):
+        hashed = (keys.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+    _, first, inverse = np.unique(hashed, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if not (keys[first][inverse] == keys).all():
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+    return first, inverse
+
+
+def shape_groups(x0, y0, x1, y1, shapes, radii):
+    """
+    按形状把模块分组
+
+    返回 (精灵图列表, 每个模块的组号, 每个模块的偶数像素偏移 x, y)。
+    结果只取决于每个模块自身的坐标，可以对一组候选模块预先计算，
+    再用 select_groups 取出实际绘制的模块，交给 rasterize 的 groups 参数。
+    """
+    x0 = np.asarray(x0, dtype=np.float64)
+    y0 = np.asarray(y0, dtype=np.float64)
+    x1 = np.asarray(x1, dtype=np.float64)
+    y1 = np.asarray(y1, dtype=np.float64)
+    shapes = np.asarray(shapes)
+    radii = np.asarray(radii, dtype=np.float64)
+
+    keys, off_x, off_y = _shape_keys(x0, y0, x1, y1, shapes, radii)
+    first, inverse = _group_rows(keys)
+
+    sprites = []
+    for i in first:
+        shape = int(shapes[i])
+        if shape == SHAPE_ROUNDED:
+            # 圆角矩形用代表模块的局部浮点坐标绘制，取整结果与全局坐标一致
+            box = (x0[i] - off_x[i], y0[i] - off_y[i], x1[i] - off_x[i], y1[i] - off_y[i])
+        else:
+            box = tuple(int(v) for v in keys[i, 1:5])
+        sprites.append(cached_sprite(tuple(keys[i].tolist()), shape, box, float(radii[i])))
+    return sprites, inverse, off_x, off_y
+
+
+def select_groups(groups, index):
+    """从 shape_groups 的结果中取出 index 对应的模块"""
+    sprites, inverse, off_x, off_y = groups
+    return sprites, inverse[index], off_x[index], off_y[index]
+
+
+def rasterize(canvas_size, x0, y0, x1, y1, shapes, radii, labels=None, groups=None):
+    """
+    批量光栅化模块
+
+    参数:
+        canvas_size: 画布大小 (宽, 高)
+        x0, y0, x1, y1: 每个模块外接框的坐标数组
+        shapes: 每个模块的形状类型数组
+        radii: 每个模块的圆角半径数组
+        labels: 可选的每模块标签（正整数）。重叠时取较大的标签，
+                对应原逐个绘制时“后画的覆盖先画的”。
+        groups: 可选的这些模块的 shape_groups 结果，提供时不再重新分组
+
+    返回:
+        (高, 宽) 的标签数组，0 表示未绘制；未提供 labels 时为布尔数组。
+    """
+    width, height = canvas_size
+    if labels is None:
+        out_dtype = bool
+    else:
+        labels = np.asarray(labels)
+        out_dtype = np.uint8 if labels.max(initial=0) < 256 else np.int32
+    if len(x0) == 0:
+        return np.zeros((height, width), dtype=out_dtype)
+
+    if groups is None:
+        groups = shape_groups(x0, y0, x1, y1, shapes, radii)
+    sprites, inverse, off_x, off_y = groups
+
+    # 画布四周留出余量，盖印时无需逐个裁剪
+    pad = max(max(s.shape) for s in sprites) + 2
+    lo_x = min(0, int(off_x.min()))
+    lo_y = min(0, int(off_y.min()))
+    padded_w = max(width, int(off_x.max()) + pad) - lo_x
+    padded_h = max(height, int(off_y.max()) + pad) - lo_y
+    base = (off_y - lo_y) * padded_w + (off_x - lo_x)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(sprites) + 1))
+
+    if labels is None:
+        layers = [None]
+    else:
+        labels = labels.astype(out_dtype)
+        heights = np.array([sprite.shape[0] for sprite in sprites])[inverse]
+        layers = _label_layers(labels, off_y, heights)
+
+    canvas = None
+    for layer in layers:
+        plane = np.zeros(padded_h * padded_w, dtype=out_dtype)
+        for k, sprite in enumerate(sprites):
+            members = order[bounds[k]:bounds[k + 1]]
+            if layer is not None:
+                members = members[layer[members]]
+            if len(members) == 0:
+                continue
+            sy, sx = np.nonzero(sprite)
+            rel = sy * padded_w + sx
+            idx = (base[members][:, None] + rel[None, :]).ravel()
+            if labels is None:
+                plane[idx] = True
+            else:
+                plane[idx] = np.repeat(labels[members], len(rel))
+        canvas = plane if canvas is None else np.maximum(canvas, plane)
+
+    canvas = canvas.reshape(padded_h, padded_w)
+    return canvas[-lo_y:-lo_y + height, -lo_x:-lo_x + width]
+
+
+def _label_layers(labels, off_y, heights):
+    """
+    把模块按标签分层，使同一层内不同标签的模块互不重叠
+
+    同一层内直接赋值即可（重复写入的值相同），各层之间取最大值，
+    等价于按标签顺序逐个绘制。标签通常是行号，相邻行才会重叠，
+    一般分为两层。
+    """
+    values = np.unique(labels)
+    top = np.full(len(values), np.iinfo(np.int64).max)
+    bottom = np.full(len(values), np.iinfo(np.int64).min)
+    rank = np.searchsorted(values, labels)
+    np.minimum.at(top, rank, off_y)
+    np.maximum.at(bottom, rank, off_y + heights)
+
+    passes = 1
+    while passes < len(values) and (top[passes:] < bottom[:-passes]).any():
+        passes += 1
+    return [rank % passes == k for k in range(passes)]
+
+
+def rasterize_rows(canvas_size, row_start, row_stop, x0, y0, x1, y1, shapes, radii, labels=None):
+    """
+    只光栅化画布中 [row_start, row_stop) 的行，结果与 rasterize 整张画布后截取这些行一致
+
+    只处理与这些行相交的模块。坐标整体平移一个偶数（且平移后仍非负），
+    精灵图的取整结果不变，所以每个模块的形状与整张绘制时相同。
+    """
+    width = canvas_size[0]
+    x0, y0, x1, y1, radii = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1, radii))
+    shapes = np.asarray(shapes)
+    # 模块覆盖的像素行在 [y0 - 1, y1 + 1] 以内，这里再多留一行余量
+    selected = (y1 + 2 >= row_start) & (y0 - 2 < row_stop)
+    dtype = bool if labels is None else (np.uint8 if np.max(labels, initial=0) < 256 else np.int32)
+    if not selected.any():
+        return np.zeros((row_stop - row_start, width), dtype=dtype)
+
+    shift = max(0, int(np.floor(min(row_start, y0[selected].min()))) // 2 * 2)
+    mask = rasterize(
+        (width, row_stop - shift),
+        x0[selected], y0[selected] - shift, x1[selected], y1[selected] - shift,
+        shapes[selected], radii[selected],
+        labels=None if labels is None else np.asarray(labels)[selected],
+    )
+    return mask[row_start - shift:].astype(dtype, copy=False)
+
+
+def compose(mask, color, background, palette=None):
+    """
+    根据掩码合成 RGBA 图像
+
+    参数:
+        mask: rasterize 返回的布尔数组或标签数组
+        color: 前景 RGBA 颜色（使用 palette 时忽略）
+        background: 背景 RGBA 颜色
+        palette: 可选的 (N, 4) 颜色表，标签 k 使用 palette[k - 1]
+    """
+    if palette is None:
+        palette = [color]
+    table = [tuple(background)] + [tuple(c) for c in palette]
+    if len(table) <= 256:
+        # 用调色板图像转换，由 PIL 完成查表
+        indexed = Image.fromarray(np.ascontiguousarray(mask, dtype=np.uint8), "P")
+        indexed.putpalette([v for c in table for v in c], "RGBA")
+        return indexed.convert("RGBA")
+    pixels = np.asarray(table, dtype=np.uint8)[mask]
+    return Image.fromarray(pixels, "RGBA")
+
+
+def interpolate_stops(t, stops):
+    """
+    按渐变色标插值颜色
+
+    参数:
+        t: [0, 1] 范围内的浮点数组（位置）
+        stops: 按位置排序的 [(位置, (r, g, b)), ...]
+
+    返回:
+        形状为 t.shape + (3,) 的 uint8 数组。取整方式与原有逐模块计算的
+        int(start * (1 - ratio) + end * ratio) 相同（向零截断）。
+    """
+    t = np.clip(np.asarray(t, dtype=np.float64), 0.0, 1.0)
+    positions = np.array([p for p, _ in stops], dtype=np.float64)
+    colors = np.array([c for _, c in stops], dtype=np.float64)
+    if len(stops) == 1:
+        return np.broadcast_to(colors[0].astype(np.uint8), t.shape + (3,)).copy()
+
+    seg = np.clip(np.searchsorted(positions, t, side="right") - 1, 0, len(stops) - 2)
+    p0 = positions[seg]
+    width = positions[seg + 1] - p0
+    ratio = np.divide(t - p0, width, out=np.zeros_like(t), where=width > 0)[..., None]
+    mixed = colors[seg] * (1 - ratio) + colors[seg + 1] * ratio
+    return mixed.astype(np.uint8)
+
+
+def gradient_field(kind, width, height, stops, levels=1024, rows=None):
+    """
+    计算 (高, 宽) 区域的渐变颜色场
+
+    kind 为 "horizontal"、"vertical"、"diagonal" 或 "radial"。
+    每个像素先换算为位置 t，再取色：水平/垂直渐变按列/行计算后广播，
+    对角线渐变的位置只取决于整数坐标之和，用精确查找表；径向渐变把距离
+    量化为 levels 级后查表。
+    rows 为 (起始行, 结束行) 时只计算这些行（分块渲染），数值与整块计算相同。
+    返回值可广播到 (行数, 宽, 3)。
+    """
+    xs = np.arange(width)
+    ys = np.arange(*rows) if rows is not None else np.arange(height)
+    if kind == "horizontal":
+        return interpolate_stops(xs / max(width - 1, 1), stops)[None, :, :]
+    if kind == "vertical":
+        return interpolate_stops(ys / max(height - 1, 1), stops)[:, None, :]
+    if kind == "diagonal":
+        span = max(width + height - 2, 1)
+        lut = interpolate_stops(np.arange(width + height - 1) / span, stops)
+        return lut[ys[:, None] + xs[None, :]]
+    if kind == "radial":
+        cx = (width - 1) / 2
+        cy = (height - 1) / 2
+        dx = ((xs - cx) / max(cx, 1)).astype(np.float32) ** 2
+        dy = ((ys - cy) / max(cy, 1)).astype(np.float32) ** 2
+        # 归一化到内切圆半径，角落处超过 1 的部分取末端颜色
+        t = np.sqrt(dy[:, None] + dx[None, :])
+        lut = interpolate_stops(np.arange(levels) / (levels - 1), stops)
+        return lut[np.minimum(t * (levels - 1), levels - 1).astype(np.intp)]
+    raise ValueError(f"不支持的渐变类型: {kind}")
+
+
+def compose_field(mask, field, background, box=None):
+    """
+    通过掩码把颜色场合成到背景上，生成 RGBA 图像
+
+    参数:
+        mask: (高, 宽) 掩码，非零处使用颜色场
+        field: 可广播到 box 区域 (h, w, 3) 的 uint8 颜色场
+        background: 背景 RGBA 颜色
+        box: 颜色场覆盖的区域 (x0, y0, x1, y1)，需包含全部掩码像素，默认整张画布
+    """
+    height, width = mask.shape
+    x0, y0, x1, y1 = box if box is not None else (0, 0, width, height)
+    # 每个 RGBA 像素按一个 uint32 处理，掩码复制时一次移动整个像素
+    pixels = np.full((height, width), np.array(background, dtype=np.uint8).view(np.uint32)[0], dtype=np.uint32)
+    region = pixels[y0:y1, x0:x1]
+    colors = np.empty(region.shape + (4,), dtype=np.uint8)
+    colors[..., :3] = field
+    colors[..., 3] = 255
+    np.copyto(region, colors.view(np.uint32)[..., 0], where=mask[y0:y1, x0:x1] != 0)
+    return Image.fromarray(pixels.view(np.uint8).reshape(height, width, 4), "RGBA")
+
+
+class RasterPlan:
+    """
+    一次光栅化所需的全部几何与颜色信息
+
+    render() 生成整张 RGBA 图片；render_rows() / index_rows() 只生成其中若干行，
+    供大尺寸输出分块渲染，结果与整张渲染逐像素一致。
+
+    参数:
+        canvas_size: 画布大小 (宽, 高)
+        x0, y0, x1, y1, shapes, radii, labels: 同 rasterize
+        background: 背景 RGBA 颜色
+        color: 前景 RGBA 颜色（单色时）
+        palette: 标签对应的颜色表（同 compose）
+        field: 渐变颜色场 (类型, 色标, 区域)，提供时忽略 color/palette
+        groups: 可选的预先计算的 shape_groups 结果（整张渲染时使用）
+        field_colors: 可选的预先计算的颜色场（整张渲染时使用）
+    """
+
+    def __init__(self, canvas_size, x0, y0, x1, y1, shapes, radii, background,
+                 color=None, palette=None, labels=None, field=None, groups=None, field_colors=None):
+        self.canvas_size = canvas_size
+        self.boxes = (x0, y0, x1, y1)
+        self.shapes = shapes
+        self.radii = radii
+        self.labels = labels
+        self.background = tuple(background)
+        self.color = color
+        self.palette = palette
+        self.field = field
+        self.groups = groups
+        self.field_colors = field_colors
+
+    def render(self):
+        """渲染整张图片"""
+        mask = rasterize(self.canvas_size, *self.boxes, self.shapes, self.radii, labels=self.labels,
+                         groups=self.groups)
+        if self.field is None:
+            return compose(mask, self.color, self.background, palette=self.palette)
+        kind, stops, box = self.field
+        x0, y0, x1, y1 = box
+        colors = self.field_colors
+        if colors is None:
+            colors = gradient_field(kind, x1 - x0, y1 - y0, stops)
+        return compose_field(mask, colors, self.background, box=box)
+
+    def _mask_rows(self, row_start, row_stop):
+        return rasterize_rows(self.canvas_size, row_start, row_stop, *self.boxes,
+                              self.shapes, self.radii, labels=self.labels)
+
+    def render_rows(self, row_start, row_stop):
+        """渲染 [row_start, row_stop) 行，返回 RGBA 图片"""
+        mask = self._mask_rows(row_start, row_stop)
+        if self.field is None:
+            return compose(mask, self.color, self.background, palette=self.palette)
+        kind, stops, (x0, y0, x1, y1) = self.field
+        top = min(max(y0, row_start), row_stop)
+        bottom = max(min(y1, row_stop), top)
+        field = gradient_field(kind, x1 - x0, y1 - y0, stops, rows=(top - y0, bottom - y0))
+        return compose_field(mask, field, self.background, box=(x0, top - row_start, x1, bottom - row_start))
+
+    def index_table(self):
+        """
+        调色板输出的颜色表：[背景, 标签 1 的颜色, ...]
+
+        颜色场或颜色超过 256 种时返回 None。
+        """
+        if self.field is not None:
+            return None
+        table = [self.background] + [tuple(c) for c in (self.palette or [self.color])]
+        return table if len(table) <= 256 else None
+
+    def index_rows(self, row_start, row_stop):
+        """[row_start, row_stop) 行在 index_table() 中的颜色下标"""
+        return self._mask_rows(row_start, row_stop).astype(np.uint8)
+
+    def opaque(self):
+        """输出是否不含透明像素"""
+        if self.background[3] != 255:
+            return False
+        if self.field is not None:
+            return True
+        return all(c[3] == 255 for c in (self.palette or [self.color]))
+
+
+class PlanTemplate:
+    """
+    同一画布和样式下覆盖全部模块位置的光栅化计划
+
+    由包含矩阵中每个模块（按行优先顺序）的 RasterPlan 构造，预先完成形状分组，
+    可选地预先计算渐变颜色场。select(matrix) 只取出深色模块，得到的计划与直接
+    按矩阵构造的计划渲染结果逐像素一致，不同内容的二维码可以共用一个模板。
+
+    参数:
+        plan: 覆盖全部模块的 RasterPlan
+        cache_field: 是否预先计算颜色场（只在整张渲染时使用）
+    """
+
+    def __init__(self, plan, cache_field=True):
+        self.plan = plan
+        self.groups = shape_groups(*plan.boxes, plan.shapes, plan.radii)
+        self.field_colors = None
+        if plan.field is not None and cache_field:
+            kind, stops, (x0, y0, x1, y1) = plan.field
+            self.field_colors = gradient_field(kind, x1 - x0, y1 - y0, stops)
+
+    def select(self, matrix):
+        """matrix 中深色模块的光栅化计划"""
+        index = np.flatnonzero(matrix)
+        plan = self.plan
+        x0, y0, x1, y1 = plan.boxes
+        labels = None if plan.labels is None else plan.labels[index]
+        return RasterPlan(plan.canvas_size, x0[index], y0[index], x1[index], y1[index],
+                          plan.shapes[index], plan.radii[index], plan.background,
+                          color=plan.color, palette=plan.palette, labels=labels, field=plan.field,
+                          groups=select_groups(self.groups, index), field_colors=self.field_colors)
+
+    @property
+    def nbytes(self):
+        """模板占用的字节数（近似值）"""
+        plan = self.plan
+        arrays = list(plan.boxes) + [plan.shapes, plan.radii] + list(self.groups[1:])
+        if plan.labels is not None:
+            arrays.append(plan.labels)
+        if self.field_colors is not None:
+            arrays.append(self.field_colors)
+        return sum(np.asarray(a).nbytes for a in arrays) + sum(s.nbytes for s in self.groups[0])
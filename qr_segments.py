@@ -0,0 +1,135 @@
+"""
+数据分段与最小版本选择
+
+qrcode 库的 add_data 只把连续 20 个以上的数字或字母数字字符单独分段，其余都按
+字节模式编码。这里按实际比特数用动态规划求最优分段：数字模式每 3 位 10 比特、
+字母数字模式每 2 个字符 11 比特、字节模式每个 UTF-8 字节 8 比特，每段另加 4 比特
+模式指示符和字符计数（位宽随版本分三档）。再按 qrcode.util.BIT_LIMIT_TABLE
+（各版本、各纠错等级的数据比特容量）选出能容纳的最小版本。
+
+http/https 链接的协议和主机名不区分大小写，转为大写后可以用字母数字模式编码，
+只在确实能减小版本或比特数时转换。
+"""
+import os
+import re
+
+import qrcode.util
+from qrcode.exceptions import DataOverflowError
+
+MODE_NUMBER = qrcode.util.MODE_NUMBER
+MODE_ALPHA_NUM = qrcode.util.MODE_ALPHA_NUM
+MODE_8BIT_BYTE = qrcode.util.MODE_8BIT_BYTE
+MODES = (MODE_8BIT_BYTE, MODE_ALPHA_NUM, MODE_NUMBER)
+
+# 字符计数位宽按版本分三档，每档取第一个版本计算
+VERSION_CLASSES = ((1, 9), (10, 26), (27, 40))
+
+# 是否把链接的协议和主机名转为大写
+UPPERCASE_URL_HOST = os.environ.get("QR_UPPERCASE_URL_HOST", "1") != "0"
+
+_ALPHANUMERIC = frozenset(qrcode.util.ALPHA_NUM.decode("ascii"))
+_URL_HOST = re.compile(r"(?i)https?://[a-z0-9.-]+(?::[0-9]+)?(?=[/?#]|$)")
+
+
+def _data_bits(mode, count):
+    """count 个字符（字节模式为字节数）的数据比特数"""
+    if mode == MODE_NUMBER:
+        return count // 3 * 10 + (0, 4, 7)[count % 3]
+    if mode == MODE_ALPHA_NUM:
+        return count // 2 * 11 + count % 2 * 6
+    return count * 8
+
+
+def segment_bits(segments, version):
+    """分段编码后的总比特数（不含结束符和填充）"""
+    sizes = qrcode.util.mode_sizes_for_version(version)
+    total = 0
+    for mode, text in segments:
+        count = len(text.encode("utf-8")) if mode == MODE_8BIT_BYTE else len(text)
+        total += 4 + sizes[mode] + _data_bits(mode, count)
+    return total
+
+
+def optimal_segments(data, version):
+    """
+    在 version 所在档位的字符计数位宽下，总比特数最少的分段
+
+    动态规划以 1/6 比特为单位，状态是处理完第 i 个字符时所在的模式；
+    换段时当前段的比特数向上取整再加上新段的头部。
+
+    返回 [(模式, 文本), ...]
+    """
+    if not data:
+        return [(MODE_8BIT_BYTE, "")]
+    sizes = qrcode.util.mode_sizes_for_version(version)
+    head = [(4 + sizes[mode]) * 6 for mode in MODES]
+    costs = list(head)
+    # choices[i][j]：处理完字符 i 且处于模式 j 时，字符 i 所用的模式下标
+    choices = []
+    for ch in data:
+        current = [costs[0] + len(ch.encode("utf-8")) * 48, None, None]
+        chosen = [0, None, None]
+        if ch in _ALPHANUMERIC:
+            current[1] = costs[1] + 33
+            chosen[1] = 1
+            if "0" <= ch <= "9":
+                current[2] = costs[2] + 20
+                chosen[2] = 2
+        # 在该字符之后切换到新模式
+        for to in range(3):
+            for src in range(3):
+                if chosen[src] is None:
+                    continue
+                cost = (current[src] + 5) // 6 * 6 + head[to]
+                if chosen[to] is None or cost < current[to]:
+                    current[to] = cost
+                    chosen[to] = chosen[src]
+        choices.append(chosen)
+        costs = current
+
+    state = min(range(3), key=lambda j: costs[j])
+    modes = []
+    for chosen in reversed(choices):
+        state = chosen[state]
+        modes.append(MODES[state])
+    modes.reverse()
+
+    segments = []
+    start = 0
+    for i in range(1, len(data) + 1):
+        if i == len(data) or modes[i] != modes[start]:
+            segments.append((modes[start], data[start:i]))
+            start = i
+    return segments
+
+
+def _fit(data, error_correction, min_version):
+    limits = qrcode.util.BIT_LIMIT_TABLE[error_correction]
+    for first, last in VERSION_CLASSES:
+        if last < min_version:
+            continue
+        segments = optimal_segments(data, first)
+        bits = segment_bits(segments, first)
+        for version in range(max(first, min_version), last + 1):
+            if bits <= limits[version]:
+                return version, bits, segments
+    raise DataOverflowError(f"数据过长，超出版本 40 的容量: {len(data)} 个字符")
+
+
+def fit(data, error_correction, min_version=1):
+    """
+    选择编码内容、分段和最小版本
+
+    返回:
+        (版本, 分段)；分段中的文本连起来就是实际编码的内容
+        （链接的协议和主机名可能已转为大写）
+    """
+    version, bits, segments = _fit(data, error_correction, min_version)
+    if UPPERCASE_URL_HOST:
+        match = _URL_HOST.match(data)
+        if match and not match.group().isupper():
+            upper = match.group().upper() + data[match.end():]
+            candidate = _fit(upper, error_correction, min_version)
+            if candidate[:2] < (version, bits):
+                version, bits, segments = candidate
+    return version, segments
@@ -0,0 +1,323 @@
+"""
+大尺寸输出的分块渲染
+
+印刷用的二维码常常要 6000–12000 像素见方，整张 RGBA 画布加上光栅化和编码时的
+临时数组要占用数 GB 内存。这里把 qr_raster.RasterPlan 按水平条带逐段渲染，
+每段渲染完立即写入流式的 PNG 或 TIFF 编码器，内存峰值只取决于条带大小，
+与输出尺寸无关。条带渲染与整张渲染逐像素一致（见 qr_raster.rasterize_rows）。
+
+不含 Logo 的单色和逐行渐变图直接输出调色板下标，两色图按 1 位深度打包。
+"""
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import qr_encode
+
+# 输出像素数超过该值时自动分块渲染（PNG/TIFF）
+TILE_PIXELS = int(os.environ.get("QR_TILE_PIXELS", 25_000_000))
+# 每个条带的内存预算（按 RGBA 计算）
+TILE_MEMORY = int(os.environ.get("QR_TILE_MEMORY_MB", 8)) * 1024 * 1024
+
+TILED_FORMATS = ("PNG", "TIFF")
+
+
+def should_tile(tiled, img_size, image_format):
+    """
+    是否分块渲染
+
+    tiled 为 True/False 时按指定执行（True 但格式不支持时报错），
+    为 None 时对超过 TILE_PIXELS 的 PNG/TIFF 输出自动启用。
+    """
+    if tiled is None:
+        return image_format in TILED_FORMATS and img_size[0] * img_size[1] > TILE_PIXELS
+    if tiled and image_format not in TILED_FORMATS:
+        raise ValueError(f"分块渲染只支持 {', '.join(TILED_FORMATS)} 格式: {image_format}")
+    return bool(tiled)
+
+
+def strip_rows(width, memory=None):
+    """条带行数：不超过内存预算的最大偶数（偶数行保证条带的起点是偶数）"""
+    rows = (memory or TILE_MEMORY) // (max(width, 1) * 4)
+    return max(2, rows // 2 * 2)
+
+
+def _bit_depth(colors):
+    for depth in (1, 2, 4):
+        if colors <= 1 << depth:
+            return depth
+    return 8
+
+
+def _pack_rows(indices, depth):
+    """把每像素一个字节的下标按 depth 位打包（行尾补零）"""
+    if depth == 8:
+        return indices
+    if depth == 1:
+        return np.packbits(indices, axis=1)
+    per_byte = 8 // depth
+    height, width = indices.shape
+    padded = np.zeros((height, -(-width // per_byte) * per_byte), dtype=np.uint8)
+    padded[:, :width] = indices
+    groups = padded.reshape(height, -1, per_byte)
+    packed = np.zeros(groups.shape[:2], dtype=np.uint8)
+    for i in range(per_byte):
+        packed |= groups[:, :, i] << (8 - depth * (i + 1))
+    return packed
+
+
+class PngStreamWriter:
+    """
+    逐行写入的 PNG 编码器
+
+    参数:
+        fileobj: 可写的二进制文件对象
+        width, height: 图片尺寸
+        channels: 3 (RGB)、4 (RGBA)，或 1 表示调色板下标
+        palette: 调色板 RGBA 颜色列表（channels 为 1 时）
+        compress_level: zlib 压缩级别
+    """
+
+    def __init__(self, fileobj, width, height, channels, palette=None, compress_level=6):
+        self.fileobj = fileobj
+        self.channels = channels
+        self.depth = _bit_depth(len(palette)) if palette else 8
+        self.rows_left = height
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+        self._previous = None
+
+        color_type = {1: 3, 3: 2, 4: 6}[channels]
+        fileobj.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, self.depth, color_type, 0, 0, 0))
+        if palette:
+            self._chunk(b"PLTE", bytes(v for c in palette for v in c[:3]))
+            alphas = bytes(c[3] for c in palette)
+            if alphas.rstrip(b"\xff"):
+                self._chunk(b"tRNS", alphas.rstrip(b"\xff"))
+
+    def _chunk(self, tag, data):
+        self.fileobj.write(struct.pack(">I", len(data)) + tag + data)
+        self.fileobj.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)) & 0xFFFFFFFF))
+
+    def _filter(self, rows):
+        """
+        逐行选择过滤方式，返回带过滤类型字节的数据
+
+        RGB/RGBA 在 None、Sub、Up 中选择非零字节最少的一种：二维码图片大部分是
+        纯色块，零字节越多 zlib 越容易压缩，这比规范推荐的绝对值求和便宜得多。
+        调色板图按规范不做过滤。
+        """
+        height = len(rows)
+        if self.channels == 1:
+            return np.hstack([np.zeros((height, 1), dtype=np.uint8), rows])
+        bpp = self.channels
+        previous = self._previous if self._previous is not None else np.zeros(rows.shape[1], dtype=np.uint8)
+        above = np.vstack([previous[None], rows[:-1]])
+        sub = rows.copy()
+        sub[:, bpp:] -= rows[:, :-bpp]
+        up = rows - above
+        self._previous = rows[-1].copy()
+
+        # 代价只在每 7 个字节取 1 个上估计，足以区分纯色行、重复行和渐变行
+        choice = np.stack([np.count_nonzero(f[:, ::7], axis=1) for f in (rows, sub, up)]).argmin(axis=0)
+        out = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+        out[:, 0] = choice
+        out[:, 1:] = up
+        for code, filtered in ((0, rows), (1, sub)):
+            selected = choice == code
+            if selected.any():
+                out[selected, 1:] = filtered[selected]
+        return out
+
+    def write_rows(self, rows):
+        """
+        写入若干行
+
+        rows 为 (行数, 宽) 的调色板下标，或 (行数, 宽, channels) 的 uint8 像素。
+        """
+        rows = np.ascontiguousarray(rows, dtype=np.uint8)
+        height = len(rows)
+        if self.channels == 1:
+            rows = _pack_rows(rows, self.depth)
+        else:
+            rows = rows.reshape(height, -1)
+        self.rows_left -= height
+        self._write_idat(self._compressor.compress(self._filter(rows).tobytes()))
+
+    def _write_idat(self, data, final=False):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending and (final or self._pending_size >= 1 << 20):
+            self._chunk(b"IDAT", b"".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def close(self):
+        if self.rows_left:
+            raise ValueError(f"PNG 还缺少 {self.rows_left} 行")
+        self._write_idat(self._compressor.flush(), final=True)
+        self._chunk(b"IEND", b"")
+
+
+class TiffStreamWriter:
+    """
+    逐条带写入的 TIFF 编码器（Deflate 压缩，小端）
+
+    像素数据按条带依次写出，目录 (IFD) 写在文件末尾，最后回写文件头中的目录偏移，
+    因此要求 fileobj 可以 seek。参数同 PngStreamWriter；调色板含透明色时
+    按 RGBA 写出（TIFF 调色板不支持透明度）。
+    """
+
+    def __init__(self, fileobj, width, height, channels, palette=None, compress_level=6):
+        if not fileobj.seekable():
+            raise ValueError("TIFF 分块输出需要可 seek 的文件")
+        self.fileobj = fileobj
+        self.width = width
+        self.height = height
+        self.palette = None
+        self.channels = channels
+        if palette:
+            if all(c[3] == 255 for c in palette):
+                self.palette = palette
+            else:
+                self._lookup = np.array([tuple(c) for c in palette], dtype=np.uint8)
+                self.channels = 4
+        self.compress_level = compress_level
+        self.rows_per_strip = None
+        self.strips = []
+        self._start = fileobj.tell()
+        fileobj.write(b"II*\x00\x00\x00\x00\x00")
+
+    def write_rows(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=np.uint8)
+        if rows.ndim == 2 and self.channels != 1:
+            rows = self._lookup[rows]
+        # TIFF 要求除最后一个条带外每个条带行数相同
+        if self.rows_per_strip is None:
+            self.rows_per_strip = len(rows)
+        elif self.strips and self._last_rows != self.rows_per_strip:
+            raise ValueError("只有最后一个条带的行数可以不同")
+        self._last_rows = len(rows)
+        data = zlib.compress(rows.tobytes(), self.compress_level)
+        offset = self._tell()
+        self.fileobj.write(data)
+        if len(data) % 2:
+            self.fileobj.write(b"\x00")
+        self.strips.append((offset, len(data)))
+
+    def _tell(self):
+        return self.fileobj.tell() - self._start
+
+    def close(self):
+        if not self.strips:
+            raise ValueError("TIFF 没有写入任何数据")
+        samples = 1 if self.palette else self.channels
+        entries = [
+            (256, 4, [self.width]),                     # ImageWidth
+            (257, 4, [self.height]),                    # ImageLength
+            (258, 3, [8] * samples),                    # BitsPerSample
+            (259, 3, [8]),                              # Compression = Deflate
+            (262, 3, [3 if self.palette else 2]),       # Photometric: 调色板 / RGB
+            (273, 4, [offset for offset, _ in self.strips]),  # StripOffsets
+            (277, 3, [samples]),                        # SamplesPerPixel
+            (278, 4, [self.rows_per_strip]),            # RowsPerStrip
+            (279, 4, [size for _, size in self.strips]),      # StripByteCounts
+            (284, 3, [1]),                              # PlanarConfiguration = 连续
+        ]
+        if self.palette:
+            # ColorMap：依次为 256 个 R、G、B，16 位
+            table = list(self.palette) + [(0, 0, 0, 255)] * (256 - len(self.palette))
+            entries.append((320, 3, [c[i] * 257 for i in range(3) for c in table]))
+        if samples == 4:
+            entries.append((338, 3, [2]))               # ExtraSamples = 非预乘 Alpha
+
+        # 超过 4 字节的值放在目录之后
+        ifd_offset = self._tell()
+        extra_offset = ifd_offset + 2 + len(entries) * 12 + 4
+        directory = [struct.pack("<H", len(entries))]
+        extra = []
+        for tag, kind, values in entries:
+            fmt = "<%d%s" % (len(values), "H" if kind == 3 else "I")
+            data = struct.pack(fmt, *values)
+            if len(data) <= 4:
+                directory.append(struct.pack("<HHI", tag, kind, len(values)) + data.ljust(4, b"\x00"))
+            else:
+                directory.append(struct.pack("<HHII", tag, kind, len(values), extra_offset))
+                extra.append(data)
+                extra_offset += len(data)
+        directory.append(b"\x00\x00\x00\x00")
+        self.fileobj.write(b"".join(directory + extra))
+
+        end = self.fileobj.tell()
+        self.fileobj.seek(self._start + 4)
+        self.fileobj.write(struct.pack("<I", ifd_offset))
+        self.fileobj.seek(end)
+
+
+WRITERS = {"PNG": PngStreamWriter, "TIFF": TiffStreamWriter}
+
+
+def _logo_opaque(overlay):
+    if overlay is None:
+        return True
+    logo = overlay[0]
+    return logo.mode != "RGBA" or logo.getchannel("A").getextrema()[0] == 255
+
+
+def write_tiled(plan, output_file, image_format="PNG", overlay=None, preset=None, memory=None):
+    """
+    分块渲染 plan 并流式写入 output_file
+
+    参数:
+        plan: qr_raster.RasterPlan
+        output_file: 文件路径或二进制文件对象
+        image_format: "PNG" 或 "TIFF"
+        overlay: 可选的 (Logo 图片, 位置, 蒙版)，与 Image.paste 的参数相同
+        preset: 编码预设，只使用其中的压缩级别
+        memory: 每个条带的内存预算（字节），默认 QR_TILE_MEMORY_MB
+    """
+    if isinstance(output_file, str):
+        with open(output_file, "wb") as f:
+            write_tiled(plan, f, image_format, overlay, preset, memory)
+        return output_file
+
+    image_format = image_format.upper()
+    width, height = plan.canvas_size
+    rows = strip_rows(width, memory)
+    table = plan.index_table() if overlay is None else None
+    if table is not None:
+        channels = 1
+    else:
+        channels = 3 if plan.opaque() and _logo_opaque(overlay) else 4
+    compress_level = qr_encode.ENCODE_PRESETS[preset or qr_encode.DEFAULT_PRESET]["compress_level"]
+
+    writer = WRITERS[image_format](output_file, width, height, channels, palette=table,
+                                   compress_level=compress_level)
+    for top in range(0, height, rows):
+        bottom = min(height, top + rows)
+        if table is not None:
+            writer.write_rows(plan.index_rows(top, bottom))
+            continue
+        strip = plan.render_rows(top, bottom)
+        if overlay is not None:
+            _paste_rows(strip, overlay, top)
+        pixels = np.asarray(strip)
+        writer.write_rows(pixels[..., :3] if channels == 3 else pixels)
+    writer.close()
+    return output_file
+
+
+def _paste_rows(strip, overlay, top):
+    """把 Logo 与条带相交的部分粘贴到条带上（粘贴是逐像素运算，分段结果与整体粘贴相同）"""
+    logo, (x, y), mask = overlay
+    first = max(y, top)
+    last = min(y + logo.size[1], top + strip.size[1])
+    if first >= last:
+        return
+    box = (0, first - y, logo.size[0], last - y)
+    strip.paste(logo.crop(box), (x, first - top), mask.crop(box))
@@ -0,0 +1,301 @@
+"""
+渲染结果的可扫描性自检
+
+圆点样式、渐变色、低对比度配色和居中 Logo 都会让部分模块在扫描时被读错。
+这里在渲染结果中按模块中心取样，与原始矩阵逐模块比较，再把读错的模块映射到
+码字和 Reed-Solomon 块：只要每个块中出错的码字数不超过该块的纠错能力，
+就能正确解码。自检报告给出模块错误率和纠错预算的占用比例（最差的块），
+占用超过阈值、定位图形或格式信息被破坏、对比度不足时视为不安全。
+
+取样只读取 (边长 x 边长) 个像素，其余全部是数组运算，350 像素的图片约 0.5 毫秒、
+1500 像素约 3 毫秒，可以对每个生产请求开启：
+
+- off：不检查
+- report：只记录结果（日志和指标）
+- reject：不安全时抛出 UnscannableRender
+- adjust：不安全时逐步缩小 Logo 直至去掉 Logo，仍不安全时抛出 UnscannableRender
+"""
+import functools
+import os
+
+import numpy as np
+import qrcode
+import qrcode.base
+
+from qr_matrix import ROLE_FINDER, ROLE_FORMAT, ROLE_VERSION, module_roles, symbol_version
+
+VERIFY_MODES = ("off", "report", "reject", "adjust")
+
+# 默认模式
+DEFAULT_MODE = os.environ.get("QR_VERIFY", "off")
+# 纠错预算占用（出错码字数 / 可纠正码字数，取最差的块）的上限，
+# 留出余量给打印、反光和对焦带来的额外错误；默认尺寸的 Logo（符号边长的 1/5，
+# 见 qr_generator._logo_overlay）在 H 级下的占用不超过该值
+MAX_USAGE = float(os.environ.get("QR_VERIFY_MAX_USAGE", "0.5"))
+# 深浅模块的最低亮度差（占满量程的比例），相当于 ISO/IEC 15415 的最低符号反差
+MIN_CONTRAST = float(os.environ.get("QR_VERIFY_MIN_CONTRAST", "0.2"))
+# adjust 模式下依次尝试的 Logo 缩放比例，最后一步去掉 Logo
+ADJUST_LOGO_SCALES = (0.8, 0.6, 0.4)
+
+# 版本 1–3 的部分纠错码字用于防止误译码，不计入纠错能力（ISO/IEC 18004 表 9）
+_MISDECODE_CODEWORDS = {
+    (1, qrcode.constants.ERROR_CORRECT_L): 3,
+    (1, qrcode.constants.ERROR_CORRECT_M): 2,
+    (1, qrcode.constants.ERROR_CORRECT_Q): 1,
+    (1, qrcode.constants.ERROR_CORRECT_H): 1,
+    (2, qrcode.constants.ERROR_CORRECT_L): 2,
+    (3, qrcode.constants.ERROR_CORRECT_L): 1,
+}
+
+
+class UnscannableRender(ValueError):
+    """渲染结果未通过可扫描性自检"""
+
+    def __init__(self, report):
+        super().__init__(f"渲染结果可能无法扫描: {report}")
+        self.report = report
+
+    def __reduce__(self):
+        # 进程池返回异常时按 report 重建
+        return type(self), (self.report,)
+
+
+def resolve_mode(mode=None):
+    mode = mode or DEFAULT_MODE
+    if mode not in VERIFY_MODES:
+        raise ValueError(f"不支持的自检模式: {mode}")
+    return mode
+
+
+@functools.lru_cache(maxsize=160)
+def codeword_layout(version, error_correction):
+    """
+    数据模块到码字、码字到 Reed-Solomon 块的映射
+
+    放置顺序与 qrcode 库的 map_data 相同（从右下角起两列一组蛇形移动），
+    码字在块间交错排列的顺序与 create_bytes 相同。
+
+    返回:
+        (codewords, blocks, capacity)：codewords 为 (边长, 边长) 数组，数据模块处是所属码字
+        在码流中的下标，其余为 -1；blocks[i] 是码字 i 所属的块；capacity[b] 是块 b
+        可纠正的码字数
+    """
+    roles = module_roles(version)
+    n = len(roles)
+    rs_blocks = qrcode.base.rs_blocks(version, error_correction)
+    total = sum(block.total_count for block in rs_blocks)
+
+    order = []
+    row, inc = n - 1, -1
+    for col in range(n - 1, 0, -2):
+        if col <= 6:
+            col -= 1
+        while 0 <= row < n:
+            for c in (col, col - 1):
+                if roles[row, c] == 0:
+                    order.append(row * n + c)
+            row += inc
+        row -= inc
+        inc = -inc
+    # 码字之后的剩余位不属于任何码字
+    codewords = np.full(n * n, -1, dtype=np.int32)
+    order = np.asarray(order[:total * 8])
+    codewords[order] = np.arange(len(order)) // 8
+
+    data_counts = [block.data_count for block in rs_blocks]
+    ec_counts = [block.total_count - block.data_count for block in rs_blocks]
+    blocks = []
+    for counts in (data_counts, ec_counts):
+        for i in range(max(counts)):
+            blocks.extend(b for b, count in enumerate(counts) if i < count)
+    misdecode = _MISDECODE_CODEWORDS.get((version, error_correction), 0)
+    capacity = np.array([(count - misdecode) // 2 for count in ec_counts])
+    return codewords.reshape(n, n), np.asarray(blocks), capacity
+
+
+def _sample_indices(centers, limit):
+    return np.clip(np.floor(centers).astype(np.intp), 0, limit - 1)
+
+
+def _paste_samples(pixels, overlay, xs, ys):
+    """在取样点上按 Image.paste(Logo, 位置, 蒙版) 的规则混合 Logo，结果与整张粘贴后取样相同"""
+    logo, (x, y), mask = overlay
+    width, height = logo.size
+    cols = (xs >= x) & (xs < x + width)
+    rows = (ys >= y) & (ys < y + height)
+    if not cols.any() or not rows.any():
+        return pixels
+    lx = xs[cols] - x
+    ly = ys[rows] - y
+    src = np.asarray(logo.convert("RGBA"))[np.ix_(ly, lx)].astype(np.uint32)
+    alpha = np.asarray(mask)[np.ix_(ly, lx)].astype(np.uint32)[..., None]
+    region = np.ix_(rows, cols)
+    dst = pixels[region].astype(np.uint32)
+    # Pillow 的 BLEND 宏：先 +128，再用 (t + (t >> 8)) >> 8 近似除以 255
+    tmp = src * alpha + dst * (255 - alpha) + 128
+    pixels[region] = ((tmp + (tmp >> 8)) >> 8).astype(np.uint8)
+    return pixels
+
+
+def sample_pixels(source, centers_x, centers_y, overlay=None):
+    """
+    取出每个模块中心处的 RGBA 像素
+
+    参数:
+        source: RGBA 图片，或分块渲染用的 qr_raster.RasterPlan（只渲染中心所在的行）
+        centers_x, centers_y: 模块中心坐标，见 qr_raster.module_centers
+        overlay: 尚未粘贴的 (Logo 图片, 位置, 蒙版)
+
+    返回:
+        (行数, 列数, 4) 的 uint8 数组
+    """
+    width, height = source.canvas_size if hasattr(source, "render_rows") else source.size
+    xs = _sample_indices(centers_x, width)
+    ys = _sample_indices(centers_y, height)
+    if hasattr(source, "render_rows"):
+        pixels = np.empty((len(ys), len(xs), 4), dtype=np.uint8)
+        for i, y in enumerate(ys):
+            # 条带起点必须是偶数，见 qr_raster.rasterize_rows
+            top = y - y % 2
+            pixels[i] = np.asarray(source.render_rows(top, top + 2))[y - top, xs]
+    else:
+        if source.mode != "RGBA":
+            source = source.convert("RGBA")
+        # 逐行裁剪，只复制中心所在的行
+        x0, x1 = int(xs[0]), int(xs[-1]) + 1
+        rows = b"".join(source.crop((x0, int(y), x1, int(y) + 1)).tobytes() for y in ys)
+        pixels = np.frombuffer(rows, dtype=np.uint8).reshape(len(ys), x1 - x0, 4)[:, xs - x0]
+    if overlay is not None:
+        pixels = _paste_samples(pixels, overlay, xs, ys)
+    return pixels
+
+
+def luminance(pixels):
+    """RGBA 像素叠加在白色背景上的亮度（0–255）"""
+    values = pixels.astype(np.float32)
+    lum = values[..., 0] * 0.299 + values[..., 1] * 0.587 + values[..., 2] * 0.114
+    alpha = values[..., 3] * (1 / 255)
+    return lum * alpha + 255 * (1 - alpha)
+
+
+class VerifyReport:
+    """
+    自检结果
+
+    属性:
+        version: 二维码版本
+        modules: 符号区域（不含边框）的模块数
+        module_errors: 读错的模块数
+        error_rate: 模块错误率
+        codeword_errors: 出错的码字数
+        usage: 纠错预算占用，最差的块中出错码字数与可纠正码字数之比，超过 1 无法解码
+        function_errors: 定位图形、格式信息和版本信息中读错的模块数
+        quiet_zone_errors: 边框中读成深色的模块数
+        contrast: 深浅模块的亮度差（中位数之差占满量程的比例）
+    """
+
+    __slots__ = ("version", "modules", "module_errors", "codeword_errors", "usage",
+                 "function_errors", "quiet_zone_errors", "contrast", "max_usage", "min_contrast")
+
+    def __init__(self, version, modules, module_errors, codeword_errors, usage, function_errors,
+                 quiet_zone_errors, contrast, max_usage=None, min_contrast=None):
+        self.version = version
+        self.modules = modules
+        self.module_errors = module_errors
+        self.codeword_errors = codeword_errors
+        self.usage = usage
+        self.function_errors = function_errors
+        self.quiet_zone_errors = quiet_zone_errors
+        self.contrast = contrast
+        self.max_usage = MAX_USAGE if max_usage is None else max_usage
+        self.min_contrast = MIN_CONTRAST if min_contrast is None else min_contrast
+
+    @property
+    def error_rate(self):
+        return self.module_errors / self.modules
+
+    @property
+    def safe(self):
+        return (self.contrast >= self.min_contrast and self.usage <= self.max_usage
+                and self.function_errors == 0 and self.quiet_zone_errors == 0)
+
+    def as_dict(self):
+        return {
+            "safe": self.safe,
+            "version": self.version,
+            "module_errors": self.module_errors,
+            "error_rate": round(self.error_rate, 4),
+            "codeword_errors": self.codeword_errors,
+            "usage": round(self.usage, 3),
+            "function_errors": self.function_errors,
+            "quiet_zone_errors": self.quiet_zone_errors,
+            "contrast": round(self.contrast, 3),
+        }
+
+    def __str__(self):
+        return (f"版本 {self.version}，模块错误 {self.module_errors}/{self.modules} ({self.error_rate:.1%})，"
+                f"纠错预算占用 {self.usage:.0%}（上限 {self.max_usage:.0%}），"
+                f"功能图形错误 {self.function_errors}，边框错误 {self.quiet_zone_errors}，"
+                f"对比度 {self.contrast:.0%}")
+
+
+def check(pixels, qr_matrix, border, error_correction=qrcode.constants.ERROR_CORRECT_H,
+          max_usage=None, min_contrast=None):
+    """
+    比较取样结果与原始矩阵
+
+    参数:
+        pixels: 模块中心处的 RGBA 像素，见 sample_pixels
+        qr_matrix: 带边框的布尔矩阵
+        border: 边框模块数
+        error_correction: 编码时使用的纠错等级
+
+    返回:
+        VerifyReport
+    """
+    expected = np.asarray(qr_matrix, dtype=bool)
+    lum = luminance(pixels)
+    size = len(expected) - 2 * border
+    version = symbol_version(size)
+    symbol = np.s_[border:border + size, border:border + size]
+
+    # 以深浅两类模块亮度中位数的中点为阈值，Logo 遮挡的少量模块不影响阈值
+    dark_level = float(np.median(lum[expected]))
+    light_level = float(np.median(lum[~expected]))
+    threshold = (dark_level + light_level) / 2
+    errors = (lum < threshold) != expected
+    # 深色比浅色还亮（反色）时所有模块都视为读错
+    if dark_level >= light_level:
+        errors[:] = True
+
+    quiet = errors.copy()
+    quiet[symbol] = False
+    symbol_errors = errors[symbol]
+    roles = module_roles(version)
+    critical = (roles == ROLE_FINDER) | (roles == ROLE_FORMAT) | (roles == ROLE_VERSION)
+
+    codewords, blocks, capacity = codeword_layout(version, error_correction)
+    bad = np.unique(codewords[symbol_errors])
+    bad = bad[bad >= 0]
+    per_block = np.bincount(blocks[bad], minlength=len(capacity))
+    usage = float((per_block / np.maximum(capacity, 1)).max()) if len(bad) else 0.0
+
+    return VerifyReport(
+        version=version,
+        modules=size * size,
+        module_errors=int(symbol_errors.sum()),
+        codeword_errors=int(len(bad)),
+        usage=usage,
+        function_errors=int((symbol_errors & critical).sum()),
+        quiet_zone_errors=int(quiet.sum()),
+        contrast=(light_level - dark_level) / 255,
+        max_usage=max_usage,
+        min_contrast=min_contrast,
+    )
+
+
+def verify(source, qr_matrix, border, centers, overlay=None,
+           error_correction=qrcode.constants.ERROR_CORRECT_H):
+    """取样并检查，centers 为 (centers_x, centers_y)"""
+    pixels = sample_pixels(source, *centers, overlay=overlay)
+    return check(pixels, qr_matrix, border, error_correction)
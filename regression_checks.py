@@ -0,0 +1,111 @@
+"""
+回归检查
+
+针对评审中发现过的问题逐条检查网页服务和渲染函数的行为（仓库没有单元测试，
+这里用 Flask 测试客户端和生成函数直接验证）。任何一项不符合预期时以退出码 1 结束。
+
+    python regression_checks.py
+    python regression_checks.py -k batch
+"""
+import argparse
+import io
+import sys
+
+from PIL import Image, ImageDraw
+
+import app
+import qr_generator
+import qr_logo
+import qr_verify
+from bench_qr import PAYLOADS
+
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+@check
+def batch_rejects_non_string_style_values():
+    """/batch 的 JSON 样式字段类型不对时返回 400，而不是在流式输出中途失败或返回 500"""
+    client = app.app.test_client()
+    bodies = [
+        {"items": ["a"], "style": {"fg_color": 123}},
+        {"items": ["a"], "style": {"format": ["png"]}},
+        {"items": ["a"], "style": {"bg_color": None}},
+        {"items": ["a"], "style": {"gradient_start": {"x": 1}, "style": "gradient"}},
+        {"items": ["a"], "style": {"format": "pdf", "template": 3}},
+        {"items": ["a"], "style": {"transparent": 1}},
+    ]
+    failures = []
+    for body in bodies:
+        status = client.post("/batch", json=body).status_code
+        if status != 400:
+            failures.append(f"{body['style']}: {status}")
+    response = client.post("/batch", json={"items": ["a"], "style": {"transparent": True, "fg_color": "#123456"}})
+    if response.status_code != 200:
+        failures.append(f"合法样式: {response.status_code}")
+    return failures
+
+
+def _sample_logo():
+    img = Image.new("RGB", (400, 400), "white")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((20, 20, 380, 380), fill="#E53935")
+    draw.rectangle((150, 120, 250, 280), fill="#1E88E5")
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return qr_logo.Logo.from_bytes(buffer.getvalue())
+
+
+@check
+def default_logo_passes_verify_and_oversized_logo_fails():
+    """默认尺寸的 Logo 在各样式、尺寸下通过可扫描性自检；短内容配边长为符号 40% 的 Logo 不通过"""
+    logo = _sample_logo()
+    failures = []
+    for name, data in PAYLOADS.items():
+        for style in ("rounded", "circle", "classic", "gradient"):
+            for size in (350, 1000):
+                spec = qr_generator.render_spec("gradient" if style == "gradient" else "styled",
+                                                logo_obj=logo, style=style, img_size=(size, size),
+                                                verify="reject")
+                try:
+                    spec.render(data, io.BytesIO())
+                except qr_verify.UnscannableRender as e:
+                    failures.append(f"{name} {style} {size}px 默认 Logo: {e.report}")
+
+        # 大版本的码字分散在许多块中，Logo 即使很大也可能不超出预算，只检查短内容
+        if len(data) >= 100:
+            continue
+        spec = qr_generator.RenderSpec("styled", style="rounded", logo=logo)
+        matrix = qr_generator.get_matrix(data, border=spec.border, version=1, error_correction=spec.error_correction)
+        layout = spec.layout(len(matrix), spec.border, spec.box_size)
+        image = layout.template.select(matrix).render()
+        image.paste(*qr_generator._logo_overlay(logo, layout.img_size, layout.symbol_size, 0, scale=2))
+        report = qr_verify.verify(image, matrix, spec.border, layout.centers, None, spec.error_correction)
+        if report.safe:
+            failures.append(f"{name} 过大的 Logo 仍通过自检: {report}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="运行回归检查")
+    parser.add_argument("-k", dest="pattern", default="", help="只运行名称包含该字符串的检查")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for fn in CHECKS:
+        if args.pattern not in fn.__name__:
+            continue
+        failures = fn()
+        print(f"{'失败' if failures else '通过'}  {fn.__name__}")
+        for failure in failures:
+            print(f"      {failure}")
+        failed += bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())